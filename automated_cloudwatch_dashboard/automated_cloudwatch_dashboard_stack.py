@@ -16,45 +16,99 @@
 
 from aws_cdk import (
     # Duration,
+    Annotations,
     Stack,
-    aws_cloudwatch as cloudwatch
+    aws_ssm as ssm
 )
 from constructs import Construct
 from omegaconf import OmegaConf
+from .clients import ClientFactory
+from .discovery import discover_inventory, fatal_failures, DiscoveryError
+from .fingerprint import fingerprint, parameter_name
+from .instrumentation import Instrumentation
+from .inventory import InventoryStore
+from .recording import Recorder, Replayer
+from .sharding import DashboardSharder
+from .widgets import dashboard_props, renderer, with_header
 import os
+import sys
 
 class AutomatedCloudWatchDashboardStack(Stack):
 
-    def import_class_from_string(self, path):
-        from importlib import import_module
-        module_path, _, class_name = path.rpartition('.')
-        mod = import_module(module_path)
-        klass = getattr(mod, class_name)
-        return klass
-
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
         
-        __region = kwargs['env'].region
-        __conf = OmegaConf.load("config.yaml")
-        SUPPORTED_SERVICES = ["EC2", "S3", "ELB", "AutoScaling","Outposts"]
+        env = kwargs.get('env')
+        __region = env.region if env is not None and env.region else os.getenv('CDK_DEFAULT_REGION')
+        __account = env.account if env is not None and env.account else os.getenv('CDK_DEFAULT_ACCOUNT')
+        # `cdk synth -c config=<path>` selects another configuration file
+        __conf = OmegaConf.load(self.node.try_get_context('config') or "config.yaml")
         
         dashboard_name = __conf.dashboard_name
         if(dashboard_name == ''): 
             dashboard_name = "Automated-CloudWatch-Dashboard"
-        dashboard = cloudwatch.Dashboard(self, "CWTAG",
-            dashboard_name= dashboard_name,
-            period_override=cloudwatch.PeriodOverride.AUTO,
-            start="-PT24H",
+        # the widgets are split in several dashboards when they exceed the budget
+        sharder = DashboardSharder.from_options(self, dashboard_name, OmegaConf.select(__conf, 'sharding', default=None),
+            dashboard_props=dashboard_props(),
+            preview_dir=OmegaConf.select(__conf, 'rendering.preview_dir', default=None)
         )
-        
-        for class_file in SUPPORTED_SERVICES:
-            class_file = class_file.replace('.py', '')
-            # load the class in services directory
-            klass = self.import_class_from_string(f'automated_cloudwatch_dashboard.services.{class_file}.{class_file}')
-            # instantiate the class
-            obj = klass(__region,__conf.tag_name, list(__conf.tag_values))
-            # add the widgets returned by get_widgets() method to the dashboard
-            for widget in obj.get_widgets() :
-                dashboard.add_widgets(widget)
-            
+
+        # shared boto3 session and clients, used by all the service modules
+        clients = ClientFactory.from_options(OmegaConf.select(__conf, 'clients', default=None))
+        # `cdk synth -c record=<path>` records the discovery calls in a fixture,
+        # `cdk synth -c replay=<path>` synthesizes from the fixture, offline
+        recorder = None
+        if self.node.try_get_context('replay'):
+            Replayer(self.node.try_get_context('replay')).install(clients)
+        elif self.node.try_get_context('record'):
+            recorder = Recorder(self.node.try_get_context('record')).install(clients)
+        # per operation statistics of the discovery calls
+        instrumentation = Instrumentation.from_options(OmegaConf.select(__conf, 'instrumentation', default=None))
+        if instrumentation is not None:
+            instrumentation.install(clients)
+
+        # local store of the discovered resources, `cdk synth -c refresh=true`
+        # forces a fresh pull from AWS. The store is disabled when the calls
+        # are recorded or replayed
+        inventory = InventoryStore()
+        if not clients.hermetic:
+            inventory = InventoryStore.from_options(OmegaConf.select(__conf, 'inventory', default=None),
+                refresh=str(self.node.try_get_context('refresh')).lower() in ('true', '1', 'yes'))
+
+        # one result per service, and per account and region when there are
+        # several of them, in the SUPPORTED_SERVICES order
+        results = discover_inventory(__conf, __region, __account, clients, inventory)
+        inventory.close()
+        if recorder is not None:
+            recorder.save()
+        if instrumentation is not None:
+            report = instrumentation.save()
+            if instrumentation.summary:
+                print(instrumentation.table(report), file=sys.stderr)
+        failures = [result for result in results if not result.ok]
+        for failure in failures:
+            Annotations.of(self).add_warning_v2(f'discovery:{failure.name}', f'Discovery failed for {failure.name}: {failure.error!r}')
+        # the failures of the member accounts are isolated: their widgets are
+        # left out, unless accounts.allow_partial is false
+        fatal = fatal_failures(__conf, results)
+        if fatal:
+            raise DiscoveryError(fatal)
+
+        # widgets are added in the SUPPORTED_SERVICES order, whatever the
+        # order in which the discoveries completed. The widgets yielded by the
+        # get_widgets() generators are built as the sharder consumes them
+        with renderer(OmegaConf.select(__conf, 'rendering.renderer', default='constructs')):
+            # with several accounts or regions, the widgets of each service,
+            # account and region follow a header naming them
+            sharder.build((result.name, with_header(result.header, result.service.get_widgets())
+                if result.header else result.service.get_widgets()) for result in results if result.ok)
+
+        # fingerprint of the inventory, configuration and code the dashboards
+        # are built from, stored next to them so that the pipeline can skip
+        # the runs that would deploy the same dashboards
+        if OmegaConf.select(__conf, 'fingerprint.enabled', default=False):
+            ssm.StringParameter(self, 'Fingerprint',
+                parameter_name=parameter_name(__conf),
+                string_value=fingerprint(__conf, inventory, __region, __account),
+                description=f'Fingerprint of the {dashboard_name} dashboards'
+            )
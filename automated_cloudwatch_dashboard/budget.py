@@ -0,0 +1,49 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+
+'''
+Metric budget of the graphs plotting one metric per resource.
+
+The metrics of such a graph are split in as many widgets as needed to keep
+each of them within max_metrics_per_widget, set in the section of each
+service. The widgets are titled "<title> (i/n)" and packed in rows.
+'''
+
+from .widgets import cloudwatch
+from .fleet import MAX_METRICS_PER_WIDGET
+
+# default number of metrics of a graph
+DEFAULT_METRICS_PER_WIDGET = 100
+
+def metrics_per_widget(options: dict):
+    '''Get the maximum number of metrics of a graph of a service'''
+    return max(1, min(int(options.get('max_metrics_per_widget', DEFAULT_METRICS_PER_WIDGET)), MAX_METRICS_PER_WIDGET))
+
+def graph_widgets(title: str, metrics: list, max_metrics: int, height: int = 6, width: int = 12,
+        legend_position: cloudwatch.LegendPosition = cloudwatch.LegendPosition.RIGHT):
+    '''Get the graphs of metrics, each one with at most max_metrics metrics'''
+    chunks = [metrics[i:i + max_metrics] for i in range(0, len(metrics), max_metrics)] or [[]]
+    return [
+        cloudwatch.GraphWidget(
+            title=title if len(chunks) == 1 else f'{title} ({i}/{len(chunks)})',
+            left=chunk,
+            legend_position=legend_position,
+            height=height,
+            width=width
+        )
+        for i, chunk in enumerate(chunks, start=1)
+    ]
@@ -0,0 +1,178 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import threading
+import weakref
+import boto3
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import CredentialProvider, DeferredRefreshableCredentials
+
+# account of the clients created with an assumed role, see account_of()
+_accounts = weakref.WeakKeyDictionary()
+
+def account_of(client):
+    '''Get the member account of a client, None for the account of the session credentials'''
+    return _accounts.get(client)
+
+class ClientFactory():
+    '''
+    Shared boto3 session and pool of clients used by the service modules.
+
+    Clients are created once for each (service, region) pair and reused, so
+    that botocore service models are loaded once and HTTP connections are
+    kept alive across the discovery phases of the different services.
+    '''
+
+    def __init__(self, session: boto3.session.Session = None, max_pool_connections: int = 50,
+            max_attempts: int = 10, retry_mode: str = 'adaptive', tcp_keepalive: bool = True):
+        self.session = session or boto3.session.Session()
+        self.config = Config(
+            max_pool_connections=max_pool_connections,
+            tcp_keepalive=tcp_keepalive,
+            retries=dict(
+                mode=retry_mode,
+                max_attempts=max_attempts
+            )
+        )
+        self._clients = {}
+        self._hooks = []
+        # factories of the member accounts, by account id
+        self._members = {}
+        # set when the calls are recorded or replayed: local caches of the
+        # discovery results must then be bypassed
+        self.hermetic = False
+        # boto3 sessions are not thread safe, clients are created one at a time
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_options(cls, options: dict):
+        options = options or {}
+        return cls(
+            max_pool_connections=options.get('max_pool_connections', 50),
+            max_attempts=options.get('max_attempts', 10),
+            retry_mode=options.get('retry_mode', 'adaptive'),
+            tcp_keepalive=options.get('tcp_keepalive', True)
+        )
+
+    def client(self, service: str, region: str):
+        '''Get the shared client of service in region'''
+        key = (service, region)
+        with self._lock:
+            if key not in self._clients:
+                client = self.session.client(service, config=self.config.merge(Config(region_name=region)))
+                for hook in self._hooks:
+                    hook(client)
+                self._clients[key] = client
+            return self._clients[key]
+
+    def add_hook(self, hook):
+        '''
+        Register hook(client), called for each client of the pool and of the
+        pools of the member accounts, e.g. to register handlers on the
+        botocore events of the client.
+        '''
+        with self._lock:
+            self._hooks.append(hook)
+            clients = list(self._clients.values())
+            members = list(self._members.values())
+        for client in clients:
+            hook(client)
+        for member in members:
+            with member._lock:
+                clients = list(member._clients.values())
+            for client in clients:
+                hook(client)
+
+    def for_account(self, account_id: str, role_name: str, region: str, session_name: str = 'automated-cloudwatch-dashboard',
+            duration_seconds: int = 3600, external_id: str = None):
+        '''
+        Get the factory of the clients of the member account account_id,
+        which assume role_name in it. The factory is created once for each
+        account, so that the credentials of the role are shared by all its
+        clients.
+        '''
+        with self._lock:
+            if account_id not in self._members:
+                self._members[account_id] = AssumedRoleClientFactory(self, account_id, role_name, region,
+                    session_name, duration_seconds, external_id)
+            return self._members[account_id]
+
+class AssumedRoleProvider(CredentialProvider):
+    '''Credentials of an assumed role, fetched on their first use and refreshed by botocore before they expire'''
+
+    METHOD = 'assume-role'
+    CANONICAL_NAME = 'custom-assume-role'
+
+    def __init__(self, fetch):
+        super().__init__()
+        self.fetch = fetch
+
+    def load(self):
+        return DeferredRefreshableCredentials(refresh_using=self.fetch, method=self.METHOD)
+
+class AssumedRoleClientFactory(ClientFactory):
+    '''
+    Pool of clients of a member account, created with the credentials of a
+    role assumed in it by the session of the parent factory.
+
+    The clients share the configuration and the hooks of the parent. The
+    role is only assumed when the first call is signed, so replayed calls
+    need no credentials.
+    '''
+
+    def __init__(self, parent: ClientFactory, account_id: str, role_name: str, region: str,
+            session_name: str = 'automated-cloudwatch-dashboard', duration_seconds: int = 3600, external_id: str = None):
+        self.parent = parent
+        self.account_id = account_id
+        self.region = region
+        partition = parent.session.get_partition_for_region(region) if region else 'aws'
+        self.role_arn = f'arn:{partition}:iam::{account_id}:role/{role_name}'
+        self.session_name = session_name
+        self.duration_seconds = duration_seconds
+        self.external_id = external_id
+        self._sts = None
+
+        session = botocore.session.get_session()
+        # the service models are loaded once, by the session of the parent
+        session.register_component('data_loader', parent.session._session.get_component('data_loader'))
+        session.get_component('credential_provider').insert_before('env', AssumedRoleProvider(self.assume_role))
+        super().__init__(boto3.session.Session(botocore_session=session, region_name=region))
+        self.config = parent.config
+        self._hooks = parent._hooks
+        self.hermetic = parent.hermetic
+
+    def assume_role(self):
+        '''Assume the role, returning its credentials in the format of RefreshableCredentials'''
+        with self.parent._lock:
+            # not a client of the pool: the credentials must not reach the hooks (e.g. a recording)
+            if self._sts is None:
+                self._sts = self.parent.session.client('sts', config=self.parent.config.merge(Config(region_name=self.region)))
+        params = dict(RoleArn=self.role_arn, RoleSessionName=self.session_name, DurationSeconds=self.duration_seconds)
+        if self.external_id:
+            params['ExternalId'] = self.external_id
+        credentials = self._sts.assume_role(**params)['Credentials']
+        return dict(
+            access_key=credentials['AccessKeyId'],
+            secret_key=credentials['SecretAccessKey'],
+            token=credentials['SessionToken'],
+            expiry_time=credentials['Expiration'].isoformat()
+        )
+
+    def client(self, service: str, region: str):
+        client = super().client(service, region)
+        _accounts[client] = self.account_id
+        return client
@@ -0,0 +1,149 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+'''
+Debouncing of the Tag Change on Resource events, between the event rule and
+the pipeline.
+
+A burst of events (e.g. an AutoScaling group launching 200 tagged instances)
+would start one pipeline execution per event. Instead, the rule delivers the
+events to an SQS queue, drained on a schedule by a Lambda function running
+handler(): the pipeline is started once the queue received no event for the
+quiet period (or once its oldest event waited for the maximum wait, should
+the events never stop). The events are coalesced by resource, the latest
+event of each resource wins. In incremental mode they are forwarded to the
+queue the synth step applies to the inventory store.
+
+This module runs in Lambda: it only depends on boto3.
+'''
+
+import json
+import os
+import time
+import boto3
+
+# SQS batch operations accept up to 10 entries
+BATCH_SIZE = 10
+
+def batches(items: list, size: int = BATCH_SIZE):
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+def coalesce(messages: list):
+    '''
+    Get the latest event of each resource of the SQS messages (as returned by
+    receive_message with the SentTimestamp attribute), in the order they were sent
+    '''
+    events = {}
+    for message in sorted(messages, key=lambda message: int(message['Attributes']['SentTimestamp'])):
+        event = json.loads(message['Body'])
+        for arn in event.get('resources', []):
+            events.pop(arn, None)
+            events[arn] = event
+    return events
+
+class Debouncer():
+    '''Start a pipeline once per burst of the events waiting in an SQS queue'''
+
+    def __init__(self, sqs, queue_url: str, codepipeline, pipeline_name: str, quiet_seconds: float = 120,
+            max_wait_seconds: float = 900, forward_queue_url: str = None, visibility_timeout: int = 30, now=time.time):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.codepipeline = codepipeline
+        self.pipeline_name = pipeline_name
+        self.quiet_seconds = quiet_seconds
+        self.max_wait_seconds = max_wait_seconds
+        # queue the coalesced events are forwarded to, if any
+        self.forward_queue_url = forward_queue_url
+        # time the received messages stay hidden while the queue is drained
+        self.visibility_timeout = visibility_timeout
+        self.now = now
+
+    def receive(self):
+        '''Receive all the messages waiting in the queue'''
+        messages = []
+        while True:
+            response = self.sqs.receive_message(
+                QueueUrl=self.queue_url,
+                MaxNumberOfMessages=BATCH_SIZE,
+                WaitTimeSeconds=0,
+                VisibilityTimeout=self.visibility_timeout,
+                AttributeNames=['SentTimestamp']
+            )
+            received = response.get('Messages', [])
+            if not received:
+                return messages
+            messages.extend(received)
+
+    def release(self, messages: list):
+        '''Make received messages visible again, for the next run'''
+        for batch in batches(messages):
+            self.sqs.change_message_visibility_batch(QueueUrl=self.queue_url, Entries=[
+                dict(Id=str(index), ReceiptHandle=message['ReceiptHandle'], VisibilityTimeout=0)
+                for index, message in enumerate(batch)
+            ])
+
+    def delete(self, messages: list):
+        for batch in batches(messages):
+            self.sqs.delete_message_batch(QueueUrl=self.queue_url, Entries=[
+                dict(Id=str(index), ReceiptHandle=message['ReceiptHandle'])
+                for index, message in enumerate(batch)
+            ])
+
+    def forward(self, events: dict):
+        '''Send each coalesced event to the forward queue, once'''
+        unique = {event.get('id', arn): event for arn, event in events.items()}
+        for batch in batches(list(unique.values())):
+            self.sqs.send_message_batch(QueueUrl=self.forward_queue_url, Entries=[
+                dict(Id=str(index), MessageBody=json.dumps(event))
+                for index, event in enumerate(batch)
+            ])
+
+    def run(self):
+        '''
+        Drain the queue once. Returns the action taken (idle: no event,
+        waiting: the burst is not over, started: the pipeline was started),
+        with the ARNs of the coalesced events
+        '''
+        messages = self.receive()
+        if not messages:
+            return dict(action='idle', arns=[])
+        events = coalesce(messages)
+        sent = [int(message['Attributes']['SentTimestamp']) / 1000 for message in messages]
+        now = self.now()
+        if now - max(sent) < self.quiet_seconds and now - min(sent) < self.max_wait_seconds:
+            self.release(messages)
+            return dict(action='waiting', arns=list(events), messages=len(messages))
+
+        if self.forward_queue_url:
+            self.forward(events)
+        execution = self.codepipeline.start_pipeline_execution(name=self.pipeline_name)
+        # the messages are deleted once the pipeline is started: should it
+        # fail, they are received again by the next run
+        self.delete(messages)
+        return dict(action='started', arns=list(events), messages=len(messages),
+            execution_id=execution['pipelineExecutionId'])
+
+def handler(event: dict, context):
+    '''Lambda function run on a schedule'''
+    debouncer = Debouncer(boto3.client('sqs'), os.environ['QUEUE_URL'], boto3.client('codepipeline'),
+        os.environ['PIPELINE_NAME'],
+        quiet_seconds=float(os.getenv('QUIET_SECONDS', 120)),
+        max_wait_seconds=float(os.getenv('MAX_WAIT_SECONDS', 900)),
+        forward_queue_url=os.getenv('FORWARD_QUEUE_URL') or None
+    )
+    result = debouncer.run()
+    print(json.dumps(result))
+    return result
@@ -0,0 +1,181 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from omegaconf import OmegaConf
+from .inventory import InventoryStore
+from .tagging import TagIndex
+import time
+
+# service modules, in the order of their widgets in the dashboards
+SUPPORTED_SERVICES = ["EC2", "S3", "ELB", "AutoScaling", "Outposts"]
+
+class DiscoveryResult():
+    '''Outcome of the discovery phase of a single service module'''
+
+    def __init__(self, name: str, service=None, error: Exception = None, elapsed: float = 0.0):
+        self.name = name
+        self.service = service
+        self.error = error
+        self.elapsed = elapsed
+        # member account of the service (None for the account of the
+        # dashboards) and header of its widgets, set by discover_inventory
+        self.account = None
+        self.header = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        status = 'ok' if self.ok else f'failed: {self.error!r}'
+        return f'{self.name} ({self.elapsed:.2f}s, {status})'
+
+class DiscoveryError(Exception):
+    '''Raised when one or more service modules fail their discovery phase'''
+
+    def __init__(self, failures: list):
+        self.failures = failures
+        report = '\n'.join(f'  - {failure.name}: {failure.error!r}' for failure in failures)
+        super().__init__(f'Discovery failed for {len(failures)} service(s):\n{report}')
+
+def discover(name: str, factory):
+    '''Run the discovery phase of a single service, capturing any error'''
+    start = time.perf_counter()
+    try:
+        service = factory()
+    except Exception as error:
+        return DiscoveryResult(name, error=error, elapsed=time.perf_counter() - start)
+    return DiscoveryResult(name, service=service, elapsed=time.perf_counter() - start)
+
+def discover_services(factories: list, max_workers: int = None):
+    '''
+    Run the discovery phase of each service on a bounded thread pool.
+
+    factories is a list of (name, callable) pairs, where the callable builds
+    the service object (the discovery happens in the service constructor).
+    One DiscoveryResult is returned for each service, in the same order as
+    factories, regardless of the order in which the discoveries complete.
+    '''
+    if not factories:
+        return []
+    if max_workers is None or max_workers < 1:
+        max_workers = len(factories)
+    max_workers = min(max_workers, len(factories))
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='discovery') as executor:
+        futures = [executor.submit(discover, name, factory) for name, factory in factories]
+        return [future.result() for future in futures]
+
+def fatal_failures(conf, results: list):
+    '''
+    Get the failed results which fail the synth: none with
+    discovery.allow_partial. Otherwise, those of the account of the
+    dashboards, the failures of the member accounts being isolated (their
+    widgets are left out) unless accounts.allow_partial is false
+    '''
+    if OmegaConf.select(conf, 'discovery.allow_partial', default=False):
+        return []
+    failures = [result for result in results if not result.ok]
+    if not OmegaConf.select(conf, 'accounts.allow_partial', default=True):
+        return failures
+    return [failure for failure in failures if failure.account is None]
+
+def import_class_from_string(path: str):
+    module_path, _, class_name = path.rpartition('.')
+    mod = import_module(module_path)
+    klass = getattr(mod, class_name)
+    return klass
+
+def discover_inventory(conf, region: str, account: str, clients, inventory: InventoryStore = None):
+    '''
+    Discover the tagged resources of the SUPPORTED_SERVICES, as configured in
+    conf, in its regions and member accounts.
+
+    region and account are those of the dashboards: the regions default to
+    region, and account is discovered with clients. One DiscoveryResult is
+    returned for each service, account and region, in this order. With
+    several accounts or regions, the header of each result names them.
+    '''
+    inventory = inventory if inventory is not None else InventoryStore()
+    classes = []
+    for class_file in SUPPORTED_SERVICES:
+        class_file = class_file.replace('.py', '')
+        # load the class in services directory
+        klass = import_class_from_string(f'automated_cloudwatch_dashboard.services.{class_file}.{class_file}')
+        classes.append((class_file, klass))
+
+    # regions of the discovered resources, the region of the stack by
+    # default. The resources of all the regions go in the same dashboards
+    regions = list(OmegaConf.select(conf, 'regions', default=None) or [region])
+    # member accounts, discovered with a role assumed in each of them. The
+    # account of the stack (None) is discovered with the credentials of the synth
+    members = OmegaConf.select(conf, 'accounts', default=None)
+    members = OmegaConf.to_container(members, resolve=True) if members is not None else {}
+    accounts = [None] + [member for member in dict.fromkeys(str(member) for member in members.get('ids') or [])
+        if member != account]
+    account_clients = {member: clients.for_account(member, members.get('role_name', 'AutomatedCloudWatchDashboardDiscovery'),
+        region, session_name=members.get('session_name', 'automated-cloudwatch-dashboard'),
+        duration_seconds=members.get('duration_seconds', 3600), external_id=members.get('external_id'))
+        for member in accounts if member is not None}
+    account_clients[None] = clients
+
+    # single tagging sweep in each account and region, covering the resource types of all the service modules
+    tag_indexes = {(member, location): TagIndex(location, conf.tag_name, list(conf.tag_values),
+        [resource_type for _, klass in classes for resource_type in getattr(klass, 'TAGGING_RESOURCE_TYPES', [])],
+        account_clients[member]
+    ) for member in accounts for location in regions}
+
+    factories = []
+    # (account, header of the widgets) of each factory
+    targets = []
+    for class_file, klass in classes:
+        # service specific options, from the services section of the configuration
+        options = OmegaConf.select(conf, f'services.{class_file}', default=None)
+        options = OmegaConf.to_container(options, resolve=True) if options is not None else {}
+        for member in accounts:
+            for location in regions:
+                # service, then account and region when there are several of them
+                parts = [class_file] + ([member or account or 'default'] if len(accounts) > 1 else []) \
+                    + ([location] if len(regions) > 1 else [])
+                # the class is instantiated (and the discovery performed) by the thread pool
+                factories.append(('-'.join(parts),
+                    lambda klass=klass, options=options, member=member, location=location: klass(location, conf.tag_name,
+                        list(conf.tag_values), options=options, clients=account_clients[member],
+                        tag_index=tag_indexes[(member, location)], inventory=inventory,
+                        # the metrics of the other regions and accounts are looked up in them
+                        metric_region=None if location == region else location, metric_account=member)))
+                targets.append((member, f'## {" - ".join(parts)}' if len(accounts) * len(regions) > 1 else None))
+
+    # run the discovery phases concurrently, one result per service, account
+    # and region: up to accounts.max_workers accounts at a time, each on its
+    # own pool of max_workers threads per region, so that the discovery takes
+    # about as long as in the slowest region and account
+    max_workers = OmegaConf.select(conf, 'discovery.max_workers', default=None)
+    indexes = {member: [index for index, (target, _) in enumerate(targets) if target == member] for member in accounts}
+    discover_account = lambda member: discover_services([factories[index] for index in indexes[member]],
+        max_workers * len(regions) if max_workers else None)
+    results = [None] * len(factories)
+    with ThreadPoolExecutor(max_workers=min(len(accounts), members.get('max_workers') or len(accounts)),
+            thread_name_prefix='accounts') as executor:
+        for member, account_results in zip(accounts, executor.map(discover_account, accounts)):
+            for index, result in zip(indexes[member], account_results):
+                results[index] = result
+    for result, (member, header) in zip(results, targets):
+        result.account = member
+        result.header = header
+    return results
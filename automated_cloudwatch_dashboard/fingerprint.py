@@ -0,0 +1,161 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+'''
+Fingerprint of the dashboards, to skip the pipeline runs that change nothing.
+
+The fingerprint is a hash of everything the dashboards are built from: the
+discovered inventory, the configuration and the code of the app (the widget
+templates included) with the version of aws-cdk-lib. The stack stores it in an
+SSM parameter next to the dashboards. Before the synth, the pipeline runs
+the discovery alone and compares its fingerprint with the deployed one: when
+they match, the pipeline execution is stopped instead of being synthesized
+and deployed again. With inventory.enabled, the synth that follows a changed
+fingerprint reads the inventory discovered by the check from the store.
+
+Usage:
+    python -m automated_cloudwatch_dashboard.fingerprint || cdk synth
+
+The exit status is 0 when the dashboards are up to date, 1 when they must be
+synthesized. In the pipeline, --stop-execution gives the id of the current
+execution: the exit status is then 0 only once that execution is stopped, so
+that the synth runs (and produces its output) whenever it is not.
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from importlib import metadata
+from botocore.exceptions import BotoCoreError, ClientError
+from omegaconf import OmegaConf
+from .clients import ClientFactory
+from .discovery import discover_inventory
+from .inventory import InventoryStore, encode
+
+# files of the app outside of the package that change the synthesized templates
+APP_FILES = ['app.py', 'cdk.json', 'requirements.txt']
+
+def parameter_name(conf):
+    '''Get the name of the SSM parameter holding the fingerprint of the deployed dashboards'''
+    name = OmegaConf.select(conf, 'fingerprint.parameter_name', default=None)
+    if name:
+        return name
+    dashboard_name = conf.dashboard_name or 'Automated-CloudWatch-Dashboard'
+    return f'/automated-cloudwatch-dashboard/{dashboard_name}/fingerprint'
+
+def source_files():
+    '''Get the paths of the sources of the app, in a stable order'''
+    package = os.path.dirname(os.path.abspath(__file__))
+    paths = []
+    for directory, directories, files in os.walk(package):
+        directories[:] = sorted(name for name in directories if name != '__pycache__')
+        paths.extend(os.path.join(directory, name) for name in sorted(files) if name.endswith('.py'))
+    return paths + [path for path in APP_FILES if os.path.isfile(path)]
+
+def fingerprint(conf, inventory: InventoryStore, region: str = None, account: str = None):
+    '''
+    Get the fingerprint of the dashboards of conf in region and account,
+    built from the snapshots discovered in inventory
+    '''
+    digest = hashlib.sha256()
+    update = lambda value: digest.update(json.dumps(value, default=encode, sort_keys=True).encode() + b'\n')
+    try:
+        update(['aws-cdk-lib', metadata.version('aws-cdk-lib')])
+    except metadata.PackageNotFoundError:
+        update(['aws-cdk-lib', None])
+    update([region, account])
+    update(OmegaConf.to_container(conf, resolve=True))
+    package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for path in source_files():
+        with open(path, 'rb') as f:
+            update([os.path.relpath(os.path.abspath(path), package), hashlib.sha256(f.read()).hexdigest()])
+    for key, resources in inventory.discovered():
+        update([key, resources])
+    return digest.hexdigest()
+
+def deployed_fingerprint(clients: ClientFactory, region: str, name: str):
+    '''Get the fingerprint stored in the SSM parameter name, None if it does not exist'''
+    ssm = clients.client('ssm', region)
+    try:
+        return ssm.get_parameter(Name=name)['Parameter']['Value']
+    except ssm.exceptions.ParameterNotFound:
+        return None
+
+def stop_pipeline(clients: ClientFactory, region: str, execution_id: str, reason: str):
+    '''
+    Stop the execution execution_id of the pipeline this CodeBuild build is
+    running in. Returns False when the build was not started by CodePipeline,
+    or the execution is not in progress or could not be stopped
+    '''
+    # codepipeline/<pipeline name> when CodePipeline started the build
+    initiator = os.getenv('CODEBUILD_INITIATOR', '')
+    if not initiator.startswith('codepipeline/') or not execution_id:
+        return False
+    name = initiator.split('/', 1)[1]
+    codepipeline = clients.client('codepipeline', region)
+    for stage in codepipeline.get_pipeline_state(name=name).get('stageStates', []):
+        execution = stage.get('latestExecution', {})
+        # in superseded mode, a newer execution can be in progress in an
+        # earlier stage: only the execution of this build is stopped
+        if execution.get('pipelineExecutionId') == execution_id and execution.get('status') == 'InProgress':
+            try:
+                codepipeline.stop_pipeline_execution(pipelineName=name, pipelineExecutionId=execution_id,
+                    abandon=True, reason=reason)
+            except (BotoCoreError, ClientError) as error:
+                print(f'Pipeline execution {execution_id} could not be stopped: {error}', file=sys.stderr)
+                return False
+            return True
+    return False
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='Check if the deployed dashboards are up to date with the tagged resources')
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--region', help='region of the dashboards, CDK_DEFAULT_REGION by default')
+    parser.add_argument('--account', help='account of the dashboards, CDK_DEFAULT_ACCOUNT by default')
+    parser.add_argument('--stop-execution', metavar='EXECUTION_ID',
+        help='pipeline execution to stop when the dashboards are up to date, the exit status is 1 when it is not stopped')
+    args = parser.parse_args(argv)
+
+    conf = OmegaConf.load(args.config)
+    clients = ClientFactory.from_options(OmegaConf.select(conf, 'clients', default=None))
+    region = args.region or os.getenv('CDK_DEFAULT_REGION') or clients.session.region_name
+    account = args.account or os.getenv('CDK_DEFAULT_ACCOUNT') \
+        or clients.client('sts', region).get_caller_identity()['Account']
+    inventory = InventoryStore.from_options(OmegaConf.select(conf, 'inventory', default=None))
+
+    results = discover_inventory(conf, region, account, clients, inventory)
+    inventory.close()
+    failures = [result for result in results if not result.ok]
+    if failures:
+        print(f'Discovery failed for {", ".join(failure.name for failure in failures)}, the dashboards must be synthesized')
+        return 1
+    current = fingerprint(conf, inventory, region, account)
+    deployed = deployed_fingerprint(clients, region, parameter_name(conf))
+    if current != deployed:
+        print(f'Fingerprint {current} differs from the deployed {deployed}, the dashboards must be synthesized')
+        return 1
+    if args.stop_execution is not None \
+            and not stop_pipeline(clients, region, args.stop_execution, f'The dashboards are up to date (fingerprint {current})'):
+        # the synth must run for the pipeline to proceed
+        print(f'Fingerprint {current} is deployed, but the pipeline execution {args.stop_execution} could not be stopped')
+        return 1
+    print(f'Fingerprint {current} is deployed, the dashboards are up to date')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+'''
+Fleet mode widgets, built on CloudWatch SEARCH metric math expressions.
+
+Instead of one widget (or one metric) per resource, a service in fleet mode
+emits a fixed set of widgets, each line being the aggregate (e.g. the
+maximum) of a metric across all the discovered resources. The resources are
+selected by SEARCH expressions on their ids, split in as many expressions as
+needed to keep each of them within the length accepted by CloudWatch. Beyond
+MAX_SEARCH_EXPRESSIONS_PER_WIDGET expressions, a single SEARCH expression
+returns the metric of all the resources of the namespace in the region (as
+the top-N queries do, SEARCH cannot filter on tags), so that the number of
+widgets stays the same however large the fleet grows.
+'''
+
+from .widgets import cdk, cloudwatch
+
+# maximum length of a SEARCH expression accepted by CloudWatch
+MAX_EXPRESSION_LENGTH = 1024
+# maximum number of metrics and expressions in a graph
+MAX_METRICS_PER_WIDGET = 500
+# number of SEARCH expressions of a graph, well below MAX_METRICS_PER_WIDGET
+# as each of them queries the metrics of up to a hundred resources
+MAX_SEARCH_EXPRESSIONS_PER_WIDGET = 100
+
+def search_conditions(metric_name: str, filters: dict = None):
+    conditions = f'MetricName="{metric_name}"'
+    for name, value in (filters or {}).items():
+        conditions += f' {name}="{value}"'
+    return conditions
+
+def use_fleet_mode(options: dict, resource_count: int, default_threshold: int):
+    '''
+    Check if a service with resource_count resources uses the fleet mode:
+    options fleet_mode is true, false (the default) or auto, in which case
+    the fleet mode is used from fleet_threshold resources.
+    '''
+    mode = options.get('fleet_mode', False)
+    if isinstance(mode, bool):
+        return mode
+    if str(mode).lower() != 'auto':
+        return str(mode).lower() in ('true', 'on', 'yes')
+    return resource_count >= options.get('fleet_threshold', default_threshold)
+
+def search_expressions(namespace: str, schema: list, dimension: str, ids: list, metric_name: str,
+        statistic: str, period: cdk.Duration, filters: dict = None):
+    '''
+    Get the SEARCH expressions returning metric_name of the resources whose
+    dimension is one of ids, each expression shorter than MAX_EXPRESSION_LENGTH.
+    schema is the list of the dimensions of the metric, filters the value of
+    the other dimensions.
+    '''
+    prefix = f"SEARCH('{{{','.join([namespace] + schema)}}} {search_conditions(metric_name, filters)} ("
+    suffix = f")', '{statistic}', {int(period.to_seconds())})"
+
+    expressions = []
+    terms = []
+    length = len(prefix) + len(suffix)
+    for resource_id in ids:
+        term = f'{dimension}="{resource_id}"'
+        # terms are joined with ' OR '
+        if terms and length + len(' OR ') + len(term) > MAX_EXPRESSION_LENGTH:
+            expressions.append(prefix + ' OR '.join(terms) + suffix)
+            terms = []
+            length = len(prefix) + len(suffix)
+        length += (len(' OR ') if terms else 0) + len(term)
+        terms.append(term)
+    if terms:
+        expressions.append(prefix + ' OR '.join(terms) + suffix)
+    return expressions
+
+def region_search_expression(namespace: str, schema: list, metric_name: str, statistic: str, period: cdk.Duration,
+        filters: dict = None):
+    '''Get the SEARCH expression returning metric_name of all the resources of namespace in the region'''
+    return f"SEARCH('{{{','.join([namespace] + schema)}}} {search_conditions(metric_name, filters)}', " \
+        f"'{statistic}', {int(period.to_seconds())})"
+
+def fleet_metric(expressions: list, function: str, label: str, period: cdk.Duration, id_prefix: str):
+    '''
+    Get the aggregate, with function (MAX, MIN or SUM), of the time series
+    returned by expressions. id_prefix must be unique within the widget.
+    '''
+    using_metrics = {
+        f'{id_prefix}{i}': cloudwatch.MathExpression(expression=expression, using_metrics={}, period=period)
+        for i, expression in enumerate(expressions)
+    }
+    # the aggregate of each expression, then of the aggregates
+    expression = f'{function}([{", ".join(f"{function}({metric_id})" for metric_id in using_metrics)}])'
+    return cloudwatch.MathExpression(expression=expression, using_metrics=using_metrics, label=label, period=period)
+
+def fleet_widgets(title: str, namespace: str, schema: list, dimension: str, ids: list, metrics: list,
+        period: cdk.Duration, filters: dict = None, height: int = 6, width: int = 12,
+        legend_position: cloudwatch.LegendPosition = cloudwatch.LegendPosition.BOTTOM, region: str = None,
+        account: str = None):
+    '''
+    Get the widgets with a line for each (metric name, statistic, function)
+    of metrics, aggregated with function across the resources of ids. The
+    lines are spread over several widgets when their SEARCH expressions
+    exceed MAX_SEARCH_EXPRESSIONS_PER_WIDGET, and a metric whose ids need
+    more is searched across the region: the number of widgets depends on
+    metrics, not on ids. The SEARCH expressions run in region and account,
+    those of the dashboard by default.
+    '''
+    lines = []
+    for i, (metric_name, statistic, function) in enumerate(metrics):
+        expressions = search_expressions(namespace, schema, dimension, ids, metric_name, statistic, period, filters)
+        label = f'{metric_name} ({function.lower()} of {statistic.lower()})'
+        if len(expressions) > MAX_SEARCH_EXPRESSIONS_PER_WIDGET:
+            expressions = [region_search_expression(namespace, schema, metric_name, statistic, period, filters)]
+            label += ' in the region'
+        lines.append((len(expressions), fleet_metric(expressions, function, label, period, f'm{i}s')))
+
+    # the aggregates add one query per line, at most
+    # MAX_SEARCH_EXPRESSIONS_PER_WIDGET more, within MAX_METRICS_PER_WIDGET
+    groups = []
+    searches = 0
+    for count, line in lines:
+        if not groups or searches + count > MAX_SEARCH_EXPRESSIONS_PER_WIDGET:
+            groups.append([])
+            searches = 0
+        groups[-1].append(line)
+        searches += count
+    return [
+        cloudwatch.GraphWidget(
+            title=title if len(groups) == 1 else f'{title} ({i}/{len(groups)})',
+            left=group,
+            height=height,
+            width=width,
+            legend_position=legend_position,
+            region=region,
+            account_id=account
+        )
+        for i, group in enumerate(groups, start=1)
+    ]
+
+def rows(widgets: list):
+    '''Pack widgets in rows of the width of the dashboard'''
+    packed = []
+    width = 0
+    for widget in widgets:
+        if not packed or width + widget.width > 24:
+            packed.append([])
+            width = 0
+        packed[-1].append(widget)
+        width += widget.width
+    return [cloudwatch.Row(*row) for row in packed]
@@ -0,0 +1,174 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+'''
+Incremental update of the inventory store from Tag Change on Resource events.
+
+Each event carries the ARN of the changed resource and its tags after the
+change. The resource is added to or removed from the stored inventory of its
+service, in place when the service module knows how to do it (its class
+defines an apply_tag_change method), otherwise the stored inventory of that
+service only is expired, so that the next synth re-queries that service alone
+and reads all the other ones from the store.
+
+Usage:
+    python -m automated_cloudwatch_dashboard.incremental --queue-url <url>
+    python -m automated_cloudwatch_dashboard.incremental --event event.json
+'''
+
+import argparse
+import json
+import os
+import sys
+from importlib import import_module
+from omegaconf import OmegaConf
+from .clients import ClientFactory
+from .inventory import InventoryStore
+from .tagging import TagIndex
+
+# resource type (as in the Resource Groups Tagging API) -> service module
+SERVICES = {
+    'ec2:instance': 'EC2',
+    's3:bucket': 'S3',
+    'elasticloadbalancing:loadbalancer': 'ELB',
+    'autoscaling:autoScalingGroup': 'AutoScaling',
+    'outposts:outpost': 'Outposts',
+}
+
+class TagChangeEvent():
+    '''Tag Change on Resource event delivered by EventBridge'''
+
+    def __init__(self, event: dict):
+        self.arn = event['resources'][0]
+        self.region = event['region']
+        self.account = event.get('account')
+        self.tags = event['detail'].get('tags', {})
+        self.changed_tag_keys = event['detail'].get('changed-tag-keys', [])
+        self.resource_type = TagIndex.get_resource_type(self.arn)
+
+    def matches(self, tag: str, tag_values: list):
+        '''Check if the resource is tagged with tag, with one of tag_values, after the change'''
+        if tag not in self.tags:
+            return False
+        return not tag_values or self.tags[tag] in tag_values
+
+class IncrementalUpdater():
+    '''Apply Tag Change on Resource events to the inventory store'''
+
+    def __init__(self, inventory: InventoryStore, tag: str, tag_values: list, clients: ClientFactory = None,
+            account: str = None, members: dict = None):
+        self.inventory = inventory
+        self.tag_name = tag
+        self.tag_values = tag_values
+        self.clients = clients or ClientFactory()
+        # account of the stack, and options of the member accounts (the accounts section of the configuration)
+        self.account = account
+        self.members = members or {}
+
+    def member_account(self, change: TagChangeEvent):
+        '''Get the member account of the changed resource, None for the account of the stack'''
+        if change.account is None or change.account == self.account:
+            return None
+        return change.account
+
+    def member_clients(self, member: str, region: str):
+        '''Get the clients of a member account, as in the discovery, or the clients of the stack for None'''
+        if member is None:
+            return self.clients
+        return self.clients.for_account(member, self.members.get('role_name', 'AutomatedCloudWatchDashboardDiscovery'),
+            region, session_name=self.members.get('session_name', 'automated-cloudwatch-dashboard'),
+            duration_seconds=self.members.get('duration_seconds', 3600), external_id=self.members.get('external_id'))
+
+    def apply(self, event: dict):
+        '''Apply a single event, returning the action taken (ignored, updated or invalidated)'''
+        change = TagChangeEvent(event)
+        service = SERVICES.get(change.resource_type)
+        if service is None:
+            return 'ignored'
+        # the resources of a member account are stored under its own scope, as in the discovery
+        member = self.member_account(change)
+        scope = self.inventory.scope(service, change.region, self.tag_name, self.tag_values, member)
+        module = import_module(f'automated_cloudwatch_dashboard.services.{service}')
+        klass = getattr(module, service)
+        apply_tag_change = getattr(klass, 'apply_tag_change', None)
+        try:
+            if apply_tag_change is not None and apply_tag_change(scope, self.member_clients(member, change.region), change):
+                return 'updated'
+        except Exception as error:
+            # the next synth discovers the service again, a bad event must
+            # not be left in the queue
+            print(f'Could not apply the tag change of {change.arn}: {error!r}', file=sys.stderr)
+        scope.invalidate()
+        return 'invalidated'
+
+    def drain(self, queue_url: str, region: str = None):
+        '''Apply all the events waiting in an SQS queue, deleting them once applied'''
+        sqs = self.clients.client('sqs', region)
+        actions = []
+        while True:
+            response = sqs.receive_message(
+                QueueUrl=queue_url,
+                MaxNumberOfMessages=10,
+                WaitTimeSeconds=0
+            )
+            messages = response.get('Messages', [])
+            if not messages:
+                break
+            for message in messages:
+                try:
+                    actions.append(self.apply(json.loads(message['Body'])))
+                except (ValueError, KeyError, IndexError) as error:
+                    # not a tag change event, there is nothing to apply
+                    print(f'Ignored message {message.get("MessageId")}: {error!r}', file=sys.stderr)
+                    actions.append('ignored')
+                sqs.delete_message(QueueUrl=queue_url, ReceiptHandle=message['ReceiptHandle'])
+        return actions
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='Apply Tag Change on Resource events to the inventory store')
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--queue-url', help='SQS queue the events are delivered to')
+    parser.add_argument('--region', help='region of the SQS queue')
+    parser.add_argument('--account', help='account of the stack, CDK_DEFAULT_ACCOUNT by default')
+    parser.add_argument('--event', action='append', default=[], help='JSON file containing an event')
+    args = parser.parse_args(argv)
+
+    conf = OmegaConf.load(args.config)
+    inventory = InventoryStore.from_options(OmegaConf.select(conf, 'inventory', default=None))
+    if not inventory.enabled:
+        print('The inventory store is disabled, nothing to update')
+        return 0
+    clients = ClientFactory.from_options(OmegaConf.select(conf, 'clients', default=None))
+    account = args.account or os.getenv('CDK_DEFAULT_ACCOUNT') \
+        or clients.client('sts', args.region).get_caller_identity()['Account']
+    members = OmegaConf.select(conf, 'accounts', default=None)
+    members = OmegaConf.to_container(members, resolve=True) if members is not None else {}
+    updater = IncrementalUpdater(inventory, conf.tag_name, list(conf.tag_values), clients, account, members)
+
+    actions = []
+    for path in args.event:
+        with open(path) as f:
+            actions.append(updater.apply(json.load(f)))
+    if args.queue_url:
+        actions.extend(updater.drain(args.queue_url, args.region))
+    inventory.close()
+
+    summary = ', '.join(f'{actions.count(action)} {action}' for action in sorted(set(actions)))
+    print(f'Applied {len(actions)} tag change event(s){": " + summary if actions else ""}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
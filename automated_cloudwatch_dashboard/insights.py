@@ -0,0 +1,79 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+
+'''
+Top-N widgets, built on CloudWatch Metrics Insights queries.
+
+A single query (SELECT ... GROUP BY ... ORDER BY ... LIMIT N) returns the N
+resources with the highest value of a metric, so the widget stays the same
+size however many resources are discovered. The query is restricted to the
+discovered resources as long as their ids fit in the query, otherwise it
+ranks all the resources of the namespace in the region: Metrics Insights
+cannot filter on the tags of the resources.
+'''
+
+from .widgets import cdk, cloudwatch
+
+# conservative bound on the length of a Metrics Insights query
+MAX_QUERY_LENGTH = 1000
+# maximum number of time series returned by a Metrics Insights query
+MAX_LIMIT = 500
+
+def top_n(options: dict):
+    '''Get the number of resources of the top-N widgets of a service, 0 if they are disabled'''
+    return min(int(options.get('top_n', 0) or 0), MAX_LIMIT)
+
+def top_n_query(namespace: str, schema: list, dimension: str, ids: list, metric_name: str, function: str,
+        limit: int, filters: dict = None):
+    '''
+    Get the query of the limit resources of ids (one per value of dimension)
+    with the highest function (AVG, MAX, MIN, SUM or COUNT) of metric_name.
+    schema is the list of the dimensions of the metric, filters the value of
+    the other dimensions.
+    '''
+    quoted = lambda value: "'" + str(value).replace("'", "''") + "'"
+    select = f'SELECT {function}({metric_name}) FROM SCHEMA("{namespace}", {", ".join(schema)})'
+    conditions = [f'{name} = {quoted(value)}' for name, value in (filters or {}).items()]
+    order = f' GROUP BY {dimension} ORDER BY {function}() DESC LIMIT {limit}'
+
+    scoped = conditions + ['(' + ' OR '.join(f'{dimension} = {quoted(resource_id)}' for resource_id in ids) + ')']
+    query = select + ' WHERE ' + ' AND '.join(scoped) + order
+    if len(query) <= MAX_QUERY_LENGTH:
+        return query, True
+    # too many resources: rank those of the whole namespace
+    return select + (' WHERE ' + ' AND '.join(conditions) if conditions else '') + order, False
+
+def top_n_widget(title: str, namespace: str, schema: list, dimension: str, ids: list, metric_name: str,
+        function: str, limit: int, period: cdk.Duration, filters: dict = None, height: int = 6, width: int = 12,
+        legend_position: cloudwatch.LegendPosition = cloudwatch.LegendPosition.RIGHT, region: str = None,
+        account: str = None):
+    '''
+    Get a graph of the limit resources of ids with the highest function of
+    metric_name, queried in region and account (those of the dashboard by
+    default)
+    '''
+    query, scoped = top_n_query(namespace, schema, dimension, ids, metric_name, function, limit, filters)
+    return cloudwatch.GraphWidget(
+        title=f'{title} - top {limit}' + ('' if scoped else ' in the region'),
+        # an empty label: each time series is named after its resource, not after the query
+        left=[cloudwatch.MathExpression(expression=query, using_metrics={}, label='', period=period)],
+        height=height,
+        width=width,
+        legend_position=legend_position,
+        region=region,
+        account_id=account
+    )
@@ -0,0 +1,201 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+'''
+Instrumentation of the AWS calls made during the discovery.
+
+Handlers registered on the botocore events of each client of a ClientFactory
+record, by service and operation, the number of calls, their latency
+(including the retries), the number of retries and of throttling errors, and
+the calls that failed. The result is reported as a summary table and as a
+JSON file once the discovery is completed.
+'''
+
+import json
+import os
+import threading
+import time
+from .clients import ClientFactory
+
+# error codes returned by the AWS APIs when a request is throttled
+THROTTLING_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottledException',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'TransactionInProgressException',
+    'RequestLimitExceeded',
+    'BandwidthLimitExceeded',
+    'LimitExceededException',
+    'RequestThrottled',
+    'SlowDown',
+    'PriorRequestNotComplete',
+    'EC2ThrottledException',
+}
+
+def percentile(values: list, p: float):
+    '''Nearest-rank percentile of sorted values'''
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+class OperationStats():
+    '''Statistics of the calls of a single operation'''
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttles = 0
+        self.latencies = []
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        return dict(
+            calls=self.calls,
+            errors=self.errors,
+            retries=self.retries,
+            throttles=self.throttles,
+            latency_ms=dict(
+                p50=round(percentile(latencies, 50) * 1000, 2),
+                p90=round(percentile(latencies, 90) * 1000, 2),
+                p99=round(percentile(latencies, 99) * 1000, 2),
+                max=round(latencies[-1] * 1000, 2) if latencies else 0.0,
+                total=round(sum(latencies) * 1000, 2)
+            )
+        )
+
+class Instrumentation():
+    '''Record the calls made by the clients of a ClientFactory'''
+
+    def __init__(self, path: str = None, summary: bool = True):
+        self.path = path
+        self.summary = summary
+        # (service, operation) -> OperationStats
+        self.operations = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_options(cls, options: dict):
+        '''Get the instrumentation of the options, or None if it is disabled'''
+        options = options or {}
+        if not options.get('enabled', False):
+            return None
+        return cls(
+            path=options.get('path', 'cdk.out/discovery_report.json'),
+            summary=options.get('summary', False)
+        )
+
+    def install(self, clients: ClientFactory):
+        clients.add_hook(self.attach)
+        return self
+
+    def attach(self, client):
+        service = client.meta.service_model.service_name
+
+        def before_call(context, **kwargs):
+            context['instrumentation_started'] = time.perf_counter()
+
+        def needs_retry(response, attempts, request_dict, **kwargs):
+            # called after each attempt, whether it is retried or not
+            request_dict['context']['instrumentation_attempts'] = attempts
+            if response is not None:
+                http_response, parsed = response
+                if http_response.status_code == 429 or parsed.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+                    with self._lock:
+                        self.stats(service, request_dict['context']['instrumentation_operation']).throttles += 1
+
+        def before_parameter_build(model, context, **kwargs):
+            context['instrumentation_operation'] = model.name
+
+        def after_call(http_response, model, context, **kwargs):
+            self.record(service, model.name, context, failed=http_response.status_code >= 300)
+
+        def after_call_error(context, **kwargs):
+            self.record(service, context['instrumentation_operation'], context, failed=True)
+
+        client.meta.events.register('before-parameter-build', before_parameter_build)
+        # first, so that the time is measured even when a later handler
+        # answers the call (e.g. a replay)
+        client.meta.events.register_first('before-call', before_call)
+        client.meta.events.register_first('needs-retry', needs_retry)
+        client.meta.events.register('after-call', after_call)
+        client.meta.events.register('after-call-error', after_call_error)
+
+    def stats(self, service: str, operation: str):
+        key = (service, operation)
+        if key not in self.operations:
+            self.operations[key] = OperationStats()
+        return self.operations[key]
+
+    def record(self, service: str, operation: str, context: dict, failed: bool):
+        started = context.get('instrumentation_started')
+        elapsed = time.perf_counter() - started if started is not None else 0.0
+        with self._lock:
+            stats = self.stats(service, operation)
+            stats.calls += 1
+            stats.errors += int(failed)
+            stats.retries += context.get('instrumentation_attempts', 1) - 1
+            stats.latencies.append(elapsed)
+
+    def report(self):
+        '''Get the statistics of all the operations'''
+        with self._lock:
+            operations = [dict(service=service, operation=operation, **stats.report())
+                for (service, operation), stats in sorted(self.operations.items())]
+        return dict(
+            version=1,
+            wall_seconds=round(time.perf_counter() - self.started, 3),
+            totals=dict(
+                calls=sum(operation['calls'] for operation in operations),
+                errors=sum(operation['errors'] for operation in operations),
+                retries=sum(operation['retries'] for operation in operations),
+                throttles=sum(operation['throttles'] for operation in operations),
+            ),
+            operations=operations
+        )
+
+    def table(self, report: dict = None):
+        '''Format the report as a table, the slowest operations first'''
+        report = report or self.report()
+        header = ('service', 'operation', 'calls', 'errors', 'retries', 'throttles', 'p50 ms', 'p90 ms', 'p99 ms', 'total ms')
+        rows = [header]
+        for operation in sorted(report['operations'], key=lambda operation: -operation['latency_ms']['total']):
+            latency = operation['latency_ms']
+            rows.append((operation['service'], operation['operation'], operation['calls'], operation['errors'],
+                operation['retries'], operation['throttles'], latency['p50'], latency['p90'], latency['p99'], latency['total']))
+        totals = report['totals']
+        rows.append(('total', '', totals['calls'], totals['errors'], totals['retries'], totals['throttles'], '', '', '', ''))
+        widths = [max(len(str(row[i])) for row in rows) for i in range(len(header))]
+        return '\n'.join(
+            '  '.join(str(value).ljust(width) if i < 2 else str(value).rjust(width) for i, (value, width) in enumerate(zip(row, widths))).rstrip()
+            for row in rows
+        )
+
+    def save(self):
+        '''Write the JSON report, returning it'''
+        report = self.report()
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'w') as f:
+                json.dump(report, f, indent=1)
+        return report
@@ -0,0 +1,276 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from .models import Record
+
+def encode(resource):
+    '''JSON encoding of the values json cannot serialize: records and datetimes'''
+    if isinstance(resource, Record):
+        return resource.to_dict()
+    return str(resource)
+
+class InventoryStore():
+    '''
+    Local SQLite store of the discovered resources.
+
+    Each service module stores the result of its discovery calls (instances,
+    volumes, buckets, ...) indexed by service, region, tag key and tag values.
+    Later synths read them back until they are older than the TTL, and only
+    fall back on AWS on a miss, an expiry or when a refresh is forced.
+    A store without path is disabled: every fetch runs the discovery.
+    Enabled or not, the store keeps the snapshots of the current discovery
+    in memory, so that they can be fingerprinted.
+    '''
+
+    SCHEMA = [
+        '''CREATE TABLE IF NOT EXISTS snapshots (
+            service TEXT NOT NULL,
+            region TEXT NOT NULL,
+            tag_key TEXT NOT NULL,
+            tag_values TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            shape TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            PRIMARY KEY (service, region, tag_key, tag_values, kind)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS resources (
+            service TEXT NOT NULL,
+            region TEXT NOT NULL,
+            tag_key TEXT NOT NULL,
+            tag_values TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            resource_id TEXT,
+            payload TEXT NOT NULL
+        )''',
+        '''CREATE INDEX IF NOT EXISTS resources_by_snapshot
+            ON resources (service, region, tag_key, tag_values, kind)''',
+        '''CREATE INDEX IF NOT EXISTS resources_by_tag
+            ON resources (tag_key, tag_values, region)''',
+    ]
+
+    def __init__(self, path: str = None, ttl_minutes: float = 60, refresh: bool = False):
+        self.path = path
+        self.ttl = ttl_minutes * 60
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._connection = None
+        # snapshot key -> resources of the current discovery, stored or not
+        self._discovered = {}
+
+    @classmethod
+    def from_options(cls, options: dict, refresh: bool = False):
+        options = options or {}
+        if not options.get('enabled', False):
+            return cls()
+        return cls(
+            path=options.get('path', 'cdk.out/inventory.sqlite'),
+            ttl_minutes=options.get('ttl_minutes', 60),
+            refresh=refresh
+        )
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def connect(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # the connection is shared by the discovery threads, access is serialized by _lock
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            with self._connection:
+                for statement in self.SCHEMA:
+                    self._connection.execute(statement)
+        return self._connection
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def scope(self, service: str, region: str, tag: str, tag_values: list, account: str = None):
+        '''Get a view of the store limited to a service, region and tag, and to a member account if any'''
+        return InventoryScope(self, service, region, tag, tag_values, account)
+
+    @staticmethod
+    def snapshot_key(service: str, region: str, tag: str, tag_values: list, kind: str):
+        return (service, region, tag, json.dumps(sorted(tag_values)), kind)
+
+    def record(self, key: tuple, resources):
+        '''Keep the resources of a snapshot of the current discovery'''
+        with self._lock:
+            self._discovered[key] = resources
+
+    def discovered(self):
+        '''Get the (key, resources) of the snapshots of the current discovery, sorted by key'''
+        with self._lock:
+            return sorted(self._discovered.items(), key=lambda item: item[0])
+
+    def load(self, key: tuple):
+        '''Get the stored resources of a snapshot, or None on a miss or expiry'''
+        snapshot = self.load_snapshot(key)
+        return snapshot[0] if snapshot is not None else None
+
+    def load_snapshot(self, key: tuple):
+        '''Get the stored resources of a snapshot and the time they were fetched, or None on a miss or expiry'''
+        if not self.enabled or self.refresh:
+            return None
+        with self._lock:
+            connection = self.connect()
+            snapshot = connection.execute(
+                '''SELECT shape, fetched_at FROM snapshots
+                    WHERE service = ? AND region = ? AND tag_key = ? AND tag_values = ? AND kind = ?''',
+                key
+            ).fetchone()
+            if snapshot is None or time.time() - snapshot[1] >= self.ttl:
+                return None
+            rows = connection.execute(
+                '''SELECT resource_id, payload FROM resources
+                    WHERE service = ? AND region = ? AND tag_key = ? AND tag_values = ? AND kind = ?
+                    ORDER BY position''',
+                key
+            ).fetchall()
+        if snapshot[0] == 'dict':
+            return {resource_id: json.loads(payload) for resource_id, payload in rows}, snapshot[1]
+        return [json.loads(payload) for _, payload in rows], snapshot[1]
+
+    def save(self, key: tuple, resources, fetched_at: float = None):
+        '''Replace the stored resources of a snapshot'''
+        if not self.enabled:
+            return
+        if isinstance(resources, dict):
+            shape = 'dict'
+            rows = [(position, resource_id, json.dumps(resource, default=encode))
+                for position, (resource_id, resource) in enumerate(resources.items())]
+        else:
+            shape = 'list'
+            rows = [(position, None, json.dumps(resource, default=encode))
+                for position, resource in enumerate(resources)]
+        with self._lock:
+            connection = self.connect()
+            with connection:
+                connection.execute(
+                    '''DELETE FROM resources
+                        WHERE service = ? AND region = ? AND tag_key = ? AND tag_values = ? AND kind = ?''',
+                    key
+                )
+                connection.executemany(
+                    '''INSERT INTO resources (service, region, tag_key, tag_values, kind, position, resource_id, payload)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                    [key + row for row in rows]
+                )
+                connection.execute(
+                    '''INSERT OR REPLACE INTO snapshots (service, region, tag_key, tag_values, kind, shape, fetched_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                    key + (shape, fetched_at if fetched_at is not None else time.time())
+                )
+
+    def invalidate(self, service: str = None, region: str = None):
+        '''Expire the stored snapshots, optionally only those of a service and/or region'''
+        if not self.enabled:
+            return
+        conditions = []
+        params = []
+        if service is not None:
+            conditions.append('service = ?')
+            params.append(service)
+        if region is not None:
+            conditions.append('region = ?')
+            params.append(region)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        with self._lock:
+            connection = self.connect()
+            with connection:
+                connection.execute(f'DELETE FROM snapshots {where}', params)
+                connection.execute(f'DELETE FROM resources {where}', params)
+
+class InventoryScope():
+    '''View of an InventoryStore limited to a service, region and tag'''
+
+    def __init__(self, store: InventoryStore, service: str, region: str, tag: str, tag_values: list,
+            account: str = None):
+        self.store = store
+        self.service = service
+        self.region = region
+        self.account = account
+        # the snapshots of a member account are stored under <account>/<region>
+        self.location = region if account is None else f'{account}/{region}'
+        self.tag_name = tag
+        self.tag_values = tag_values
+        # once a kind is discovered from AWS, the following ones are discovered
+        # as well, so that the resources of a service come from the same pull
+        self.refreshed = False
+
+    @staticmethod
+    def decode(resources, record: type = None):
+        '''
+        Get the records of stored resources, None if they were not stored as
+        records of this type (e.g. raw responses stored by an older version)
+        '''
+        if record is None or resources is None:
+            return resources
+        try:
+            return record.decode(resources)
+        except (KeyError, TypeError, AttributeError):
+            return None
+
+    def fetch(self, kind: str, discover, record: type = None):
+        '''
+        Get the resources of kind from the store, or from discover() on a
+        miss. record is the Record class of the resources, if any.
+        '''
+        key = self.store.snapshot_key(self.service, self.location, self.tag_name, self.tag_values, kind)
+        if not self.refreshed:
+            resources = self.decode(self.store.load(key), record)
+            if resources is not None:
+                self.store.record(key, resources)
+                return resources
+        resources = discover()
+        self.refreshed = True
+        self.store.save(key, resources)
+        self.store.record(key, resources)
+        return resources
+
+    def update(self, kind: str, apply, record: type = None):
+        '''
+        Apply a change to the stored resources of kind, keeping the time they
+        were fetched. Returns False, leaving the store untouched, when there is
+        no fresh snapshot of kind to update.
+        '''
+        key = self.store.snapshot_key(self.service, self.location, self.tag_name, self.tag_values, kind)
+        snapshot = self.store.load_snapshot(key)
+        if snapshot is None:
+            return False
+        resources, fetched_at = snapshot
+        resources = self.decode(resources, record)
+        if resources is None:
+            return False
+        resources = apply(resources)
+        self.store.save(key, resources, fetched_at)
+        self.store.record(key, resources)
+        return True
+
+    def invalidate(self):
+        '''Expire all the stored snapshots of the service in the region'''
+        self.store.invalidate(self.service, self.location)
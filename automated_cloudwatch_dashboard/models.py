@@ -0,0 +1,87 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+
+'''
+Compact records of the discovered resources.
+
+The discovery projects the boto3 responses into slotted records holding only
+the fields read to build the widgets, so that the raw pages (block device
+mappings, network interfaces, security groups...) are released as soon as
+they are consumed. Records are stored in the inventory as plain dicts.
+'''
+
+class Record():
+    '''Base class of the records, a slotted object with the fields of __slots__'''
+
+    __slots__ = ()
+
+    def __init__(self, *values, **fields):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)})'
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, fields: dict):
+        return cls(**{name: fields[name] for name in cls.__slots__})
+
+    @classmethod
+    def decode(cls, resources):
+        '''Get the records of stored resources, a list of dicts or a dict of lists of dicts'''
+        if isinstance(resources, dict):
+            return {key: cls.decode(value) for key, value in resources.items()}
+        return [cls.from_dict(fields) for fields in resources]
+
+class Instance(Record):
+    '''EC2 instance'''
+
+    __slots__ = ('instance_id', 'instance_type', 'name')
+
+    @classmethod
+    def from_response(cls, instance: dict):
+        name = ''
+        for tag in instance.get('Tags', []):
+            if tag['Key'] == 'Name':
+                name = tag['Value']
+        return cls(instance['InstanceId'], instance['InstanceType'], name)
+
+class Volume(Record):
+    '''EBS volume'''
+
+    __slots__ = ('volume_id',)
+
+    @classmethod
+    def from_response(cls, volume: dict):
+        return cls(volume['VolumeId'])
+
+class AutoScalingGroup(Record):
+    '''AutoScaling group'''
+
+    __slots__ = ('name',)
+
+    @classmethod
+    def from_response(cls, as_group: dict):
+        return cls(as_group['AutoScalingGroupName'])
@@ -0,0 +1,147 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import json
+import os
+import threading
+import time
+from botocore.exceptions import BotoCoreError, ClientError
+from .pagination import paginate
+
+class NitroCatalog():
+    '''
+    Catalog of the hypervisor used by each EC2 instance type.
+
+    Lookups are resolved, in order, from the in-memory memo shared by all the
+    catalogs of the run, from the on-disk catalog (entries younger than the
+    TTL) and finally from batched describe_instance_types calls. Newly
+    resolved instance types are written back to the on-disk catalog, so that
+    later synths need no hypervisor API calls at all.
+    '''
+
+    VERSION = 1
+    # maximum number of instance types in a single describe_instance_types call
+    BATCH_SIZE = 100
+
+    _lock = threading.Lock()
+    # instance type -> hypervisor, shared by all the catalogs of the run
+    _memo = {}
+
+    def __init__(self, path: str = 'nitro_catalog.json', ttl_days: float = 30, offline: bool = False):
+        self.path = path
+        self.ttl = ttl_days * 24 * 3600
+        self.offline = offline
+
+    @classmethod
+    def from_options(cls, options: dict, persistent: bool = True):
+        '''
+        persistent=False gives a catalog resolved from the API only, with its
+        own memo, e.g. so that all the lookups are seen by a recording
+        '''
+        options = options or {}
+        catalog = cls(
+            path=options.get('path', 'nitro_catalog.json') if persistent else None,
+            ttl_days=options.get('ttl_days', 30),
+            offline=options.get('offline', False)
+        )
+        if not persistent:
+            catalog._memo = {}
+        return catalog
+
+    def load(self):
+        '''Load the on-disk catalog, returning instance type -> entry'''
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            catalog = json.load(f)
+        if catalog.get('version') != self.VERSION:
+            return {}
+        return catalog.get('instance_types', {})
+
+    def save(self, entries: dict):
+        '''Merge entries in the on-disk catalog'''
+        if not self.path:
+            return
+        instance_types = self.load()
+        instance_types.update(entries)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(version=self.VERSION, instance_types=instance_types), f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def describe(self, botoclient, instance_types: list):
+        '''Get the hypervisor of instance_types with batched describe_instance_types calls'''
+        hypervisors = {}
+        for i in range(0, len(instance_types), self.BATCH_SIZE):
+            for instance_type in paginate(botoclient, 'describe_instance_types', InstanceTypes=instance_types[i:i + self.BATCH_SIZE]):
+                # bare metal instance types have no hypervisor
+                hypervisors[instance_type['InstanceType']] = instance_type.get('Hypervisor', '')
+        return hypervisors
+
+    def lookup(self, botoclient, instance_types: list):
+        '''Check which of instance_types run on Nitro hypervisor, returning instance type -> bool'''
+        # the lock guards the memo and the on-disk catalog, the API calls are
+        # made without it so that they do not serialize the discoveries
+        with self._lock:
+            missing = sorted(set(instance_types) - set(self._memo))
+            stale = self._load(missing) if missing else {}
+            missing = [instance_type for instance_type in missing if instance_type not in self._memo]
+        if missing:
+            self._resolve(botoclient, missing, stale)
+        with self._lock:
+            return {instance_type: self._memo[instance_type] == 'nitro' for instance_type in instance_types}
+
+    def _load(self, instance_types: list):
+        '''Memoize the entries of instance_types younger than the TTL, returning the hypervisor of the expired ones'''
+        now = time.time()
+        catalog = self.load()
+        stale = {}
+        for instance_type in instance_types:
+            entry = catalog.get(instance_type)
+            if entry is not None and now - entry['updated'] < self.ttl:
+                self._memo[instance_type] = entry['hypervisor']
+            elif entry is not None:
+                stale[instance_type] = entry['hypervisor']
+        return stale
+
+    def _resolve(self, botoclient, instance_types: list, stale: dict):
+        now = time.time()
+        if self.offline:
+            hypervisors = {}
+        else:
+            try:
+                hypervisors = self.describe(botoclient, instance_types)
+            except (BotoCoreError, ClientError):
+                # without network access (or permissions) fall back on the
+                # expired entries of the catalog, if there is any
+                if set(instance_types) - set(stale):
+                    raise
+                hypervisors = {}
+
+        with self._lock:
+            if hypervisors:
+                self.save({instance_type: dict(hypervisor=hypervisor, updated=now)
+                    for instance_type, hypervisor in hypervisors.items()})
+            for instance_type in instance_types:
+                if instance_type in hypervisors:
+                    self._memo[instance_type] = hypervisors[instance_type]
+                elif instance_type in stale:
+                    self._memo[instance_type] = stale[instance_type]
+                else:
+                    raise KeyError(f'Instance type {instance_type} is not in the Nitro catalog {self.path}')
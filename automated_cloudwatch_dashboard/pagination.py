@@ -0,0 +1,100 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+'''
+Streaming discovery layer built on the botocore paginators.
+
+paginate() yields the resources of a paginated operation one by one, as the
+pages are received, requesting the maximum page size of the operation. With
+prefetch, the next pages are fetched by a background thread while the
+resources of the current page are consumed.
+'''
+
+import queue
+import threading
+
+# maximum page size accepted by each paginated operation
+MAX_PAGE_SIZES = {
+    ('ec2', 'describe_instances'): 1000,
+    ('ec2', 'describe_volumes'): 500,
+    ('autoscaling', 'describe_auto_scaling_groups'): 100,
+    ('resourcegroupstaggingapi', 'get_resources'): 100,
+    ('elbv2', 'describe_target_groups'): 400,
+    ('outposts', 'list_outposts'): 1000,
+    ('outposts', 'get_outpost_instance_types'): 1000,
+}
+
+# number of pages fetched ahead of the consumer when prefetching
+PREFETCH_PAGES = 2
+
+def pages(client, operation: str, page_size: int = None, **params):
+    '''Yield the pages of operation, at page_size (by default the maximum page size of the operation)'''
+    paginator = client.get_paginator(operation)
+    size = page_size or MAX_PAGE_SIZES.get((client.meta.service_model.service_name, operation))
+    config = dict(PageSize=size) if size else {}
+    yield from paginator.paginate(PaginationConfig=config, **params)
+
+def prefetched(iterator, depth: int = PREFETCH_PAGES):
+    '''Consume iterator in a background thread, up to depth items ahead of the caller'''
+    items = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+
+    def put(item, error=None):
+        # give up once the caller stopped consuming
+        while not stop.is_set():
+            try:
+                items.put((item, error), timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fetch():
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(done)
+        except BaseException as error:
+            put(done, error)
+
+    thread = threading.Thread(target=fetch, name='prefetch', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # the caller stopped early: let the thread exit
+        stop.set()
+
+def paginate(client, operation: str, result_key: str = None, page_size: int = None, prefetch: bool = False, **params):
+    '''
+    Yield the resources of operation, page after page. result_key defaults
+    to the result key of the paginator of the operation.
+    '''
+    if result_key is None:
+        result_key = client.get_paginator(operation).result_keys[0].expression
+    iterator = pages(client, operation, page_size, **params)
+    if prefetch:
+        iterator = prefetched(iterator)
+    for page in iterator:
+        yield from page.get(result_key, [])
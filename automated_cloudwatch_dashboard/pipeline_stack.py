@@ -16,24 +16,69 @@
 
 from constructs import Construct
 from aws_cdk import (
+    Aws,
+    BundlingOptions,
+    ILocalBundling,
     Stack,
     aws_codecommit as codecommit,
     pipelines as pipelines,
     aws_iam as iam,
+    aws_s3 as s3,
     aws_s3_assets as s3_assets,
+    aws_sqs as sqs,
+    aws_codebuild as codebuild,
+    aws_lambda as lambda_,
     Duration,
 )
 from omegaconf import OmegaConf
 import aws_cdk.aws_events_targets as targets
 import aws_cdk.aws_events as events
+import aws_cdk.aws_lambda_event_sources as event_sources
+from .fingerprint import parameter_name
 from .pipeline_stage import AutomatedCloudWatchDashboardDeployStage
 from cdk_nag import NagSuppressions
+import jsii
+import os
+import shutil
+import subprocess
+import sys
+
+@jsii.implements(ILocalBundling)
+class UpdaterBundling():
+    '''Bundle the updater function with the local pip, falling back on Docker when it fails'''
+
+    # dependencies of the updater function missing from the Lambda runtime,
+    # pinned to the versions of requirements.txt the synth installs
+    REQUIREMENTS = ["omegaconf==2.4.0"]
+
+    @classmethod
+    def commands(cls, output_dir: str):
+        return [
+            f"pip install --quiet --target {output_dir} {' '.join(cls.REQUIREMENTS)}",
+            f"cp -r automated_cloudwatch_dashboard config.yaml {output_dir}",
+            f"if [ -f nitro_catalog.json ]; then cp nitro_catalog.json {output_dir}; fi",
+        ]
+
+    def try_bundle(self, output_dir: str, *args, **kwargs):
+        try:
+            subprocess.run([sys.executable, "-m", "pip", "install", "--quiet", "--target", output_dir] + self.REQUIREMENTS,
+                check=True)
+        except (OSError, subprocess.CalledProcessError):
+            return False
+        shutil.copytree("automated_cloudwatch_dashboard", os.path.join(output_dir, "automated_cloudwatch_dashboard"),
+            ignore=shutil.ignore_patterns("__pycache__"), dirs_exist_ok=True)
+        for path in ("config.yaml", "nitro_catalog.json"):
+            if os.path.isfile(path):
+                shutil.copy(path, output_dir)
+        return True
 
 class AutomatedCloudWatchDashboardPipeline(Stack):
 
     def __init__(self, scope: Construct, id: str, **kwargs) -> None:
         super().__init__(scope, id, **kwargs)
 
+        conf = OmegaConf.load("config.yaml")
+
         # prepare the asset which contains the repo code
         code_asset = s3_assets.Asset(self, "ChartAsset",
                         path="./",
@@ -47,6 +92,127 @@ class AutomatedCloudWatchDashboardPipeline(Stack):
                 code = codecommit.Code.from_asset(code_asset, "master")
         )
 
+        synth_commands = [
+            "pip install -r requirements.txt",  # Instructs Codebuild to install required packages
+            "npm install -g aws-cdk",  # Installs the cdk cli on Codebuild
+            "cdk synth",
+        ]
+        synth_env = {}
+        synth_code_build_defaults = None
+        synth_cache = None
+        synth_build_spec = None
+        synth_policy = []
+
+        # In incremental mode the tag change events are queued, and applied to
+        # the inventory store before the synth, so that only the services of
+        # the changed resources are discovered again. The inventory store is
+        # kept across the pipeline runs in the CodeBuild cache.
+        incremental = OmegaConf.select(conf, 'incremental.enabled', default=False)
+        if incremental:
+            tag_change_queue = sqs.Queue(self, "TagChangeQueue",
+                encryption=sqs.QueueEncryption.SQS_MANAGED,
+                enforce_ssl=True,
+                retention_period=Duration.days(14)
+            )
+            cache_bucket = s3.Bucket(self, "SynthCacheBucket",
+                encryption=s3.BucketEncryption.S3_MANAGED,
+                block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+                enforce_ssl=True
+            )
+            synth_commands.insert(1, "python -m automated_cloudwatch_dashboard.incremental --queue-url $TAG_CHANGE_QUEUE_URL")
+            synth_env["TAG_CHANGE_QUEUE_URL"] = tag_change_queue.queue_url
+            synth_cache = codebuild.Cache.bucket(cache_bucket)
+            synth_build_spec = codebuild.BuildSpec.from_object({
+                "cache": {
+                    "paths": [OmegaConf.select(conf, 'inventory.path', default='cdk.out/inventory.sqlite')]
+                }
+            })
+            synth_policy.append(
+                iam.PolicyStatement(
+                    actions=["sqs:ReceiveMessage",
+                            "sqs:DeleteMessage",
+                            "sqs:ChangeMessageVisibility",
+                            "sqs:GetQueueAttributes"
+                    ],
+                    resources=[tag_change_queue.queue_arn],
+                    effect=iam.Effect.ALLOW
+                )
+            )
+
+        # When the fingerprint of the discovered inventory, configuration and
+        # code matches the one deployed with the dashboards, the synth step
+        # stops the pipeline execution instead of synthesizing the dashboards.
+        # The check only needs the python requirements: the CDK CLI is
+        # installed when the dashboards must be synthesized
+        if OmegaConf.select(conf, 'fingerprint.enabled', default=False):
+            synth_commands[-2:] = ["python -m automated_cloudwatch_dashboard.fingerprint --stop-execution \"$PIPELINE_EXECUTION_ID\""
+                " || (npm install -g aws-cdk && cdk synth)"]
+            # resolved by CodePipeline in the environment of the synth action
+            synth_env["PIPELINE_EXECUTION_ID"] = "#{codepipeline.PipelineExecutionId}"
+            synth_policy.extend([
+                iam.PolicyStatement(
+                    actions=["ssm:GetParameter"],
+                    resources=[f"arn:{Aws.PARTITION}:ssm:{Aws.REGION}:{Aws.ACCOUNT_ID}:parameter/{parameter_name(conf).lstrip('/')}"],
+                    effect=iam.Effect.ALLOW
+                ),
+                iam.PolicyStatement(
+                    actions=["codepipeline:GetPipelineState",
+                            "codepipeline:StopPipelineExecution"
+                    ],
+                    resources=[f"arn:{Aws.PARTITION}:codepipeline:{Aws.REGION}:{Aws.ACCOUNT_ID}:*"],
+                    effect=iam.Effect.ALLOW
+                )
+            ])
+
+        if synth_policy:
+            synth_code_build_defaults = pipelines.CodeBuildOptions(
+                cache=synth_cache,
+                partial_build_spec=synth_build_spec,
+                role_policy=synth_policy
+            )
+
+        # the discovery of the member accounts assumes a role in each of them
+        member_accounts = [str(account) for account in OmegaConf.select(conf, 'accounts.ids', default=None) or []]
+        member_role = OmegaConf.select(conf, 'accounts.role_name', default='AutomatedCloudWatchDashboardDiscovery')
+        member_policy = [
+            iam.PolicyStatement(
+                actions=["sts:AssumeRole"],
+                resources=[f"arn:{Aws.PARTITION}:iam::{account}:role/{member_role}" for account in member_accounts],
+                effect=iam.Effect.ALLOW
+            )
+        ] if member_accounts else []
+
+        # read permissions of the discovery
+        discovery_policy = [
+            iam.PolicyStatement(
+                actions=["ec2:DescribeAvailabilityZones",
+                        "ec2:DescribeInstanceAttribute",
+                        "ec2:DescribeInstanceTypes",
+                        "ec2:DescribeInstances",
+                        "ec2:DescribeNetworkInterfaces",
+                        "ec2:DescribeNetworkInterfaceAttribute",
+                        "ec2:DescribeVolumes",
+                        "elasticloadbalancing:DescribeLoadBalancers",
+                        "elasticloadbalancing:DescribeTargetGroups",
+                        "autoscaling:DescribeAutoScalingGroups",
+                        "s3:GetBucketTagging",
+                        "s3:ListBucket",
+                        "s3-outposts:GetObjectTagging",
+                        "s3-outposts:ListBucket",
+                        "rds:DescribeDBInstances",
+                        "rds:ListTagsForResource",
+                        "tag:GetResources",
+                        "tag:GetTagKeys",
+                        "tag:GetTagValues",
+                        "outposts:ListOutposts",
+                        "outposts:GetOutpost",
+                        "outposts:GetOutpostInstanceTypes"
+                ],
+                resources=["*"],
+                effect=iam.Effect.ALLOW
+            )
+        ] + member_policy
+
         # create the pipeline in CodePipeline
         pipeline = pipelines.CodePipeline(
             self,
@@ -54,44 +220,15 @@ class AutomatedCloudWatchDashboardPipeline(Stack):
             synth=pipelines.ShellStep(
                 "Synth",
                 input=pipelines.CodePipelineSource.code_commit(repo, "master"),
-                commands=[
-                    "npm install -g aws-cdk",  # Installs the cdk cli on Codebuild
-                    "pip install -r requirements.txt",  # Instructs Codebuild to install required packages
-                    "cdk synth",
-                ],            
+                commands=synth_commands,
+                env=synth_env,
             ),
+            synth_code_build_defaults=synth_code_build_defaults,
             use_change_sets=False,
             # Defaults for all CodeBuild projects
             code_build_defaults=pipelines.CodeBuildOptions(
             # Additional policy statements for the execution role
-                role_policy=[
-                    iam.PolicyStatement(
-                        actions=["ec2:DescribeAvailabilityZones",
-                                "ec2:DescribeInstanceAttribute",
-                                "ec2:DescribeInstanceTypes",
-                                "ec2:DescribeInstances",
-                                "ec2:DescribeNetworkInterfaces",
-                                "ec2:DescribeNetworkInterfaceAttribute",
-                                "ec2:DescribeVolumes",
-                                "elasticloadbalancing:DescribeLoadBalancers",
-                                "autoscaling:DescribeAutoScalingGroups",
-                                "s3:GetBucketTagging",
-                                "s3:ListBucket",
-                                "s3-outposts:GetObjectTagging",
-                                "s3-outposts:ListBucket",
-                                "rds:DescribeDBInstances",
-                                "rds:ListTagsForResource",
-                                "tag:GetResources",
-                                "tag:GetTagKeys",
-                                "tag:GetTagValues",
-                                "outposts:ListOutposts",
-                                "outposts:GetOutpost",
-                                "outposts:GetOutpostInstanceTypes"
-                        ],
-                        resources=["*"],
-                        effect=iam.Effect.ALLOW
-                    )
-                ]
+                role_policy=discovery_policy
             ),
         )
 
@@ -140,8 +277,6 @@ class AutomatedCloudWatchDashboardPipeline(Stack):
             }
         }
         '''
-        conf = OmegaConf.load("config.yaml")
-
         rule = events.Rule(self, "EventRule",
             event_pattern=events.EventPattern(
                 source = ["aws.tag"],
@@ -151,7 +286,170 @@ class AutomatedCloudWatchDashboardPipeline(Stack):
                 }
             )
         )
-        # add_target accepts as input only CodePipeline objects from 
-        # CodePipeline core lib. note that here we use pipelines lib
-        rule.add_target(targets.CodePipeline(pipeline.pipeline))
+        # With direct_update enabled, the events are queued for a function
+        # which puts the dashboards in seconds, instead of starting the
+        # pipeline. The pipeline still deploys the changes of the code and
+        # configuration
+        direct_update = OmegaConf.select(conf, 'direct_update.enabled', default=False)
+        debounce = OmegaConf.select(conf, 'debounce.enabled', default=False) and not direct_update
+        if direct_update:
+            update_timeout = OmegaConf.select(conf, 'direct_update.timeout_seconds', default=300)
+            update_queue = sqs.Queue(self, "UpdateQueue",
+                encryption=sqs.QueueEncryption.SQS_MANAGED,
+                enforce_ssl=True,
+                retention_period=Duration.days(1),
+                # at least 6 times the timeout of the function, as recommended for the SQS event sources
+                visibility_timeout=Duration.seconds(6 * update_timeout)
+            )
+            updater_function = lambda_.Function(self, "UpdaterFunction",
+                runtime=lambda_.Runtime.PYTHON_3_13,
+                handler="automated_cloudwatch_dashboard.updater.handler",
+                # the service modules and the configuration, with omegaconf but without aws_cdk
+                code=lambda_.Code.from_asset("./",
+                    exclude=["cdk.out", ".venv", ".git"],
+                    bundling=BundlingOptions(
+                        image=lambda_.Runtime.PYTHON_3_13.bundling_image,
+                        command=["bash", "-c", " && ".join(UpdaterBundling.commands("/asset-output"))],
+                        local=UpdaterBundling()
+                    )
+                ),
+                timeout=Duration.seconds(update_timeout),
+                memory_size=OmegaConf.select(conf, 'direct_update.memory_size', default=1024),
+                # a single update at a time puts the dashboards
+                reserved_concurrent_executions=1
+            )
+            # the events of a burst are delivered in a single batch, running a
+            # single update. The events of a throttled batch stay in the queue
+            update_queue.grant_consume_messages(updater_function)
+            updater_function.add_event_source(event_sources.SqsEventSource(update_queue,
+                batch_size=10000,
+                max_batching_window=Duration.seconds(OmegaConf.select(conf, 'direct_update.batch_window_seconds', default=60))
+            ))
+            for statement in discovery_policy:
+                updater_function.add_to_role_policy(statement)
+            updater_function.add_to_role_policy(iam.PolicyStatement(
+                actions=["cloudwatch:PutDashboard",
+                        "cloudwatch:DeleteDashboards"
+                ],
+                resources=[f"arn:{Aws.PARTITION}:cloudwatch::{Aws.ACCOUNT_ID}:dashboard/{conf.dashboard_name or 'Automated-CloudWatch-Dashboard'}*"],
+                effect=iam.Effect.ALLOW
+            ))
+            updater_function.add_to_role_policy(iam.PolicyStatement(
+                actions=["cloudwatch:ListDashboards"],
+                resources=["*"],
+                effect=iam.Effect.ALLOW
+            ))
+            rule.add_target(targets.SqsQueue(update_queue))
+
+            NagSuppressions.add_resource_suppressions(update_queue, [
+                dict(
+                    id = 'AwsSolutions-SQS3', 
+                    reason = 'Each batch runs a full update, the events of a failed batch are superseded by the next one' 
+                )
+                ],
+            );
+
+            NagSuppressions.add_resource_suppressions(updater_function, [
+                dict(
+                    id = 'AwsSolutions-IAM4', 
+                    reason = 'The updater function only needs the basic execution role to write its logs' 
+                ),
+                dict(
+                    id = 'AwsSolutions-IAM5', 
+                    reason = 'The discovery reads the tagged resources of any name, the dashboards are those named after the configuration' 
+                ),
+                dict(
+                    id = 'AwsSolutions-L1', 
+                    reason = 'The runtime of the updater function is updated with the repository' 
+                )
+                ],
+                apply_to_children=True
+            );
+
+        # With debounce enabled, the events are queued, and a function run
+        # every minute starts the pipeline once per burst of events
+        if debounce:
+            debounce_queue = sqs.Queue(self, "DebounceQueue",
+                encryption=sqs.QueueEncryption.SQS_MANAGED,
+                enforce_ssl=True,
+                retention_period=Duration.days(1)
+            )
+            debounce_function = lambda_.Function(self, "DebounceFunction",
+                runtime=lambda_.Runtime.PYTHON_3_13,
+                handler="debounce.handler",
+                # the function only needs the debounce module
+                code=lambda_.Code.from_asset(os.path.dirname(__file__), exclude=["*", "!debounce.py"]),
+                timeout=Duration.seconds(60),
+                # a single run at a time drains the queue
+                reserved_concurrent_executions=1,
+                environment={
+                    "QUEUE_URL": debounce_queue.queue_url,
+                    "PIPELINE_NAME": pipeline.pipeline.pipeline_name,
+                    "QUIET_SECONDS": str(OmegaConf.select(conf, 'debounce.quiet_seconds', default=120)),
+                    "MAX_WAIT_SECONDS": str(OmegaConf.select(conf, 'debounce.max_wait_seconds', default=900)),
+                    # in incremental mode, the coalesced events are forwarded to the synth step
+                    "FORWARD_QUEUE_URL": tag_change_queue.queue_url if incremental else "",
+                }
+            )
+            debounce_queue.grant_consume_messages(debounce_function)
+            if incremental:
+                tag_change_queue.grant_send_messages(debounce_function)
+            debounce_function.add_to_role_policy(iam.PolicyStatement(
+                actions=["codepipeline:StartPipelineExecution"],
+                resources=[pipeline.pipeline.pipeline_arn],
+                effect=iam.Effect.ALLOW
+            ))
+            rule.add_target(targets.SqsQueue(debounce_queue))
+            events.Rule(self, "DebounceSchedule",
+                schedule=events.Schedule.rate(Duration.minutes(1)),
+                targets=[targets.LambdaFunction(debounce_function)]
+            )
+
+            NagSuppressions.add_resource_suppressions(debounce_queue, [
+                dict(
+                    id = 'AwsSolutions-SQS3', 
+                    reason = 'The queue is drained by the debounce function, the events of a failed run are received again by the next one' 
+                )
+                ],
+            );
+
+            NagSuppressions.add_resource_suppressions(debounce_function, [
+                dict(
+                    id = 'AwsSolutions-IAM4', 
+                    reason = 'The debounce function only needs the basic execution role to write its logs' 
+                ),
+                dict(
+                    id = 'AwsSolutions-L1', 
+                    reason = 'The debounce function only depends on boto3, the runtime is updated with the repository' 
+                )
+                ],
+                apply_to_children=True
+            );
+        elif not direct_update:
+            # add_target accepts as input only CodePipeline objects from 
+            # CodePipeline core lib. note that here we use pipelines lib
+            rule.add_target(targets.CodePipeline(pipeline.pipeline))
+
+        if incremental:
+            # the events are queued before the pipeline starts, the synth
+            # step drains the queue. With debounce, the debounce function
+            # forwards them
+            if not debounce and not direct_update:
+                rule.add_target(targets.SqsQueue(tag_change_queue))
+
+            NagSuppressions.add_resource_suppressions(tag_change_queue, [
+                dict(
+                    id = 'AwsSolutions-SQS3', 
+                    reason = 'The queue is drained by the synth step of the pipeline, a message that cannot be applied is superseded by the next full discovery' 
+                )
+                ],
+            );
+
+            NagSuppressions.add_resource_suppressions(cache_bucket, [
+                dict(
+                    id = 'AwsSolutions-S1', 
+                    reason = 'The bucket only holds the CodeBuild cache of the synth step' 
+                )
+                ],
+            );
 
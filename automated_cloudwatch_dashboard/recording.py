@@ -0,0 +1,174 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+'''
+Record and replay of the AWS calls made during the discovery.
+
+In record mode every response received by the clients of a ClientFactory is
+captured in a versioned JSON fixture. In replay mode the responses of the
+fixture are fed back through botocore, in place of the HTTP requests, so that
+the stack can be synthesized without credentials or network access:
+
+    cdk synth -c record=fixtures/discovery.json
+    cdk synth -c replay=fixtures/discovery.json
+'''
+
+import base64
+import datetime
+import json
+import os
+import threading
+from collections import defaultdict
+from .clients import ClientFactory, account_of
+
+VERSION = 1
+
+def encode(value):
+    '''json.dump hook for the types found in the parsed responses'''
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, bytes):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def decode(value: dict):
+    '''json.load hook, reverse of encode'''
+    if '__datetime__' in value:
+        return datetime.datetime.fromisoformat(value['__datetime__'])
+    if '__bytes__' in value:
+        return base64.b64decode(value['__bytes__'])
+    return value
+
+def call_key(client, operation: str, params: dict):
+    '''
+    Key identifying a call: service, region, operation, canonical parameters
+    and member account (None for the account of the session credentials)
+    '''
+    return (
+        client.meta.service_model.service_name,
+        client.meta.region_name,
+        operation,
+        json.dumps(params, sort_keys=True, default=encode),
+        account_of(client)
+    )
+
+def fixture_key(call: dict):
+    '''Key of a call of a fixture, see call_key()'''
+    return (call['service'], call['region'], call['operation'],
+        json.dumps(call['params'], sort_keys=True, default=encode), call.get('account'))
+
+class ReplayMissError(Exception):
+    '''Raised in replay mode for a call that is not in the fixture'''
+
+class Recorder():
+    '''Capture the responses of all the calls made by the clients of a ClientFactory'''
+
+    def __init__(self, path: str):
+        self.path = path
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def install(self, clients: ClientFactory):
+        clients.hermetic = True
+        clients.add_hook(self.attach)
+        return self
+
+    def attach(self, client):
+        # the parameters of the call are only available before they are
+        # serialized, they are kept in the request context until the response
+        def before_parameter_build(params, model, context, **kwargs):
+            context['recording_key'] = call_key(client, model.name, params)
+
+        def after_call(http_response, parsed, model, context, **kwargs):
+            response = {key: value for key, value in parsed.items() if key != 'ResponseMetadata'}
+            service, region, operation, params, account = context['recording_key']
+            call = dict(
+                service=service,
+                region=region,
+                operation=operation,
+                params=json.loads(params, object_hook=decode),
+                status_code=http_response.status_code,
+                response=response
+            )
+            # only the calls of the member accounts are qualified by their account
+            if account is not None:
+                call['account'] = account
+            with self._lock:
+                self.calls.append(call)
+
+        client.meta.events.register('before-parameter-build', before_parameter_build)
+        client.meta.events.register('after-call', after_call)
+
+    def save(self):
+        '''Write the fixture, sorting the calls so that the file is stable across runs'''
+        with self._lock:
+            calls = sorted(self.calls, key=lambda call: fixture_key(call)[:4] + (call.get('account') or '',))
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(dict(version=VERSION, calls=calls), f, indent=1, sort_keys=True, default=encode)
+
+class ReplayedResponse():
+    '''Stand-in for the HTTP response of a replayed call'''
+
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.headers = {}
+        self.content = b''
+        self.raw = None
+
+class Replayer():
+    '''Feed the responses of a fixture back to the clients of a ClientFactory'''
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path) as f:
+            fixture = json.load(f, object_hook=decode)
+        if fixture.get('version') != VERSION:
+            raise ValueError(f'Unsupported fixture version {fixture.get("version")} in {path}')
+        self.responses = defaultdict(list)
+        for call in fixture['calls']:
+            self.responses[fixture_key(call)].append(call)
+        # number of times each key was replayed
+        self.replayed = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def install(self, clients: ClientFactory):
+        clients.hermetic = True
+        clients.add_hook(self.attach)
+        return self
+
+    def attach(self, client):
+        def before_parameter_build(params, model, context, **kwargs):
+            context['replay_key'] = call_key(client, model.name, params)
+
+        def before_call(model, context, **kwargs):
+            key = context['replay_key']
+            with self._lock:
+                calls = self.responses.get(key)
+                if not calls:
+                    raise ReplayMissError(f'No recorded response for {key[0]}.{key[2]} in {key[1]}'
+                        + (f' of account {key[4]}' if key[4] else '') + f' with {key[3]}')
+                # identical calls get the recorded responses in order, then the last one
+                call = calls[min(self.replayed[key], len(calls) - 1)]
+                self.replayed[key] += 1
+            response = dict(call['response'])
+            response['ResponseMetadata'] = dict(HTTPStatusCode=call['status_code'], HTTPHeaders={}, RetryAttempts=0)
+            return ReplayedResponse(call['status_code']), response
+
+        client.meta.events.register('before-parameter-build', before_parameter_build)
+        client.meta.events.register('before-call', before_call)
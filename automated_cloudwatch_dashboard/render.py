@@ -0,0 +1,410 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+'''
+Rendering of the dashboard bodies in Python.
+
+The classes of this module mirror the subset of aws_cdk and
+aws_cdk.aws_cloudwatch used to build the widgets (Duration, Metric,
+MathExpression, GraphWidget, TextWidget, Row, Column and the enums of their
+properties), with the same signatures, and render the same JSON as the CDK
+constructs. The widgets are plain Python objects, so building and rendering
+them does not go through the jsii runtime: the body of each dashboard is
+handed at once to a CfnDashboard, written to a file to be previewed, or put
+by the updater function, where aws_cdk is not installed.
+'''
+
+import json
+import re
+try:
+    import aws_cdk as cdk
+except ImportError:
+    cdk = None
+
+# width of the grid of a dashboard
+GRID_WIDTH = 24
+# period of the metrics, in seconds, when none is given
+DEFAULT_PERIOD = 300
+DEFAULT_STATISTIC = 'Average'
+SIMPLE_STATISTICS = ('Average', 'Maximum', 'Minimum', 'Sum', 'SampleCount')
+
+# region of the stack, a token rendered as {"Ref": "AWS::Region"}, or a
+# placeholder replaced by to_json_string without aws_cdk
+REGION = cdk.Aws.REGION if cdk is not None else '${AWS::Region}'
+
+def enum_value(value):
+    '''
+    JSON value of an enum of this module or of aws_cdk.aws_cloudwatch, the
+    latter being given by default arguments evaluated at import, e.g.
+    LegendPosition.RIGHT or GraphWidgetView.TIME_SERIES
+    '''
+    if value is None or isinstance(value, str):
+        return value
+    first, *others = value.name.lower().split('_')
+    return first + ''.join(other.capitalize() for other in others)
+
+def defined(**properties):
+    '''Properties which are not None, in order, as JSON.stringify drops undefined values'''
+    return {name: value for name, value in properties.items() if value is not None}
+
+class LegendPosition():
+    BOTTOM = 'bottom'
+    RIGHT = 'right'
+    HIDDEN = 'hidden'
+
+class GraphWidgetView():
+    TIME_SERIES = 'timeSeries'
+    BAR = 'bar'
+    PIE = 'pie'
+
+class PeriodOverride():
+    AUTO = 'auto'
+    INHERIT = 'inherit'
+
+class Duration():
+    '''Length of time, see aws_cdk.Duration'''
+
+    def __init__(self, seconds: int):
+        self._seconds = seconds
+
+    @staticmethod
+    def seconds(amount: int):
+        return Duration(amount)
+
+    @staticmethod
+    def minutes(amount: int):
+        return Duration(amount * 60)
+
+    @staticmethod
+    def hours(amount: int):
+        return Duration(amount * 3600)
+
+    @staticmethod
+    def days(amount: int):
+        return Duration(amount * 86400)
+
+    def to_seconds(self):
+        return self._seconds
+
+def seconds(period):
+    '''Seconds of a Duration of this module or of aws_cdk'''
+    return DEFAULT_PERIOD if period is None else int(period.to_seconds())
+
+class Metric():
+    '''Metric of a namespace, see aws_cdk.aws_cloudwatch.Metric'''
+
+    def __init__(self, namespace: str, metric_name: str, dimensions_map: dict = None, statistic: str = None,
+            period: Duration = None, label: str = None, color: str = None, account: str = None,
+            region: str = None, id: str = None, visible: bool = None):
+        self.namespace = namespace
+        self.metric_name = metric_name
+        self.dimensions_map = dimensions_map or {}
+        self.statistic = self.normalize(statistic or DEFAULT_STATISTIC)
+        self.period = seconds(period)
+        self.label = label
+        self.color = color
+        self.account = account
+        self.region = region
+        self.id = id
+        self.visible = visible
+
+    @staticmethod
+    def normalize(statistic: str):
+        for simple in SIMPLE_STATISTICS:
+            if statistic.lower() == simple.lower():
+                return simple
+        if re.match(r'^[a-z]+\d+(\.\d+)?$', statistic, re.IGNORECASE):
+            # percentiles and their likes, e.g. p99
+            return statistic.lower()
+        return statistic
+
+    def with_period(self, period: int):
+        if period == self.period:
+            return self
+        metric = Metric(self.namespace, self.metric_name, self.dimensions_map, self.statistic, None,
+            self.label, self.color, self.account, self.region, self.id, self.visible)
+        metric.period = period
+        return metric
+
+    def dimensions(self):
+        return sorted(self.dimensions_map.items())
+
+    def key(self):
+        parts = [self.namespace, self.metric_name]
+        for name, value in self.dimensions():
+            parts.append(f'{name}={value}')
+        parts += [self.statistic, str(self.period)]
+        if self.region:
+            parts.append(self.region)
+        if self.account:
+            parts.append(self.account)
+        return '|'.join(parts)
+
+    def graph_json(self, options: dict):
+        '''Namespace, name, dimensions and options of the metric in a graph'''
+        rendered = [self.namespace, self.metric_name]
+        for name, value in self.dimensions():
+            rendered += [name, value]
+        options.update(color=self.color, label=self.label, id=self.id, visible=self.visible)
+        if self.account:
+            options['accountId'] = self.account
+        if self.region:
+            options['region'] = self.region
+        if self.period != DEFAULT_PERIOD:
+            options['period'] = self.period
+        if self.statistic != DEFAULT_STATISTIC:
+            options['stat'] = self.statistic
+        return rendered
+
+    def __str__(self):
+        return self.label or self.metric_name
+
+class MathExpression():
+    '''Metric math expression, see aws_cdk.aws_cloudwatch.MathExpression'''
+
+    def __init__(self, expression: str, using_metrics: dict = None, label: str = None, color: str = None,
+            period: Duration = None):
+        self.expression = expression
+        self.label = label
+        self.color = color
+        self.period = seconds(period)
+        # the period of the expression applies to its metrics
+        self.using_metrics = {metric_id: metric.with_period(self.period)
+            for metric_id, metric in (using_metrics or {}).items()}
+
+    def with_period(self, period: int):
+        if period == self.period:
+            return self
+        return MathExpression(self.expression, self.using_metrics, self.label, self.color, Duration(period))
+
+    def key(self):
+        parts = [self.expression]
+        for metric_id, metric in sorted(self.using_metrics.items()):
+            parts += [metric_id, metric.key()]
+        return '|'.join(parts)
+
+    def graph_json(self, options: dict):
+        options.update(label=self.label, color=self.color, expression=self.expression)
+        if self.period != DEFAULT_PERIOD:
+            options['period'] = self.period
+        return []
+
+    def __str__(self):
+        return self.label or self.expression
+
+class MetricSet():
+    '''
+    Metrics of a graph and the metrics they use, each once, see
+    allMetricsGraphJson in aws_cdk.aws_cloudwatch
+    '''
+
+    def __init__(self):
+        # [metric, tag, id] in order of addition
+        self.entries = []
+        self.by_key = {}
+        self.by_id = {}
+
+    def add(self, metric, tag: str = None, metric_id: str = None):
+        key = metric.key()
+        entry = None
+        if metric_id:
+            entry = self.by_id.get(metric_id)
+            if entry and entry[0].key() != key:
+                raise ValueError(f'Cannot have two different metrics share the same id ({metric_id}) in one graph')
+        if not entry:
+            entry = self.by_key.get(key)
+            if entry and entry[2] and metric_id:
+                entry = None
+        if not entry:
+            entry = [metric, None, None]
+            self.entries.append(entry)
+            self.by_key[key] = entry
+        if not entry[2] and metric_id:
+            entry[2] = metric_id
+            self.by_id[metric_id] = entry
+        if not entry[1] and tag:
+            entry[1] = tag
+        if isinstance(metric, MathExpression):
+            for sub_id, sub_metric in metric.using_metrics.items():
+                self.add(sub_metric, None, sub_id)
+
+    def graph_json(self):
+        metrics = []
+        for metric, tag, metric_id in self.entries:
+            options = {}
+            rendered = metric.graph_json(options)
+            if not tag:
+                options['visible'] = False
+            if tag != 'left':
+                options['yAxis'] = tag
+            if metric_id:
+                options['id'] = metric_id
+            if options.get('visible') is not False and options.get('expression') and not options.get('label'):
+                options['label'] = None if options.get('label') == '' else str(metric)
+            options = defined(**options)
+            metrics.append(rendered + [options] if options else rendered)
+        return metrics
+
+class Widget():
+    '''Widget with a position on the grid of the dashboard'''
+
+    def __init__(self, width: int, height: int):
+        if width > GRID_WIDTH:
+            raise ValueError(f'Widget width must be less than or equal to {GRID_WIDTH}, got {width}')
+        self.width = width
+        self.height = height
+        self.x = None
+        self.y = None
+
+    def position(self, x: int, y: int):
+        self.x = x
+        self.y = y
+
+    def widget_json(self, widget_type: str, properties: dict):
+        return [dict(defined(type=widget_type, width=self.width, height=self.height, x=self.x, y=self.y),
+            properties=properties)]
+
+class TextWidget(Widget):
+    '''Markdown text, see aws_cdk.aws_cloudwatch.TextWidget'''
+
+    def __init__(self, markdown: str, width: int = None, height: int = None, background=None):
+        super().__init__(width or 6, height or 2)
+        self.markdown = markdown
+        self.background = background
+
+    def to_json(self):
+        return self.widget_json('text', defined(markdown=self.markdown, background=enum_value(self.background)))
+
+class GraphWidget(Widget):
+    '''Graph of metrics, see aws_cdk.aws_cloudwatch.GraphWidget'''
+
+    def __init__(self, title: str = None, left: list = None, right: list = None, height: int = None,
+            width: int = None, legend_position=None, view=None, stacked: bool = None, period: Duration = None,
+            statistic: str = None, region: str = None, live_data: bool = None,
+            set_period_to_time_range: bool = None, start: str = None, end: str = None, account_id: str = None):
+        super().__init__(width or 6, height or 6)
+        self.title = title
+        self.left = list(left or [])
+        self.right = list(right or [])
+        self.legend_position = legend_position
+        self.view = view
+        self.stacked = stacked
+        self.period = period
+        self.statistic = statistic
+        self.region = region
+        self.live_data = live_data
+        self.set_period_to_time_range = set_period_to_time_range
+        self.start = start
+        self.end = end
+        self.account_id = account_id
+
+    def add_left_metric(self, metric):
+        self.left.append(metric)
+
+    def add_right_metric(self, metric):
+        self.right.append(metric)
+
+    def to_json(self):
+        metric_set = MetricSet()
+        for metric in self.left:
+            metric_set.add(metric, 'left')
+        for metric in self.right:
+            metric_set.add(metric, 'right')
+        metrics = metric_set.graph_json()
+        legend_position = enum_value(self.legend_position)
+        return self.widget_json('metric', dict(
+            defined(
+                view=enum_value(self.view) or GraphWidgetView.TIME_SERIES,
+                title=self.title,
+                region=self.region or REGION,
+                stacked=self.stacked,
+                metrics=metrics or None,
+            ),
+            yAxis={},
+            **defined(
+                legend=dict(position=legend_position) if legend_position else None,
+                liveData=self.live_data,
+                setPeriodToTimeRange=self.set_period_to_time_range,
+                period=self.period.to_seconds() if self.period else None,
+                stat=self.statistic,
+                start=self.start,
+                end=self.end,
+                accountId=self.account_id,
+            )
+        ))
+
+class Row(Widget):
+    '''Widgets laid out horizontally, wrapping at the width of the grid, see aws_cdk.aws_cloudwatch.Row'''
+
+    def __init__(self, *widgets):
+        self.widgets = list(widgets)
+        # offset of each widget in the row
+        self.offsets = []
+        x = 0
+        y = 0
+        width = 0
+        height = 0
+        for widget in self.widgets:
+            if x + widget.width > GRID_WIDTH:
+                y = height
+                x = 0
+            self.offsets.append((x, y))
+            x += widget.width
+            width = max(width, x)
+            height = max(height, y + widget.height)
+        self.width = width
+        self.height = height
+        self.x = None
+        self.y = None
+
+    def position(self, x: int, y: int):
+        for widget, (offset_x, offset_y) in zip(self.widgets, self.offsets):
+            widget.position(x + offset_x, y + offset_y)
+
+    def to_json(self):
+        return [rendered for widget in self.widgets for rendered in widget.to_json()]
+
+class Column(Widget):
+    '''Widgets laid out vertically, see aws_cdk.aws_cloudwatch.Column'''
+
+    def __init__(self, *widgets):
+        self.widgets = list(widgets)
+        self.width = max((widget.width for widget in self.widgets), default=0)
+        self.height = sum(widget.height for widget in self.widgets)
+        self.x = None
+        self.y = None
+
+    def position(self, x: int, y: int):
+        for widget in self.widgets:
+            widget.position(x, y)
+            y += widget.height
+
+    def to_json(self):
+        return [rendered for widget in self.widgets for rendered in widget.to_json()]
+
+def dashboard_body(widgets: list, start: str = None, end: str = None, period_override=None):
+    '''Body of a dashboard made of widgets, laid out as aws_cdk.aws_cloudwatch.Dashboard does'''
+    column = Column(*widgets)
+    column.position(0, 0)
+    return defined(start=start, end=end, periodOverride=enum_value(period_override), widgets=column.to_json())
+
+def to_json_string(body, region: str = None):
+    '''
+    Serialize a rendered body, or part of it, as CloudFormation would, with
+    region in place of the region token, or {"Ref": "AWS::Region"}
+    '''
+    rendered = json.dumps(body, separators=(',', ':'))
+    return rendered.replace(json.dumps(REGION), json.dumps(region) if region else '{"Ref":"AWS::Region"}')
@@ -14,55 +14,72 @@
 # Amazon EC2 instances or using Amazon S3 storage.
 # ----------------------------------------------------------------------------
 
-import aws_cdk as cdk
-import boto3
-from botocore.config import Config
-import aws_cdk.aws_cloudwatch as cloudwatch
+from ..widgets import cdk, cloudwatch
+from ..clients import ClientFactory
+from ..tagging import TagIndex
+from ..inventory import InventoryStore
+from ..pagination import paginate
+from ..models import AutoScalingGroup
+from ..fleet import use_fleet_mode, fleet_widgets, rows
+from ..insights import top_n, top_n_widget
+from ..budget import metrics_per_widget, graph_widgets
 
 class AutoScaling():
 
-    def __init__(self, region: str, tag: str, tag_values: list):
+    # number of AutoScaling groups from which the fleet mode is used (fleet_mode: auto)
+    FLEET_THRESHOLD = 50
+
+    def __init__(self, region: str, tag: str, tag_values: list, options: dict = None,
+            clients: ClientFactory = None, tag_index: TagIndex = None, inventory: InventoryStore = None,
+            metric_region: str = None, metric_account: str = None):
         self.namespace = "AWS/AutoScaling"
         self.tag_name = tag
         self.tag_values = tag_values
-        self.botoclient = boto3.client('autoscaling', config=Config(region_name=region))
-        self.as_groups = self.get_as_groups()
+        self.options = options or {}
+        # region of the metrics, when the resources are not in the region of the dashboard
+        self.metric_region = metric_region
+        # member account of the resources and of their metrics, None for the account of the stack
+        self.metric_account = metric_account
+        self.clients = clients or ClientFactory()
+        self.inventory = (inventory or InventoryStore()).scope('AutoScaling', region, tag, tag_values, metric_account)
+        self.botoclient = self.clients.client('autoscaling', region)
+        self.as_groups = self.inventory.fetch('auto_scaling_groups', self.get_as_groups, AutoScalingGroup)
 
     def get_as_groups(self):
         '''Get AutoScaling groups filtered by tag'''
-        resources = []
-        response = self.botoclient.describe_auto_scaling_groups(
+        as_groups = paginate(self.botoclient, 'describe_auto_scaling_groups', prefetch=True,
             Filters=[
                 {
                     'Name': f'tag:{self.tag_name}',
                     'Values': self.tag_values
                 }
-            ],
-            MaxRecords=10
+            ]
         )
-        resources.extend(response['AutoScalingGroups'])
-        try:       
-            while response['NextToken']:
-                response = self.botoclient.describe_auto_scaling_groups(
-                    NextToken=response['NextToken'],
-                    Filters=[
-                        {
-                            'Name': f'tag:{self.tag_name}',
-                            'Values': self.tag_values
-                        }
-                    ],
-                    MaxRecords=10
+        return [AutoScalingGroup.from_response(as_group) for as_group in as_groups]
+
+    @staticmethod
+    def apply_tag_change(inventory, clients: ClientFactory, change):
+        '''Add or remove the AutoScaling group of a tag change event in the stored inventory'''
+        as_group_name = change.arn.split('autoScalingGroupName/', 1)[1]
+        tagged = change.matches(inventory.tag_name, inventory.tag_values)
+        def apply(as_groups):
+            as_groups = [as_group for as_group in as_groups if as_group.name != as_group_name]
+            if tagged:
+                response = clients.client('autoscaling', inventory.region).describe_auto_scaling_groups(
+                    AutoScalingGroupNames=[as_group_name]
                 )
-                resources.extend(response['AutoScalingGroups'])
-        except KeyError:
-            pass
-        return resources
+                as_groups.extend(AutoScalingGroup.from_response(as_group) for as_group in response['AutoScalingGroups'])
+            return as_groups
+        return inventory.update('auto_scaling_groups', apply, AutoScalingGroup)
 
     def get_widgets(self):
-        widgetRows = []
-
+        '''Yield the widgets of the AutoScaling groups, as they are built'''
         if(len(self.as_groups) == 0):
-            return []
+            return
+
+        if use_fleet_mode(self.options, len(self.as_groups), self.FLEET_THRESHOLD):
+            yield from self.get_fleet_widgets()
+            return
         
         markdown = f'### AutoScaling Group'
         # Header line with instance name, id and type
@@ -71,19 +88,49 @@ class AutoScaling():
             height = 1,
             width = 24
         )
-        widgetRows.append(label)
+        yield label
+        if top_n(self.options):
+            yield cloudwatch.Row(*self.get_top_widgets(top_n(self.options)))
+            return
         # GroupInServiceInstances widget
         in_service = self.get_in_service()
         # GroupDesiredCapacity Widget
         desired_capacity = self.get_desired_capacity()
-        widgetRows.append(cloudwatch.Row(in_service,desired_capacity))
+        yield from rows(in_service + desired_capacity)
+
+    def get_fleet_widgets(self):
+        '''Widgets aggregating the metrics of all the AutoScaling groups'''
+        label = cloudwatch.TextWidget(
+            markdown = f'### AutoScaling Groups - {len(self.as_groups)} groups',
+            height = 1,
+            width = 24
+        )
+        as_group_names = [as_group.name for as_group in self.as_groups]
+        widgets = fleet_widgets('Instances: Total', self.namespace, ['AutoScalingGroupName'], 'AutoScalingGroupName', as_group_names,
+            [('GroupInServiceInstances', 'Average', 'SUM'), ('GroupDesiredCapacity', 'Average', 'SUM')],
+            cdk.Duration.minutes(5), width=24, legend_position=cloudwatch.LegendPosition.RIGHT, region=self.metric_region,
+            account=self.metric_account)
+        if top_n(self.options):
+            widgets += self.get_top_widgets(top_n(self.options))
+        return [label] + rows(widgets)
 
-        return widgetRows
+    def get_top_widgets(self, limit):
+        '''Widgets of the limit AutoScaling groups with the most instances'''
+        as_group_names = [as_group.name for as_group in self.as_groups]
+        period = cdk.Duration.minutes(5)
+        return [
+            top_n_widget('GroupInServiceInstances: Average', self.namespace, ['AutoScalingGroupName'], 'AutoScalingGroupName',
+                as_group_names, 'GroupInServiceInstances', 'AVG', limit, period, region=self.metric_region,
+                account=self.metric_account),
+            top_n_widget('GroupDesiredCapacity: Average', self.namespace, ['AutoScalingGroupName'], 'AutoScalingGroupName',
+                as_group_names, 'GroupDesiredCapacity', 'AVG', limit, period, region=self.metric_region,
+                account=self.metric_account)
+        ]
 
     def get_in_service(self):
         metric_array = []
         for as_group in self.as_groups:
-            as_group_name = as_group['AutoScalingGroupName']
+            as_group_name = as_group.name
             
             metric_array.append(cloudwatch.Metric(
                     namespace = self.namespace,
@@ -92,11 +139,11 @@ class AutoScaling():
                         AutoScalingGroupName = as_group_name,
                     ),
                     statistic = 'Average',
-                    period = cdk.Duration.minutes(5)
+                    period = cdk.Duration.minutes(5),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ))
-        return cloudwatch.GraphWidget( 
-            title='GroupInServiceInstances: Average',
-            left = metric_array,
+        return graph_widgets('GroupInServiceInstances: Average', metric_array, metrics_per_widget(self.options),
             legend_position=cloudwatch.LegendPosition.RIGHT,
             height = 6,
             width = 12
@@ -105,7 +152,7 @@ class AutoScaling():
     def get_desired_capacity(self):
         metric_array = []
         for as_group in self.as_groups:
-            as_group_name = as_group['AutoScalingGroupName']
+            as_group_name = as_group.name
             
             metric_array.append(cloudwatch.Metric(
                     namespace = self.namespace,
@@ -114,11 +161,11 @@ class AutoScaling():
                         AutoScalingGroupName = as_group_name,
                     ),
                     statistic = 'Average',
-                    period = cdk.Duration.minutes(5)
+                    period = cdk.Duration.minutes(5),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ))
-        return cloudwatch.GraphWidget( 
-            title='GroupDesiredCapacity: Average',
-            left = metric_array,
+        return graph_widgets('GroupDesiredCapacity: Average', metric_array, metrics_per_widget(self.options),
             legend_position=cloudwatch.LegendPosition.RIGHT,
             height = 6,
             width = 12
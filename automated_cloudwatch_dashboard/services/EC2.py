@@ -14,80 +14,135 @@
 # Amazon EC2 instances or using Amazon S3 storage.
 # ----------------------------------------------------------------------------
 
-import aws_cdk as cdk
-import boto3
-from botocore.config import Config
-import aws_cdk.aws_cloudwatch as cloudwatch
+from ..widgets import cdk, cloudwatch
+from ..clients import ClientFactory
+from ..tagging import TagIndex
+from ..inventory import InventoryStore
+from ..nitro_catalog import NitroCatalog
+from ..pagination import paginate
+from ..models import Instance, Volume
+from ..fleet import use_fleet_mode, fleet_widgets, rows
+from ..insights import top_n, top_n_widget
 
 class EC2():
 
-    def __init__(self, region: str, tag: str, tag_values: list):
+    # maximum number of instance IDs in a single describe_volumes filter
+    VOLUME_FILTER_CHUNK = 200
+    # number of instances from which the fleet mode is used (fleet_mode: auto)
+    FLEET_THRESHOLD = 50
+
+    def __init__(self, region: str, tag: str, tag_values: list, options: dict = None,
+            clients: ClientFactory = None, tag_index: TagIndex = None, inventory: InventoryStore = None,
+            metric_region: str = None, metric_account: str = None):
         self.namespace = "AWS/EC2"
         self.ebsnamespace = "AWS/EBS"
         self.tag_name = tag
         self.tag_values = tag_values
-        self.botoclient = boto3.client('ec2', config=Config(region_name=region))
-        self.instances = self.get_instances()
-        self.volumes = self.get_volumes()
+        self.options = options or {}
+        # region of the metrics, when the resources are not in the region of the dashboard
+        self.metric_region = metric_region
+        # member account of the resources and of their metrics, None for the account of the stack
+        self.metric_account = metric_account
+        self.clients = clients or ClientFactory()
+        self.inventory = (inventory or InventoryStore()).scope('EC2', region, tag, tag_values, metric_account)
+        self.botoclient = self.clients.client('ec2', region)
+        # the on-disk catalog would hide the hypervisor lookups from a recording
+        self.nitro_catalog = NitroCatalog.from_options(self.options.get('nitro_catalog'),
+            persistent=not self.clients.hermetic)
+        self.instances = self.inventory.fetch('instances', self.get_instances, Instance)
+        self.nitro_types = self.get_nitro_types()
+        self.volumes = self.inventory.fetch('volumes', self.get_volumes, Volume)
  
     def get_instances(self):
         '''Get EC2 instances filtered by tag'''
-        resources = []
-        response = self.botoclient.describe_instances(
+        reservations = paginate(self.botoclient, 'describe_instances', prefetch=True,
             Filters=[
                 {
                     'Name': f'tag:{self.tag_name}',
                     'Values': self.tag_values
                 }
-            ],
-            MaxResults=10
+            ]
         )
-        resources.extend(response['Reservations'])
-        try:       
-            while response['NextToken']:
-                response = self.botoclient.describe_instances(
-                    NextToken=response['NextToken'],
-                    Filters=[
-                        {
-                            'Name': f'tag:{self.tag_name}',
-                            'Values': self.tag_values
-                        }
-                    ],
-                    MaxResults=10
-                )
-                resources.extend(response['Reservations'])
-        except KeyError:
-            pass
-        return resources
+        # a reservation holds all the instances of a single launch, e.g. of
+        # run-instances with a count above 1: each of them gets its widgets
+        return [Instance.from_response(instance) for reservation in reservations for instance in reservation['Instances']]
+
+    def get_nitro_types(self):
+        '''Check with batched lookups if the distinct instance types run on Nitro hypervisor'''
+        instance_types = [instance.instance_type for instance in self.instances]
+        return self.nitro_catalog.lookup(self.botoclient, instance_types)
 
     def get_volumes(self):
-        '''Get volumes attached to the instances filtered by tag'''
+        '''
+        Get volumes attached to the instances filtered by tag.
+        Only non-Nitro instances get per-volume widgets, so volumes are
+        fetched in bulk for those instances only and joined to them by
+        attachment.
+        '''
         resources = {}
         for instance in self.instances:
-            instance_id = instance['Instances'][0]['InstanceId']
-            response = self.botoclient.describe_volumes(
+            if not self.nitro_types[instance.instance_type]:
+                resources[instance.instance_id] = []
+
+        instance_ids = list(resources)
+        seen = set()
+        for i in range(0, len(instance_ids), self.VOLUME_FILTER_CHUNK):
+            volumes = paginate(self.botoclient, 'describe_volumes',
                 Filters=[
                     {
                     'Name': 'attachment.instance-id',
-                    'Values': [
-                    instance_id
-                    ]
+                    'Values': instance_ids[i:i + self.VOLUME_FILTER_CHUNK]
                     }
                 ]
             )
-            resources[instance_id] = response['Volumes']
+            for volume in volumes:
+                # a multi-attached volume can be returned by more than one chunk
+                if volume['VolumeId'] in seen:
+                    continue
+                seen.add(volume['VolumeId'])
+                for attachment in volume['Attachments']:
+                    if attachment['InstanceId'] in resources:
+                        resources[attachment['InstanceId']].append(Volume.from_response(volume))
         return resources
 
-    def get_widgets(self):
-        widgetRows = []
+    @staticmethod
+    def apply_tag_change(inventory, clients: ClientFactory, change):
+        '''
+        Remove the instance of a tag change event from the stored inventory.
+        A newly tagged instance needs the Nitro lookup and the discovery of its
+        volumes, it is left to a new discovery of the service.
+        '''
+        if change.matches(inventory.tag_name, inventory.tag_values):
+            return False
+        instance_id = change.arn.rsplit('/', 1)[1]
+        return (
+            inventory.update('instances', lambda instances: [instance for instance in instances
+                if instance.instance_id != instance_id], Instance) and
+            inventory.update('volumes', lambda volumes: {key: value for key, value in volumes.items()
+                if key != instance_id}, Volume)
+        )
 
+    def get_widgets(self):
+        '''Yield the widgets of the instances, as they are built'''
         if(len(self.instances) == 0):
-            return []
-        
+            return
+
+        if use_fleet_mode(self.options, len(self.instances), self.FLEET_THRESHOLD):
+            yield from self.get_fleet_widgets()
+            return
+
+        if top_n(self.options):
+            yield cloudwatch.TextWidget(
+                markdown = f'### EC2 Instances - top {top_n(self.options)}',
+                height = 1,
+                width = 24
+            )
+            yield cloudwatch.Row(*self.get_top_widgets(top_n(self.options)))
+
         for instance in self.instances:
-            instance_id = instance['Instances'][0]['InstanceId']
-            instance_type = instance['Instances'][0]['InstanceType']
-            instance_name = self.get_instance_name(instance['Instances'][0]['Tags'])
+            instance_id = instance.instance_id
+            instance_type = instance.instance_type
+            instance_name = instance.name
 
             markdown = f'### Instance {instance_name} - {instance_id} ({instance_type})'
             # Header line with instance name, id and type
@@ -96,31 +151,69 @@ class EC2():
                 height = 1,
                 width = 24
             )
-            widgetRows.append(label)
+            yield label
             # CPU Widget
             cpu_widget = self.get_cpu_widget(instance_id)
             # Network Widget
             network_widget = self.get_network_widget(instance_id)
-            widgetRows.append(cloudwatch.Row(cpu_widget,network_widget))
+            yield cloudwatch.Row(cpu_widget,network_widget)
 
             # Disk widget
-            if( self.is_nitro(instance_type) ):
+            if( self.nitro_types[instance_type] ):
                 ebs_widget = self.get_ebs_nitro_widget(instance_id)
-                widgetRows.append(cloudwatch.Row(ebs_widget))
+                yield cloudwatch.Row(ebs_widget)
             else: 
                 for volume in self.volumes[instance_id]:
                     ebs_widget = self.get_ebs_widget(instance_id, volume)
-                    widgetRows.append(cloudwatch.Row(ebs_widget))
+                    yield cloudwatch.Row(ebs_widget)
 
-        return widgetRows
+    def get_fleet_widgets(self):
+        '''Widgets aggregating the metrics of all the instances'''
+        instance_ids = []
+        nitro_ids = []
+        volume_ids = []
+        for instance in self.instances:
+            instance_ids.append(instance.instance_id)
+            if self.nitro_types[instance.instance_type]:
+                nitro_ids.append(instance.instance_id)
+            else:
+                volume_ids.extend(volume.volume_id for volume in self.volumes[instance.instance_id])
+
+        label = cloudwatch.TextWidget(
+            markdown = f'### EC2 fleet - {len(instance_ids)} instances',
+            height = 1,
+            width = 24
+        )
+        widgets = fleet_widgets('CPU Utilization', self.namespace, ['InstanceId'], 'InstanceId', instance_ids,
+            [('CPUUtilization', 'Maximum', 'MAX')], cdk.Duration.minutes(5), region=self.metric_region,
+            account=self.metric_account)
+        widgets += fleet_widgets('Network', self.namespace, ['InstanceId'], 'InstanceId', instance_ids,
+            [('NetworkIn', 'Sum', 'SUM'), ('NetworkOut', 'Sum', 'SUM'),
+            ('NetworkPacketsIn', 'Sum', 'SUM'), ('NetworkPacketsOut', 'Sum', 'SUM')], cdk.Duration.minutes(1),
+            region=self.metric_region, account=self.metric_account)
+        if nitro_ids:
+            widgets += fleet_widgets('Disk - Nitro instances', self.namespace, ['InstanceId'], 'InstanceId', nitro_ids,
+                [('EBSReadBytes', 'Sum', 'SUM'), ('EBSWriteBytes', 'Sum', 'SUM'),
+                ('EBSReadOps', 'Sum', 'SUM'), ('EBSWriteOps', 'Sum', 'SUM')], cdk.Duration.minutes(1),
+                region=self.metric_region, account=self.metric_account)
+        if volume_ids:
+            widgets += fleet_widgets('Disk - EBS volumes', self.ebsnamespace, ['VolumeId'], 'VolumeId', volume_ids,
+                [('VolumeReadBytes', 'Sum', 'SUM'), ('VolumeWriteBytes', 'Sum', 'SUM'),
+                ('VolumeReadOps', 'Sum', 'SUM'), ('VolumeWriteOps', 'Sum', 'SUM')], cdk.Duration.minutes(1),
+                region=self.metric_region, account=self.metric_account)
+        if top_n(self.options):
+            widgets += self.get_top_widgets(top_n(self.options))
+        return [label] + rows(widgets)
+
+    def get_top_widgets(self, limit):
+        '''Widgets of the limit instances with the highest CPU utilization'''
+        instance_ids = [instance.instance_id for instance in self.instances]
+        return [
+            top_n_widget('CPU Utilization: Maximum', self.namespace, ['InstanceId'], 'InstanceId', instance_ids,
+                'CPUUtilization', 'MAX', limit, cdk.Duration.minutes(5), region=self.metric_region,
+                account=self.metric_account)
+        ]
 
-    def get_instance_name(self, tags):
-        instance_name = ''
-        for tag in tags: 
-            if(tag['Key'] == 'Name'):
-                instance_name = tag['Value']
-        return instance_name
-    
     def get_cpu_widget(self, instance_id):
         return cloudwatch.GraphWidget( 
             title=f'CPU Utilization - {instance_id}',
@@ -131,6 +224,8 @@ class EC2():
                     InstanceId = instance_id
                 ),
                 statistic = 'Maximum',
+                region = self.metric_region,
+                account = self.metric_account,
             )],
             height = 3,
             width = 12,
@@ -148,7 +243,9 @@ class EC2():
                         InstanceId = instance_id
                     ),
                     statistic = 'Maximum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),
                 cloudwatch.Metric(
                     namespace = self.namespace,
@@ -157,7 +254,9 @@ class EC2():
                         InstanceId = instance_id
                     ),
                     statistic = 'Maximum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),
                 cloudwatch.Metric(
                     namespace = self.namespace,
@@ -166,7 +265,9 @@ class EC2():
                         InstanceId = instance_id
                     ),
                     statistic = 'Maximum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),
                 cloudwatch.Metric(
                     namespace = self.namespace,
@@ -175,7 +276,9 @@ class EC2():
                         InstanceId = instance_id
                     ),
                     statistic = 'Maximum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),   
             ],
             height = 3,
@@ -194,7 +297,9 @@ class EC2():
                         InstanceId = instance_id
                     ),
                     statistic = 'Sum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),
                 cloudwatch.Metric(
                     namespace = self.namespace,
@@ -203,7 +308,9 @@ class EC2():
                         InstanceId = instance_id
                     ),
                     statistic = 'Sum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),
                 cloudwatch.Metric(
                     namespace = self.namespace,
@@ -212,7 +319,9 @@ class EC2():
                         InstanceId = instance_id
                     ),
                     statistic = 'Sum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),
                 cloudwatch.Metric(
                     namespace = self.namespace,
@@ -221,7 +330,9 @@ class EC2():
                         InstanceId = instance_id
                     ),
                     statistic = 'Sum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),
                 cloudwatch.Metric(
                     namespace = self.namespace,
@@ -230,7 +341,9 @@ class EC2():
                         InstanceId = instance_id
                     ),
                     statistic = 'Sum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),   
             ],
             height = 3,
@@ -240,26 +353,10 @@ class EC2():
 
     def is_nitro(self, instance_type):
         """Check if $instance_type runs on Nitro hypervisor"""
-        instance_types = []
-        resources = []
-
-        response = self.botoclient.describe_instance_types(
-	        InstanceTypes=[instance_type],
-            Filters=[
-	            {
-	                'Name': 'hypervisor',
-	                'Values': [
-	                    'nitro',
-	                ]
-	            },
-	        ],
-	    )
-        if(len(response['InstanceTypes']) > 0):
-            return True
-        return False
+        return self.nitro_catalog.lookup(self.botoclient, [instance_type])[instance_type]
 
     def get_ebs_widget(self, instance_id, volume):
-        volume_id = volume['VolumeId']
+        volume_id = volume.volume_id
         return cloudwatch.GraphWidget( 
             title=f'Disk - {volume_id}',
             left = [
@@ -270,7 +367,9 @@ class EC2():
                         VolumeId = volume_id
                     ),
                     statistic = 'Average',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),
                 cloudwatch.Metric(
                     namespace = self.ebsnamespace,
@@ -279,7 +378,9 @@ class EC2():
                         VolumeId = volume_id
                     ),
                     statistic = 'Average',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),
                 cloudwatch.Metric(
                     namespace = self.ebsnamespace,
@@ -288,7 +389,9 @@ class EC2():
                         VolumeId = volume_id
                     ),
                     statistic = 'Average',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),
                 cloudwatch.Metric(
                     namespace = self.ebsnamespace,
@@ -297,7 +400,9 @@ class EC2():
                         VolumeId = volume_id
                     ),
                     statistic = 'Average',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),
             ],
             height = 3,
@@ -14,82 +14,129 @@
 # Amazon EC2 instances or using Amazon S3 storage.
 # ----------------------------------------------------------------------------
 
-import aws_cdk as cdk
-import boto3, re
-from botocore.config import Config
-import aws_cdk.aws_cloudwatch as cloudwatch
+import re
+from ..widgets import cdk, cloudwatch
+from ..clients import ClientFactory
+from ..tagging import TagIndex
+from ..inventory import InventoryStore
+from ..pagination import paginate
+from ..fleet import use_fleet_mode, fleet_widgets, rows
+from ..insights import top_n, top_n_widget
+from ..budget import metrics_per_widget, graph_widgets
 
 class ELB():
-    def __init__(self, region: str, tag: str, tag_values: list):
+
+    # resource types read from the shared tagging sweep
+    TAGGING_RESOURCE_TYPES = ['elasticloadbalancing:loadbalancer']
+    # number of ALBs from which all the target groups of the region are
+    # fetched at once, instead of one describe_target_groups call per ALB
+    BULK_TARGET_GROUPS_THRESHOLD = 20
+    # number of ALBs from which the fleet mode is used (fleet_mode: auto)
+    FLEET_THRESHOLD = 20
+
+    def __init__(self, region: str, tag: str, tag_values: list, options: dict = None,
+            clients: ClientFactory = None, tag_index: TagIndex = None, inventory: InventoryStore = None,
+            metric_region: str = None, metric_account: str = None):
         self.namespace = "AWS/ApplicationELB"
         self.tag_name = tag
         self.tag_values = tag_values
+        self.options = options or {}
+        # region of the metrics, when the resources are not in the region of the dashboard
+        self.metric_region = metric_region
+        # member account of the resources and of their metrics, None for the account of the stack
+        self.metric_account = metric_account
+        self.clients = clients or ClientFactory()
+        self.inventory = (inventory or InventoryStore()).scope('ELB', region, tag, tag_values, metric_account)
         self.region = region
-        self.botoclient = boto3.client('elbv2', config=Config(region_name=region))
-        self.alb_arns = self.get_resource_groups()
-        self.target_groups = self.get_target_groups()
+        self.tag_index = tag_index or TagIndex(region, tag, tag_values, self.TAGGING_RESOURCE_TYPES, self.clients)
+        self.botoclient = self.clients.client('elbv2', region)
+        self.alb_arns = self.inventory.fetch('load_balancers', self.get_resource_groups)
+        self.target_groups = self.inventory.fetch('target_groups', self.get_target_groups)
     
 
     def get_resource_groups(self):
-        boto3client = boto3.client('resourcegroupstaggingapi', config=Config(region_name=self.region))
-        resources = []
-
-        response = boto3client.get_resources(
-            TagFilters=[
-                {
-                'Key': self.tag_name,
-                'Values': self.tag_values
-                },
-            ],
-            ResourceTypeFilters=["elasticloadbalancing:loadbalancer"],
-            ResourcesPerPage=40
-        )
-        resources.extend(response['ResourceTagMappingList'])
-        try:
-            while response['PaginationToken'] != '':
-                response = boto3client.get_resources(
-                    PaginationToken=response['PaginationToken'],
-                    TagFilters=[
-                        {
-                            'Key': self.tag_name,
-                            'Values': self.tag_values
-                        },
-                    ],
-                    ResourceTypeFilters=["elasticloadbalancing:loadbalancer"],
-                    ResourcesPerPage=40
-                )
-                resources.extend(response['ResourceTagMappingList'])
-        except KeyError: 
-            pass
-        return resources
+        '''Get the tagged load balancers from the shared tagging sweep'''
+        return self.tag_index.get('elasticloadbalancing:loadbalancer')
 
     def get_target_groups(self):
         '''Based on the ALB ARNs collected before retrieve the associated Target Groups'''
+        # filter ARNs that contains /app/
+        alb_arns = [alb_arn['ResourceARN'] for alb_arn in self.alb_arns if alb_arn['ResourceARN'].find("/app/") > 0]
+        threshold = self.options.get('bulk_target_groups_threshold', self.BULK_TARGET_GROUPS_THRESHOLD)
+        if len(alb_arns) >= threshold:
+            return self.get_target_groups_bulk(alb_arns)
         resources = {}
-        boto3client = boto3.client('elbv2', config=Config(region_name=self.region))
-        for alb_arn in self.alb_arns:
-            # filter ARNs that contains /app/
-            if(alb_arn['ResourceARN'].find("/app/") > 0):
-                response = boto3client.describe_target_groups(
-                    LoadBalancerArn=alb_arn['ResourceARN']
-                )
-                resources[alb_arn['ResourceARN']] = self.extract_target_groups(response)
+        for alb_arn in alb_arns:
+            target_groups = paginate(self.botoclient, 'describe_target_groups',
+                LoadBalancerArn=alb_arn
+            )
+            resources[alb_arn] = self.extract_target_groups({'TargetGroups': list(target_groups)})
+        return resources
+
+    def get_target_groups_bulk(self, alb_arns: list):
+        '''Page through all the target groups of the region once, indexing them by load balancer'''
+        resources = {alb_arn: [] for alb_arn in alb_arns}
+        for tg in paginate(self.botoclient, 'describe_target_groups', prefetch=True):
+            for alb_arn in tg.get('LoadBalancerArns', []):
+                if alb_arn in resources:
+                    resources[alb_arn].append(self.get_target_group_name(tg['TargetGroupArn']))
         return resources
 
-    def extract_target_groups(self, tgs): 
+    @staticmethod
+    def get_target_group_name(target_group_arn: str):
+        '''Extract target group name (targetgroup/<name>/<id>) from the ARN'''
+        return re.search(r':([a-zA-Z0-9_\-/]+)$', target_group_arn).group(1)
+
+    @staticmethod
+    def extract_target_groups(tgs): 
         '''Extract target group name from the ARN'''
         target_group_names = []
         for tg in tgs['TargetGroups']: 
-            target_group_names.append(re.search(r':([a-zA-Z0-9_\-/]+)$', tg['TargetGroupArn']).group(1))
+            target_group_names.append(ELB.get_target_group_name(tg['TargetGroupArn']))
             # target_group_names.append(tg['TargetGroupArn'])
         return target_group_names
 
-    def get_widgets(self):
-        widgetRows = []
+    @staticmethod
+    def apply_tag_change(inventory, clients: ClientFactory, change):
+        '''Add or remove the load balancer of a tag change event, and its target groups, in the stored inventory'''
+        tagged = change.matches(inventory.tag_name, inventory.tag_values)
+        def apply_load_balancers(alb_arns):
+            alb_arns = [alb_arn for alb_arn in alb_arns if alb_arn['ResourceARN'] != change.arn]
+            if tagged:
+                alb_arns.append(dict(
+                    ResourceARN = change.arn,
+                    Tags = [dict(Key = key, Value = value) for key, value in change.tags.items()]
+                ))
+            return alb_arns
+        def apply_target_groups(target_groups):
+            target_groups.pop(change.arn, None)
+            if tagged and change.arn.find("/app/") > 0:
+                response = paginate(clients.client('elbv2', inventory.region), 'describe_target_groups',
+                    LoadBalancerArn=change.arn
+                )
+                target_groups[change.arn] = ELB.extract_target_groups({'TargetGroups': list(response)})
+            return target_groups
+        return inventory.update('load_balancers', apply_load_balancers) and inventory.update('target_groups', apply_target_groups)
 
+    def get_widgets(self):
+        '''Yield the widgets of the load balancers, as they are built'''
         if(len(self.alb_arns) == 0):
-            return []
-        
+            return
+
+        alb_names = [re.search(r':loadbalancer/([a-zA-Z0-9_\-/]+)$', alb_arn['ResourceARN']).group(1)
+            for alb_arn in self.alb_arns if alb_arn['ResourceARN'].find("/app/") > 0]
+        if use_fleet_mode(self.options, len(alb_names), self.FLEET_THRESHOLD):
+            yield from self.get_fleet_widgets(alb_names)
+            return
+
+        if top_n(self.options):
+            yield cloudwatch.TextWidget(
+                markdown = f'### Target Groups - top {top_n(self.options)}',
+                height = 1,
+                width = 24
+            )
+            yield cloudwatch.Row(*self.get_top_widgets(top_n(self.options)))
+
         for alb_arn in self.alb_arns: 
             if (alb_arn['ResourceARN'].find("/app/") < 0):
                 continue
@@ -102,20 +149,57 @@ class ELB():
                 height = 1,
                 width = 24
             )
-            widgetRows.append(label)
+            yield label
             # Request widget
             request_widget = self.get_request_widget(alb_name)
             # Connections widget
             connection_widget = self.get_connection_widget(alb_name)
             # Back-ends errors
-            backend_response_widget = self.get_backend_response_widget(alb_arn['ResourceARN'], alb_name)
-            widgetRows.append(cloudwatch.Row(request_widget, connection_widget, backend_response_widget))
+            backend_response_widgets = self.get_backend_response_widget(alb_arn['ResourceARN'], alb_name)
+            yield from rows([request_widget, connection_widget] + backend_response_widgets)
             # Back-ends health
-            healthy_widget = self.get_healthy_widget(alb_arn['ResourceARN'], alb_name)
-            unhealthy_widget = self.get_unhealthy_widget(alb_arn['ResourceARN'], alb_name)
-            widgetRows.append(cloudwatch.Row(healthy_widget, unhealthy_widget))
-        return widgetRows
+            healthy_widgets = self.get_healthy_widget(alb_arn['ResourceARN'], alb_name)
+            unhealthy_widgets = self.get_unhealthy_widget(alb_arn['ResourceARN'], alb_name)
+            yield from rows(healthy_widgets + unhealthy_widgets)
+
+    def get_fleet_widgets(self, alb_names):
+        '''Widgets aggregating the metrics of all the ALBs'''
+        label = cloudwatch.TextWidget(
+            markdown = f'### Application Load Balancers - {len(alb_names)} load balancers',
+            height = 1,
+            width = 24
+        )
+        period = cdk.Duration.minutes(1)
+        widgets = fleet_widgets('HTTP/S Requests', self.namespace, ['LoadBalancer'], 'LoadBalancer', alb_names,
+            [('RequestCount', 'Sum', 'SUM'), ('HTTPCode_ELB_5XX_Count', 'Sum', 'SUM'),
+            ('HTTPCode_ELB_4XX_Count', 'Sum', 'SUM'), ('HTTPCode_ELB_3XX_Count', 'Sum', 'SUM')], period, width=8, height=5,
+            region=self.metric_region, account=self.metric_account)
+        widgets += fleet_widgets('TCP connections', self.namespace, ['LoadBalancer'], 'LoadBalancer', alb_names,
+            [('ActiveConnectionCount', 'Sum', 'SUM'), ('NewConnectionCount', 'Sum', 'SUM'),
+            ('RejectedConnectionCount', 'Sum', 'SUM'), ('ClientTLSNegotiationErrorCount', 'Sum', 'SUM')], period, width=8, height=5,
+            region=self.metric_region, account=self.metric_account)
+        widgets += fleet_widgets('Target Response Time: Maximum of the averages', self.namespace, ['LoadBalancer'], 'LoadBalancer', alb_names,
+            [('TargetResponseTime', 'Average', 'MAX')], period, width=8, height=5, region=self.metric_region,
+            account=self.metric_account)
+        widgets += fleet_widgets('Target health', self.namespace, ['LoadBalancer', 'TargetGroup'], 'LoadBalancer', alb_names,
+            [('HealthyHostCount', 'Minimum', 'MIN'), ('UnHealthyHostCount', 'Maximum', 'MAX')], period, width=24, height=3,
+            region=self.metric_region, account=self.metric_account)
+        if top_n(self.options):
+            widgets += self.get_top_widgets(top_n(self.options))
+        return [label] + rows(widgets)
 
+    def get_top_widgets(self, limit):
+        '''Widgets of the limit target groups with the slowest and the most unhealthy targets'''
+        target_group_names = [name for names in self.target_groups.values() for name in names]
+        period = cdk.Duration.minutes(1)
+        return [
+            top_n_widget('Target Response Time: Average', self.namespace, ['LoadBalancer', 'TargetGroup'], 'TargetGroup',
+                target_group_names, 'TargetResponseTime', 'AVG', limit, period, region=self.metric_region,
+                account=self.metric_account),
+            top_n_widget('UnHealthyHostCount: Maximum', self.namespace, ['LoadBalancer', 'TargetGroup'], 'TargetGroup',
+                target_group_names, 'UnHealthyHostCount', 'MAX', limit, period, region=self.metric_region,
+                account=self.metric_account)
+        ]
 
     def get_request_widget(self, alb):
         return cloudwatch.GraphWidget( 
@@ -128,7 +212,9 @@ class ELB():
                         LoadBalancer = alb
                     ),
                     statistic = 'Sum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),
                 cloudwatch.Metric(
                     namespace = self.namespace,
@@ -137,7 +223,9 @@ class ELB():
                         LoadBalancer = alb
                     ),
                     statistic = 'Sum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),
                 cloudwatch.Metric(
                     namespace = self.namespace,
@@ -146,7 +234,9 @@ class ELB():
                         LoadBalancer = alb
                     ),
                     statistic = 'Sum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),                
                 cloudwatch.Metric(
                     namespace = self.namespace,
@@ -155,7 +245,9 @@ class ELB():
                         LoadBalancer = alb
                     ),
                     statistic = 'Sum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),   
             ],
             height = 5,
@@ -174,11 +266,11 @@ class ELB():
                         LoadBalancer = alb_name
                     ),
                     statistic = 'Minimum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ))
-        return cloudwatch.GraphWidget( 
-            title='Healthy Host: Minimum',
-            left = metric_array,
+        return graph_widgets('Healthy Host: Minimum', metric_array, metrics_per_widget(self.options),
             legend_position=cloudwatch.LegendPosition.BOTTOM,
             height = 3,
             width = 12
@@ -195,11 +287,11 @@ class ELB():
                         LoadBalancer = alb_name
                     ),
                     statistic = 'Maximum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ))
-        return cloudwatch.GraphWidget( 
-            title='UnHealthy Host: Maximum',
-            left = metric_array,
+        return graph_widgets('UnHealthy Host: Maximum', metric_array, metrics_per_widget(self.options),
             legend_position=cloudwatch.LegendPosition.BOTTOM,
             height = 3,
             width = 12
@@ -216,11 +308,11 @@ class ELB():
                         LoadBalancer = alb_name
                     ),
                     statistic = 'Average',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ))
-        return cloudwatch.GraphWidget( 
-            title='Target Response Time: Average',
-            left = metric_array,
+        return graph_widgets('Target Response Time: Average', metric_array, metrics_per_widget(self.options),
             legend_position=cloudwatch.LegendPosition.BOTTOM,
             height = 5,
             width = 8
@@ -237,7 +329,9 @@ class ELB():
                         LoadBalancer = alb
                     ),
                     statistic = 'Sum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),
                 cloudwatch.Metric(
                     namespace = self.namespace,
@@ -246,7 +340,9 @@ class ELB():
                         LoadBalancer = alb
                     ),
                     statistic = 'Sum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),
                 cloudwatch.Metric(
                     namespace = self.namespace,
@@ -255,7 +351,9 @@ class ELB():
                         LoadBalancer = alb
                     ),
                     statistic = 'Sum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),                
                 cloudwatch.Metric(
                     namespace = self.namespace,
@@ -264,7 +362,9 @@ class ELB():
                         LoadBalancer = alb
                     ),
                     statistic = 'Sum',
-                    period = cdk.Duration.minutes(1)
+                    period = cdk.Duration.minutes(1),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ),   
             ],
             height = 5,
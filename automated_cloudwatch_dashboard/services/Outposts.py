@@ -14,74 +14,74 @@
 # Amazon EC2 instances or using Amazon S3 storage.
 # ----------------------------------------------------------------------------
 
-import aws_cdk as cdk
-import boto3
-from botocore.config import Config
-import aws_cdk.aws_cloudwatch as cloudwatch
-import random
+from ..widgets import cdk, cloudwatch
+from ..clients import ClientFactory
+from ..tagging import TagIndex
+from ..inventory import InventoryStore
+from ..pagination import paginate
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 
 class Outposts():
-    def __init__(self, region: str, tag: str, tag_values: list):
+
+    # number of outposts whose instance types are fetched concurrently
+    MAX_WORKERS = 10
+
+    def __init__(self, region: str, tag: str, tag_values: list, options: dict = None,
+            clients: ClientFactory = None, tag_index: TagIndex = None, inventory: InventoryStore = None,
+            metric_region: str = None, metric_account: str = None):
         self.namespace = "AWS/Outposts"
         self.tag_name = tag
         self.tag_values = tag_values
-        self.botoclient = boto3.client('outposts', config=Config(region_name=region))
-        self.outposts = self.get_outposts()
-        self.instance_types = self.get_instance_types()
+        self.options = options or {}
+        # region of the metrics, when the resources are not in the region of the dashboard
+        self.metric_region = metric_region
+        # member account of the resources and of their metrics, None for the account of the stack
+        self.metric_account = metric_account
+        self.clients = clients or ClientFactory()
+        self.inventory = (inventory or InventoryStore()).scope('Outposts', region, tag, tag_values, metric_account)
+        self.botoclient = self.clients.client('outposts', region)
+        self.outposts = self.inventory.fetch('outposts', self.get_outposts)
+        self.instance_types = self.inventory.fetch('instance_types', self.get_instance_types)
  
     def get_outposts(self):
-        resources = []
-        response = self.botoclient.list_outposts(
-            MaxResults = 40
-        )
-        resources.extend(response['Outposts'])
-        try:       
-            while response['NextToken']:
-                response = self.botoclient.list_outposts(
-                NextToken = response['NextToken'],
-                MaxResults = 40
-                )
-                resources.extend(response['Outposts'])
-        except KeyError:
-            pass
-        return resources
-    
+        '''Get Outposts filtered by tag'''
+        # list_outposts has no tag filter, the tags are returned with each outpost
+        return [outpost for outpost in paginate(self.botoclient, 'list_outposts')
+            if outpost.get('Tags', {}).get(self.tag_name) in self.tag_values]
+
+    def get_outpost_instance_types(self, outpost_id: str):
+        '''Get all the pages of the instance types of an outpost'''
+        return list(paginate(self.botoclient, 'get_outpost_instance_types',
+            OutpostId=outpost_id
+        ))
+
     def get_instance_types(self):
-        instance_types = {}
-        response = {}
-        for outpost in self.outposts: 
-            outpost_id = outpost['OutpostId']
-            response = self.botoclient.get_outpost_instance_types(
-                MaxResults=40,
-                OutpostId=outpost_id,
-            )
-            instance_types[outpost_id] = response['InstanceTypes']
-        try:       
-            while response['NextToken']:
-                response = self.botoclient.get_outpost_instance_types(
-                    NextToken=response['NextToken'],
-                    OutpostId=outpost_id,
-                    MaxResults=40
-                )
-                instance_types[outpost_id] = response['InstanceTypes']
-        except KeyError:
-            pass
-        return instance_types
+        '''Get the instance types of the outposts, fetching the outposts concurrently'''
+        outpost_ids = [outpost['OutpostId'] for outpost in self.outposts]
+        if not outpost_ids:
+            return {}
+        max_workers = min(self.options.get('max_workers', self.MAX_WORKERS), len(outpost_ids))
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='outposts') as executor:
+            return dict(zip(outpost_ids, executor.map(self.get_outpost_instance_types, outpost_ids)))
+
+    @staticmethod
+    def get_color(instance_type: str):
+        '''Get the color of an instance type, the same in every outpost and synth'''
+        return "#" + hashlib.sha256(instance_type.encode()).hexdigest()[:6]
 
     def get_colors(self, outpost):
         colors = {}
         outpost_id = outpost['OutpostId']
         for instance_type_obj in self.instance_types[outpost_id]:
             instance_type = instance_type_obj['InstanceType']
-            color = "%06x" % random.randint(0, 0xFFFFFF)
-            colors[instance_type] = "#" + color
+            colors[instance_type] = self.get_color(instance_type)
         return colors
     
     def get_widgets(self):
-        widgetRows = []
-
+        '''Yield the widgets of the outposts, as they are built'''
         if(len(self.outposts) == 0):
-            return []
+            return
         
         for outpost in self.outposts:
             # Skip if the Outpost is not in Active state
@@ -99,7 +99,7 @@ class Outposts():
                 height = 1,
                 width = 24
             )
-            widgetRows.append(label)
+            yield label
             # 1st Row
             # Instance Types Available
             instance_types_avail_widget = self.get_instance_types_available_widget(outpost, colors)
@@ -107,7 +107,7 @@ class Outposts():
             instance_types_used_widget = self.get_instance_types_used_widget(outpost, colors)
             # Instance Types Total 
             instance_types_tot_widget = self.get_instance_types_total_widget(outpost, colors)
-            widgetRows.append(cloudwatch.Row(instance_types_avail_widget, instance_types_used_widget, instance_types_tot_widget))
+            yield cloudwatch.Row(instance_types_avail_widget, instance_types_used_widget, instance_types_tot_widget)
 
             # 2nd Row
             # EBS capacity
@@ -116,9 +116,7 @@ class Outposts():
             s3_capacity_widget = self.get_s3_capacity_widget(outpost)
             #ConnectedStatus
             conn_status_widget = self.get_conn_status_widget(outpost)
-            widgetRows.append(cloudwatch.Row(ebs_capacity_widget, s3_capacity_widget,conn_status_widget))
-
-        return widgetRows
+            yield cloudwatch.Row(ebs_capacity_widget, s3_capacity_widget,conn_status_widget)
 
     def get_s3_capacity_widget(self, outpost):
         outpost_id = outpost['OutpostId']
@@ -136,6 +134,7 @@ class Outposts():
                     statistic = 'Average',
                     period = cdk.Duration.minutes(5),
                     account = account,
+                    region = self.metric_region,
                 ),
                 cloudwatch.Metric(
                     namespace = "AWS/S3Outposts",
@@ -146,6 +145,7 @@ class Outposts():
                     statistic = 'Average',
                     period = cdk.Duration.minutes(5),
                     account = account,
+                    region = self.metric_region,
                 ) 
             ],
             height = 6,
@@ -169,6 +169,7 @@ class Outposts():
                     statistic = 'Average',
                     period = cdk.Duration.minutes(5),
                     account = account,
+                    region = self.metric_region,
                 ), 
             ],
             height = 6,
@@ -193,7 +194,8 @@ class Outposts():
                     statistic = 'Average',
                     period = cdk.Duration.minutes(5),
                     account = account,
-                    label = 'GBUsed'
+                    label = 'GBUsed',
+                    region = self.metric_region,
                 ),
                 cloudwatch.Metric(
                     namespace = self.namespace,
@@ -205,7 +207,8 @@ class Outposts():
                     statistic = 'Average',
                     period = cdk.Duration.minutes(5),
                     account = account,
-                    label = 'GBAvail'
+                    label = 'GBAvail',
+                    region = self.metric_region,
                 ) 
             ],
             height = 6,
@@ -233,7 +236,8 @@ class Outposts():
                     ),
                     statistic = 'Average',
                     period = cdk.Duration.minutes(5),
-                    label = f'{instance_type}'
+                    label = f'{instance_type}',
+                    region = self.metric_region,
                 ))
         return cloudwatch.GraphWidget( 
             title=f'EC2 Available - {outpost_name}',
@@ -262,7 +266,8 @@ class Outposts():
                     ),
                     statistic = 'Average',
                     period = cdk.Duration.minutes(5),
-                    label = f'{instance_type}'
+                    label = f'{instance_type}',
+                    region = self.metric_region,
                 ))
         return cloudwatch.GraphWidget( 
             title=f'EC2 Used - {outpost_name}',
@@ -301,7 +306,8 @@ class Outposts():
                         ),
                         statistic = 'Average',
                         period = cdk.Duration.minutes(5),
-                        label = f'{instance_type}-Used'
+                        label = f'{instance_type}-Used',
+                        region = self.metric_region,
                         ),
                     metric2: cloudwatch.Metric(
                         namespace = self.namespace,
@@ -313,7 +319,8 @@ class Outposts():
                         ),
                         statistic = 'Average',
                         period = cdk.Duration.minutes(5),
-                        label = f'{instance_type}-Avail'
+                        label = f'{instance_type}-Avail',
+                        region = self.metric_region,
                         )
                     },
                 period = cdk.Duration.minutes(5),
@@ -14,20 +14,37 @@
 # Amazon EC2 instances or using Amazon S3 storage.
 # ----------------------------------------------------------------------------
 
-import aws_cdk as cdk
-import boto3
-from botocore.config import Config
-import aws_cdk.aws_cloudwatch as cloudwatch
-import re
+from ..widgets import cdk, cloudwatch
+from ..clients import ClientFactory
+from ..tagging import TagIndex
+from ..inventory import InventoryStore
+from ..fleet import use_fleet_mode, fleet_widgets, rows
+from ..insights import top_n, top_n_widget
+from ..budget import metrics_per_widget, graph_widgets
 
 class S3():
 
-    def __init__(self, region: str, tag: str, tag_values: list):
+    # resource types read from the shared tagging sweep
+    TAGGING_RESOURCE_TYPES = ['s3:bucket']
+    # number of buckets from which the fleet mode is used (fleet_mode: auto)
+    FLEET_THRESHOLD = 100
+
+    def __init__(self, region: str, tag: str, tag_values: list, options: dict = None,
+            clients: ClientFactory = None, tag_index: TagIndex = None, inventory: InventoryStore = None,
+            metric_region: str = None, metric_account: str = None):
         self.namespace = "AWS/S3"
         self.tag_name = tag
         self.tag_values = tag_values
+        self.options = options or {}
+        # region of the metrics, when the resources are not in the region of the dashboard
+        self.metric_region = metric_region
+        # member account of the resources and of their metrics, None for the account of the stack
+        self.metric_account = metric_account
+        self.clients = clients or ClientFactory()
+        self.inventory = (inventory or InventoryStore()).scope('S3', region, tag, tag_values, metric_account)
         self.region = region
-        self.buckets = self.get_bucket_names()
+        self.tag_index = tag_index or TagIndex(region, tag, tag_values, self.TAGGING_RESOURCE_TYPES, self.clients)
+        self.buckets = self.inventory.fetch('buckets', self.get_bucket_names)
 
     def get_bucket_names(self):
         '''Get S3 buckets filtered by tag'''
@@ -35,47 +52,38 @@ class S3():
         bucket_names = []
         for resource in resource_groups:
             # extract bucket name from the ARN included in resource 
-            bucket_names.append(re.search(r':([0-9a-z\-]+)$', resource['ResourceARN']).group(1))
+            bucket_names.append(self.bucket_name(resource['ResourceARN']))
         return bucket_names 
      
+    @staticmethod
+    def bucket_name(arn: str):
+        '''Get the name of a bucket from its ARN, arn:<partition>:s3:::<name>, dots included'''
+        return arn.split(':::', 1)[1]
+
     def get_resource_groups(self):
-        boto3client = boto3.client('resourcegroupstaggingapi', config=Config(region_name=self.region))
-        resources = []
+        '''Get the tagged S3 buckets from the shared tagging sweep'''
+        return self.tag_index.get('s3:bucket')
 
-        response = boto3client.get_resources(
-            TagFilters=[
-                {
-                'Key': self.tag_name,
-                'Values': self.tag_values
-                },
-            ],
-            ResourceTypeFilters=["s3:bucket"],
-            ResourcesPerPage=40
-        )
-        resources.extend(response['ResourceTagMappingList'])
-        try:
-            while response['PaginationToken'] != '':
-                response = boto3client.get_resources(
-                    PaginationToken=response['PaginationToken'],
-                    TagFilters=[
-                        {
-                            'Key': self.tag_name,
-                            'Values': self.tag_values
-                        },
-                    ],
-                    ResourceTypeFilters=["s3:bucket"],
-                    ResourcesPerPage=40
-                )
-                resources.extend(response['ResourceTagMappingList'])
-        except KeyError: 
-            pass
-        return resources
+    @staticmethod
+    def apply_tag_change(inventory, clients: ClientFactory, change):
+        '''Add or remove the bucket of a tag change event in the stored inventory'''
+        bucket = S3.bucket_name(change.arn)
+        tagged = change.matches(inventory.tag_name, inventory.tag_values)
+        def apply(buckets):
+            buckets = [name for name in buckets if name != bucket]
+            if tagged:
+                buckets.append(bucket)
+            return buckets
+        return inventory.update('buckets', apply)
 
     def get_widgets(self):
-        widgetRows = []
-
+        '''Yield the widgets of the buckets, as they are built'''
         if(len(self.buckets) == 0):
-            return []
+            return
+
+        if use_fleet_mode(self.options, len(self.buckets), self.FLEET_THRESHOLD):
+            yield from self.get_fleet_widgets()
+            return
         
         # Header line
         markdown = f'### S3 Buckets'
@@ -84,13 +92,45 @@ class S3():
             height = 1,
             width = 24
         )
-        widgetRows.append(label)
+        yield label
+        if top_n(self.options):
+            yield cloudwatch.Row(*self.get_top_widgets(top_n(self.options)))
+            return
         # BucketSizeBytes: Average
-        bucket_size_widget = self.get_bucket_size_widget()
+        bucket_size_widgets = self.get_bucket_size_widget()
         # NumberOfObjects: Average
         obj_num = self.get_obj_num()
-        widgetRows.append(cloudwatch.Row(bucket_size_widget,obj_num))
-        return widgetRows
+        yield from rows(bucket_size_widgets + obj_num)
+
+    def get_fleet_widgets(self):
+        '''Widgets aggregating the metrics of all the buckets'''
+        label = cloudwatch.TextWidget(
+            markdown = f'### S3 Buckets - {len(self.buckets)} buckets',
+            height = 1,
+            width = 24
+        )
+        period = cdk.Duration.hours(24)
+        widgets = fleet_widgets('BucketSizeBytes: Total', self.namespace, ['BucketName', 'StorageType'], 'BucketName', self.buckets,
+            [('BucketSizeBytes', 'Average', 'SUM')], period, filters=dict(StorageType='StandardStorage'),
+            legend_position=cloudwatch.LegendPosition.RIGHT, region=self.metric_region, account=self.metric_account)
+        widgets += fleet_widgets('NumberOfObjects: Total', self.namespace, ['BucketName', 'StorageType'], 'BucketName', self.buckets,
+            [('NumberOfObjects', 'Average', 'SUM')], period, filters=dict(StorageType='AllStorageTypes'),
+            legend_position=cloudwatch.LegendPosition.RIGHT, region=self.metric_region, account=self.metric_account)
+        if top_n(self.options):
+            widgets += self.get_top_widgets(top_n(self.options))
+        return [label] + rows(widgets)
+
+    def get_top_widgets(self, limit):
+        '''Widgets of the limit buckets with the most bytes and objects'''
+        period = cdk.Duration.hours(24)
+        return [
+            top_n_widget('BucketSizeBytes: Average', self.namespace, ['BucketName', 'StorageType'], 'BucketName', self.buckets,
+                'BucketSizeBytes', 'AVG', limit, period, filters=dict(StorageType='StandardStorage'),
+                region=self.metric_region, account=self.metric_account),
+            top_n_widget('NumberOfObjects: Average', self.namespace, ['BucketName', 'StorageType'], 'BucketName', self.buckets,
+                'NumberOfObjects', 'AVG', limit, period, filters=dict(StorageType='AllStorageTypes'),
+                region=self.metric_region, account=self.metric_account)
+        ]
 
     def get_bucket_size_widget(self):
         metric_array = []
@@ -103,11 +143,11 @@ class S3():
                         StorageType = 'StandardStorage'
                     ),
                     statistic = 'Average',
-                    period = cdk.Duration.hours(24)
+                    period = cdk.Duration.hours(24),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ))
-        return cloudwatch.GraphWidget( 
-            title='BucketSizeBytes: Average',
-            left = metric_array,
+        return graph_widgets('BucketSizeBytes: Average', metric_array, metrics_per_widget(self.options),
             legend_position=cloudwatch.LegendPosition.RIGHT,
             height = 6,
             width = 12
@@ -124,11 +164,11 @@ class S3():
                         StorageType = 'AllStorageTypes'
                     ),
                     statistic = 'Average',
-                    period = cdk.Duration.hours(24)
+                    period = cdk.Duration.hours(24),
+                    region = self.metric_region,
+                    account = self.metric_account,
                 ))
-        return cloudwatch.GraphWidget( 
-            title='NumberOfObjects: Average',
-            left = metric_array,
+        return graph_widgets('NumberOfObjects: Average', metric_array, metrics_per_widget(self.options),
             legend_position=cloudwatch.LegendPosition.RIGHT,
             height = 6,
             width = 12
@@ -0,0 +1,267 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+'''
+Partitioning of the widgets in several dashboards.
+
+The widgets yielded by get_widgets() are made of blocks, one for each
+resource: a header TextWidget followed by the rows of the resource. As long
+as all the blocks fit in the widget and byte budget, they go in a single
+dashboard. Otherwise each service gets its own dashboards, the blocks being
+packed in order in as many dashboards as needed, and the dashboard named
+after the configuration becomes an index linking to them.
+
+The widgets are consumed as the services yield them: only the blocks of the
+dashboard being filled are held, each dashboard being created as soon as it
+is full, with its widgets added in batches.
+
+With the python renderer, the body of each dashboard is rendered at once by
+the render module and handed to a CfnDashboard, with the construct path of
+the Dashboard it replaces. The bodies can also be written to preview_dir, or
+rendered without a stack by render_bodies(), e.g. by the updater function
+where aws_cdk is not installed.
+'''
+
+import itertools
+import json
+import os
+try:
+    from aws_cdk import (
+        Stack,
+        Token,
+        aws_cloudwatch
+    )
+    from constructs import Construct
+except ImportError:
+    Stack = Token = aws_cloudwatch = Construct = None
+from . import render
+from .widgets import cloudwatch, python_rendering
+
+# maximum number of widgets in a dashboard accepted by CloudWatch
+MAX_WIDGETS = 500
+# number of widgets added to a dashboard at once
+WIDGETS_PER_BATCH = 50
+
+class Shard():
+    '''Dashboard holding a chunk of the widgets of a service'''
+
+    def __init__(self, service: str, part: int = None):
+        self.service = service
+        self.name = None
+        # position of the shard among those of the service, None if it is the only one
+        self.part = part
+        self.widgets = []
+        self.widget_count = 0
+        self.body_bytes = 0
+
+    def add(self, block: list, widget_count: int, body_bytes: int):
+        self.widgets.extend(block)
+        self.widget_count += widget_count
+        self.body_bytes += body_bytes
+
+    def fits(self, widget_count: int, body_bytes: int, max_widgets: int, max_body_bytes: int):
+        if not self.widgets:
+            # a block larger than the budget gets a dashboard of its own
+            return True
+        return self.widget_count + widget_count <= max_widgets and self.body_bytes + body_bytes <= max_body_bytes
+
+class DashboardSharder():
+    '''Distribute the widgets of the services in dashboards within a widget and byte budget'''
+
+    def __init__(self, stack: Stack, dashboard_name: str, max_widgets: int = MAX_WIDGETS, max_body_bytes: int = 500000,
+            enabled: bool = True, dashboard_props: dict = None, preview_dir: str = None):
+        self.stack = stack
+        self.dashboard_name = dashboard_name
+        self.max_widgets = min(max_widgets, MAX_WIDGETS)
+        self.max_body_bytes = max_body_bytes
+        self.enabled = enabled
+        self.dashboard_props = dashboard_props or {}
+        self.preview_dir = preview_dir
+
+    @classmethod
+    def from_options(cls, stack: Stack, dashboard_name: str, options: dict, dashboard_props: dict = None,
+            preview_dir: str = None):
+        options = options or {}
+        return cls(stack, dashboard_name,
+            max_widgets=options.get('max_widgets', MAX_WIDGETS),
+            max_body_bytes=options.get('max_body_bytes', 500000),
+            enabled=options.get('enabled', True),
+            dashboard_props=dashboard_props,
+            preview_dir=preview_dir
+        )
+
+    @staticmethod
+    def split_blocks(widgets):
+        '''
+        Yield the blocks of the widgets of a service, each one starting with a
+        header TextWidget. Headers without widgets of their own, such as the
+        account and region header of with_header(), stay with the next block,
+        so that a shard never starts with a section header alone.
+        '''
+        block = []
+        for widget in widgets:
+            if isinstance(widget, cloudwatch.TextWidget) and block \
+                    and not all(isinstance(held, cloudwatch.TextWidget) for held in block):
+                yield block
+                block = []
+            block.append(widget)
+        if block:
+            yield block
+
+    @staticmethod
+    def count_widgets(block: list):
+        return sum(len(widget.widgets) if isinstance(widget, cloudwatch.Row) else 1 for widget in block)
+
+    def measure(self, block: list):
+        '''Estimate the size of the rendered body of a block'''
+        if python_rendering():
+            return len(render.to_json_string([widget.to_json() for widget in block]))
+        return len(json.dumps(self.stack.resolve([widget.to_json() for widget in block]), separators=(',', ':')))
+
+    def measured_blocks(self, services):
+        '''Yield (service name, block, widget count, body size) for the widgets of services'''
+        for service, widgets in services:
+            for block in self.split_blocks(widgets):
+                yield service, block, self.count_widgets(block), self.measure(block) if self.enabled else 0
+
+    def shards(self, services):
+        '''
+        Yield the shards of services, an iterable of (service name, widgets),
+        each shard as soon as it is complete. A single shard, named after the
+        dashboard, is yielded when all the widgets fit in the budget.
+        '''
+        blocks = self.measured_blocks(services)
+        # blocks held until they exceed the budget of a single dashboard
+        single = Shard(None)
+        single.name = self.dashboard_name
+        pending = []
+        for service, block, widget_count, body_bytes in blocks:
+            pending.append((service, block, widget_count, body_bytes))
+            single.add(block, widget_count, body_bytes)
+            if self.enabled and (single.widget_count > self.max_widgets or single.body_bytes > self.max_body_bytes):
+                break
+        else:
+            yield single
+            return
+        del single
+
+        shard = None
+        for service, block, widget_count, body_bytes in itertools.chain(pending, blocks):
+            if shard is not None and shard.service != service:
+                yield self.name_shard(shard, last=True)
+                shard = None
+            if shard is not None and not shard.fits(widget_count, body_bytes, self.max_widgets, self.max_body_bytes):
+                yield self.name_shard(shard, last=False)
+                shard = Shard(service, shard.part + 1)
+            if shard is None:
+                shard = Shard(service, 1)
+            shard.add(block, widget_count, body_bytes)
+        yield self.name_shard(shard, last=True)
+
+    def name_shard(self, shard: Shard, last: bool):
+        '''Name a complete shard, numbered unless it is the only one of its service'''
+        if last and shard.part == 1:
+            shard.part = None
+        shard.name = f'{self.dashboard_name}-{shard.service}' + (f'-{shard.part}' if shard.part else '')
+        return shard
+
+    def plan(self, services):
+        '''Get the shards of services, see shards()'''
+        return list(self.shards(services))
+
+    def index_markdown(self, shards: list):
+        '''Markdown of the index dashboard, with a link to each shard'''
+        lines = [f'# {self.dashboard_name}', '']
+        for service in dict.fromkeys(shard.service for shard in shards):
+            service_shards = [shard for shard in shards if shard.service == service]
+            lines.append(f'### {service}')
+            for i, shard in enumerate(service_shards, start=1):
+                part = f' ({i}/{len(service_shards)})' if len(service_shards) > 1 else ''
+                lines.append(f'* [{service}{part}](#dashboards:name={shard.name}) - {shard.widget_count} widgets')
+            lines.append('')
+        return '\n'.join(lines)
+
+    def flush(self, shard: Shard, construct_id: str):
+        '''Create the dashboard of a shard, releasing its widgets'''
+        if python_rendering():
+            dashboard = self.render_dashboard(shard.name, shard.widgets, construct_id)
+            shard.widgets = []
+            return dashboard
+        dashboard = aws_cloudwatch.Dashboard(self.stack, construct_id, dashboard_name=shard.name, **self.dashboard_props)
+        for i in range(0, len(shard.widgets), WIDGETS_PER_BATCH):
+            # stacked in a column, as they would be by separate calls
+            dashboard.add_widgets(aws_cloudwatch.Column(*shard.widgets[i:i + WIDGETS_PER_BATCH]))
+        shard.widgets = []
+        return dashboard
+
+    def render_dashboard(self, dashboard_name: str, widgets: list, construct_id: str):
+        '''Create a dashboard from the body of widgets rendered in Python'''
+        body = render.dashboard_body(widgets, **self.dashboard_props)
+        if self.preview_dir:
+            self.preview(dashboard_name, body)
+        # same construct path, hence logical id, as the Dashboard construct
+        scope = Construct(self.stack, construct_id)
+        return aws_cloudwatch.CfnDashboard(scope, 'Resource', dashboard_name=dashboard_name,
+            dashboard_body=self.stack.to_json_string(body))
+
+    def preview(self, dashboard_name: str, body: dict):
+        '''Write the body of a dashboard to preview_dir, e.g. for aws cloudwatch put-dashboard'''
+        os.makedirs(self.preview_dir, exist_ok=True)
+        region = None
+        if self.stack is not None and not Token.is_unresolved(self.stack.region):
+            region = self.stack.region
+        with open(os.path.join(self.preview_dir, f'{dashboard_name}.json'), 'w') as f:
+            f.write(render.to_json_string(body, region))
+
+    def layout(self, services):
+        '''
+        Yield the (construct id, shard) of the dashboards of services, an
+        iterable of (service name, widgets), each shard as soon as it is
+        complete. When the widgets are split, the index comes last.
+        '''
+        shards = []
+        for shard in self.shards(services):
+            if shard.service is None:
+                yield "CWTAG", shard
+                return
+            yield f'CWTAG{shard.service}{shard.part or ""}', shard
+            shards.append(shard)
+
+        markdown = self.index_markdown(shards)
+        index = Shard(None)
+        index.name = self.dashboard_name
+        index.add([cloudwatch.TextWidget(markdown=markdown, width=24, height=markdown.count('\n') + 2)], 1, 0)
+        yield "CWTAG", index
+
+    def build(self, services):
+        '''Create the dashboards of services, an iterable of (service name, widgets), returning them'''
+        dashboards = [self.flush(shard, construct_id) for construct_id, shard in self.layout(services)]
+        # the index is created last, once the shards are known
+        return dashboards[-1:] + dashboards[:-1]
+
+    def render_bodies(self, services):
+        '''
+        Get the (dashboard name, body) of the dashboards of services, rendered
+        in Python without a stack, the index first
+        '''
+        bodies = []
+        for _, shard in self.layout(services):
+            body = render.dashboard_body(shard.widgets, **self.dashboard_props)
+            shard.widgets = []
+            if self.preview_dir:
+                self.preview(shard.name, body)
+            bodies.append((shard.name, body))
+        return bodies[-1:] + bodies[:-1]
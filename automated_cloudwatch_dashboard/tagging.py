@@ -0,0 +1,83 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import threading
+from .clients import ClientFactory
+from .pagination import paginate
+
+class TagIndex():
+    '''
+    Index of the tagged resources, built with a single Resource Groups Tagging
+    API sweep shared by all the service modules.
+
+    The sweep requests all the resource types at once, at the maximum page
+    size, and runs the first time the index is read. The result is indexed by
+    resource type (e.g. s3:bucket), each entry being the list of the
+    ResourceTagMapping returned by the API.
+    '''
+
+    # maximum page size of get_resources
+    RESOURCES_PER_PAGE = 100
+
+    def __init__(self, region: str, tag: str, tag_values: list, resource_types: list, clients: ClientFactory = None):
+        self.region = region
+        self.tag_name = tag
+        self.tag_values = tag_values
+        self.resource_types = sorted(set(resource_types))
+        self.clients = clients or ClientFactory()
+        self._resources = None
+        self._lock = threading.Lock()
+
+    def get(self, resource_type: str):
+        '''Get the resources of resource_type matching the tag'''
+        if resource_type not in self.resource_types:
+            raise KeyError(f'Resource type {resource_type} is not part of the tagging sweep')
+        with self._lock:
+            if self._resources is None:
+                self._resources = self.sweep()
+        return self._resources[resource_type]
+
+    def sweep(self):
+        '''Get all the tagged resources of the indexed resource types'''
+        resources = {resource_type: [] for resource_type in self.resource_types}
+        if not self.resource_types:
+            return resources
+
+        boto3client = self.clients.client('resourcegroupstaggingapi', self.region)
+        tagged = paginate(boto3client, 'get_resources', page_size=self.RESOURCES_PER_PAGE, prefetch=True,
+            TagFilters=[
+                {
+                'Key': self.tag_name,
+                'Values': self.tag_values
+                },
+            ],
+            ResourceTypeFilters=self.resource_types
+        )
+        for resource in tagged:
+            resource_type = self.get_resource_type(resource['ResourceARN'])
+            if resource_type in resources:
+                resources[resource_type].append(resource)
+        return resources
+
+    @staticmethod
+    def get_resource_type(arn: str):
+        '''Get the resource type (service:type) of an ARN'''
+        # arn:partition:service:region:account:resource
+        parts = arn.split(':', 5)
+        service, resource = parts[2], parts[5]
+        if service == 's3' and '/' not in resource:
+            return 's3:bucket'
+        return f'{service}:{resource.split("/")[0].split(":")[0]}'
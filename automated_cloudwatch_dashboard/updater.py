@@ -0,0 +1,156 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+'''
+Direct update of the dashboards, a fast path next to the pipeline.
+
+The pipeline takes minutes to apply a tag change: CodeBuild installs the
+CDK, synthesizes the app and CloudFormation deploys the template. The
+updater function, packaged from the same service modules and configuration
+but without aws_cdk, runs the discovery on each tag change event, renders
+the body of each dashboard in Python and puts it with PutDashboard, which
+takes seconds. The pipeline still deploys the changes of the code and of
+the configuration.
+
+The events are delivered to the function through an SQS queue, in batches:
+a burst of events runs a single update. The shards the new layout no longer
+has are deleted, so between two deployments the dashboards are those of the
+updater, not of CloudFormation; the next deployment puts the layout of the
+stack back.
+
+Usage (the dashboards of the current credentials and region):
+    python -m automated_cloudwatch_dashboard.updater
+'''
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from omegaconf import OmegaConf
+from . import render
+from .clients import ClientFactory
+from .discovery import SUPPORTED_SERVICES, discover_inventory, fatal_failures, DiscoveryError
+from .inventory import InventoryStore
+from .sharding import DashboardSharder
+from .widgets import dashboard_props, renderer, with_header
+
+# number of dashboards deleted by a single DeleteDashboards call
+DELETE_BATCH_SIZE = 100
+
+def render_dashboards(conf, region: str, account: str, clients: ClientFactory, inventory: InventoryStore = None):
+    '''
+    Get the (name, body) of the dashboards of conf in region and account, as
+    the stack would deploy them, the body being rendered with region in place
+    of the region of the stack
+    '''
+    results = discover_inventory(conf, region, account, clients, inventory)
+    for result in results:
+        if not result.ok:
+            print(f'Discovery failed for {result.name}: {result.error!r}', file=sys.stderr)
+    fatal = fatal_failures(conf, results)
+    if fatal:
+        raise DiscoveryError(fatal)
+
+    with renderer('python'):
+        sharder = DashboardSharder.from_options(None, conf.dashboard_name or 'Automated-CloudWatch-Dashboard',
+            OmegaConf.select(conf, 'sharding', default=None), dashboard_props=dashboard_props())
+        bodies = sharder.render_bodies((result.name, with_header(result.header, result.service.get_widgets())
+            if result.header else result.service.get_widgets()) for result in results if result.ok)
+    return [(name, render.to_json_string(body, region)) for name, body in bodies]
+
+def put_dashboards(cloudwatch, dashboards: list):
+    '''Put the (name, body) of dashboards with a CloudWatch client, printing the validation messages'''
+    for name, body in dashboards:
+        response = cloudwatch.put_dashboard(DashboardName=name, DashboardBody=body)
+        for message in response.get('DashboardValidationMessages', []):
+            print(f'{name}: {message.get("DataPath", "")} {message.get("Message", "")}', file=sys.stderr)
+
+def stale_dashboards(cloudwatch, dashboard_name: str, names: list):
+    '''
+    Get the dashboards of dashboard_name missing from names: the index and
+    the shards (<dashboard_name>-<service>[-...]) of a previous layout
+    '''
+    shard_prefixes = tuple(f'{dashboard_name}-{service}' for service in SUPPORTED_SERVICES)
+    stale = []
+    for page in cloudwatch.get_paginator('list_dashboards').paginate(DashboardNamePrefix=dashboard_name):
+        for entry in page.get('DashboardEntries', []):
+            name = entry['DashboardName']
+            if name in names:
+                continue
+            # other dashboards may share the prefix, e.g. <dashboard_name>-Test
+            if name == dashboard_name or any(name == prefix or name.startswith(f'{prefix}-') for prefix in shard_prefixes):
+                stale.append(name)
+    return stale
+
+def delete_dashboards(cloudwatch, names: list):
+    for i in range(0, len(names), DELETE_BATCH_SIZE):
+        cloudwatch.delete_dashboards(DashboardNames=names[i:i + DELETE_BATCH_SIZE])
+
+def writable_catalog(conf):
+    '''Move the nitro catalog of conf to the temporary directory, the code of the function being read-only'''
+    path = OmegaConf.select(conf, 'services.EC2.nitro_catalog.path', default='nitro_catalog.json')
+    writable = os.path.join(tempfile.gettempdir(), os.path.basename(path))
+    if not os.path.exists(writable) and os.path.exists(path):
+        shutil.copyfile(path, writable)
+    OmegaConf.update(conf, 'services.EC2.nitro_catalog.path', writable, force_add=True)
+
+def update(conf, region: str, account: str, clients: ClientFactory):
+    '''
+    Discover, render and put the dashboards of conf, then delete those of the
+    previous layout, returning the names of the dashboards put and deleted
+    '''
+    dashboards = render_dashboards(conf, region, account, clients)
+    names = [name for name, _ in dashboards]
+    cloudwatch = clients.client('cloudwatch', region)
+    put_dashboards(cloudwatch, dashboards)
+    # once the new index is put, so that it never links to a deleted shard
+    deleted = stale_dashboards(cloudwatch, conf.dashboard_name or 'Automated-CloudWatch-Dashboard', names)
+    delete_dashboards(cloudwatch, deleted)
+    return names, deleted
+
+def handler(event: dict, context):
+    '''Lambda function run on each batch of tag change events, a single update for all of them'''
+    conf = OmegaConf.load(os.getenv('CONFIG', 'config.yaml'))
+    writable_catalog(conf)
+    clients = ClientFactory.from_options(OmegaConf.select(conf, 'clients', default=None))
+    # arn:<partition>:lambda:<region>:<account>:function:<name>
+    account = context.invoked_function_arn.split(':')[4]
+    names, deleted = update(conf, os.environ['AWS_REGION'], account, clients)
+    events = len(event.get('Records', [])) or 1
+    print(f'Updated {len(names)} dashboard(s) for {events} event(s): {", ".join(names)}')
+    if deleted:
+        print(f'Deleted {len(deleted)} dashboard(s): {", ".join(deleted)}')
+    return dict(dashboards=names, deleted=deleted, events=events)
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='Put the dashboards of the tagged resources, without the pipeline')
+    parser.add_argument('--config', default='config.yaml')
+    parser.add_argument('--region', help='region of the dashboards, that of the credentials by default')
+    args = parser.parse_args(argv)
+
+    conf = OmegaConf.load(args.config)
+    clients = ClientFactory.from_options(OmegaConf.select(conf, 'clients', default=None))
+    region = args.region or clients.session.region_name
+    account = clients.client('sts', region).get_caller_identity()['Account']
+    names, deleted = update(conf, region, account, clients)
+    print(f'Updated {len(names)} dashboard(s): {", ".join(names)}')
+    if deleted:
+        print(f'Deleted {len(deleted)} dashboard(s): {", ".join(deleted)}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
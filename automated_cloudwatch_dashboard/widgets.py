@@ -0,0 +1,85 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+'''
+Toolkit the widgets are built with.
+
+The service modules build their widgets with the cdk and cloudwatch objects
+of this module, which resolve their attributes in aws_cdk and
+aws_cdk.aws_cloudwatch (the constructs renderer, the default), or in the
+render module (the python renderer) while renderer('python') is active.
+Without aws_cdk (e.g. in the updater function), only the python renderer is
+available.
+'''
+
+import contextlib
+import contextvars
+from . import render
+try:
+    import aws_cdk
+    import aws_cdk.aws_cloudwatch
+except ImportError:
+    aws_cdk = None
+
+RENDERERS = ('constructs', 'python')
+
+_renderer = contextvars.ContextVar('renderer', default='constructs')
+
+class Toolkit():
+    '''Module whose attributes are looked up in the module of the active renderer'''
+
+    def __init__(self, constructs, python):
+        self._modules = dict(constructs=constructs, python=python)
+
+    def __getattr__(self, name: str):
+        module = self._modules[_renderer.get()]
+        # the default arguments of the widget helpers are evaluated at import,
+        # with the python renderer when aws_cdk is not installed
+        return getattr(module if module is not None else self._modules['python'], name)
+
+cdk = Toolkit(aws_cdk, render)
+cloudwatch = Toolkit(aws_cdk.aws_cloudwatch if aws_cdk is not None else None, render)
+
+def python_rendering():
+    '''Check if the widgets are rendered in Python'''
+    return _renderer.get() == 'python'
+
+def dashboard_props():
+    '''Properties of the dashboards: the last 24 hours, each graph with the period matching its time range'''
+    return dict(period_override=cloudwatch.PeriodOverride.AUTO, start='-PT24H')
+
+def with_header(markdown: str, widgets):
+    '''Yield a header TextWidget of markdown followed by widgets, nothing if widgets is empty'''
+    widgets = iter(widgets)
+    first = next(widgets, None)
+    if first is None:
+        return
+    yield cloudwatch.TextWidget(markdown=markdown, height=1, width=24)
+    yield first
+    yield from widgets
+
+@contextlib.contextmanager
+def renderer(name: str):
+    '''Build the widgets with the renderer name, one of RENDERERS'''
+    if name not in RENDERERS:
+        raise ValueError(f'Unknown renderer {name}, expected one of {", ".join(RENDERERS)}')
+    if name == 'constructs' and aws_cdk is None:
+        raise ImportError('The constructs renderer requires aws_cdk, use the python renderer')
+    token = _renderer.set(name)
+    try:
+        yield
+    finally:
+        _renderer.reset(token)
@@ -0,0 +1,192 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+'''
+Scale benchmark of the synth of AutomatedCloudWatchDashboardStack.
+
+For each size, the discovery responses of a synthetic account are recorded in
+a fixture, then the stack is synthesized end to end from the fixture in a
+separate process, measuring:
+
+    * the wall time of the stack construction (discovery and widgets) and of the synth
+    * the number of API calls and their latency, by service and operation
+    * the peak RSS of the Python process (the jsii node process is not included)
+    * the number of widgets and dashboards and the size of the synthesized template
+
+Usage:
+    python -m benchmarks.run --scale 0.01 --scale 0.1 --output benchmarks/results.json
+    python -m benchmarks.run --size instances=2000 --size albs=100 --size buckets=0
+    python -m benchmarks.run --scale 1 --renderer python
+'''
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from . import synthetic
+
+def parse_size(value: str):
+    name, _, number = value.partition('=')
+    if name not in synthetic.DEFAULT_SIZES:
+        raise argparse.ArgumentTypeError(f'Unknown size {name}, expected one of {", ".join(synthetic.DEFAULT_SIZES)}')
+    return name, float(number) if name.endswith('_ratio') else int(number)
+
+def scaled(sizes: dict, scale: float):
+    '''Scale the resource counts of sizes, keeping ratios and per-resource counts'''
+    return {name: value if name.endswith(('_ratio', '_per_instance', '_per_alb')) else int(round(value * scale))
+        for name, value in sizes.items()}
+
+def count_widgets(template: dict):
+    '''Count the widgets of the dashboards of a synthesized template'''
+    widgets = 0
+    for resource in template.get('Resources', {}).values():
+        if resource['Type'] != 'AWS::CloudWatch::Dashboard':
+            continue
+        body = resource['Properties']['DashboardBody']
+        if isinstance(body, dict):
+            # Fn::Join of the body parts and the tokens (e.g. the region)
+            body = ''.join(part for part in body['Fn::Join'][1] if isinstance(part, str))
+        # each widget has exactly one properties entry
+        widgets += body.count('"properties":')
+    return widgets
+
+def synth(fixture: str, workdir: str, trace_memory: bool = False, renderer: str = 'constructs'):
+    '''Synthesize the stack from fixture, in the current process'''
+    import aws_cdk as core
+    from automated_cloudwatch_dashboard.automated_cloudwatch_dashboard_stack import AutomatedCloudWatchDashboardStack
+
+    config = os.path.join(workdir, 'config.yaml')
+    with open(config, 'w') as f:
+        f.write(
+            'dashboard_name: Automated-CloudWatch-Dashboard-Benchmark\n'
+            f'tag_name: {synthetic.TAG_NAME}\n'
+            f'tag_values:\n  - {synthetic.TAG_VALUE}\n'
+            'instrumentation:\n  enabled: true\n  summary: false\n'
+            f'  path: {os.path.join(workdir, "discovery_report.json")}\n'
+            f'rendering:\n  renderer: {renderer}\n'
+        )
+    # peak of the Python allocations (the discovery and the constructs, not
+    # the jsii runtime) while the stack is constructed. Tracing slows the
+    # construction down, so it is only enabled on demand
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    app = core.App(outdir=os.path.join(workdir, 'cdk.out'), context=dict(config=config, replay=fixture))
+    stack = AutomatedCloudWatchDashboardStack(app, 'automated-cloudwatch-dashboard-benchmark',
+        env=core.Environment(account=synthetic.ACCOUNT, region=synthetic.REGION))
+    constructed = time.perf_counter()
+    peak_traced = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    tracemalloc.stop()
+    assembly = app.synth()
+    synthesized = time.perf_counter()
+
+    artifact = assembly.get_stack_artifact(stack.artifact_id)
+    with open(os.path.join(workdir, 'discovery_report.json')) as f:
+        discovery = json.load(f)
+    return dict(
+        api_calls={f'{operation["service"]}.{operation["operation"]}': operation['calls'] for operation in discovery['operations']},
+        api_calls_total=discovery['totals']['calls'],
+        discovery=discovery['operations'],
+        construct_seconds=round(constructed - started, 3),
+        synth_seconds=round(synthesized - constructed, 3),
+        wall_seconds=round(synthesized - started, 3),
+        # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+        peak_traced_mb=round(peak_traced / (1024 * 1024), 1) if trace_memory else None,
+        peak_rss_mb=round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+        widgets=count_widgets(artifact.template),
+        dashboards=sum(1 for resource in artifact.template['Resources'].values() if resource['Type'] == 'AWS::CloudWatch::Dashboard'),
+        template_bytes=os.path.getsize(artifact.template_full_path),
+    )
+
+def run(sizes: dict, workdir: str, trace_memory: bool = False, renderer: str = 'constructs'):
+    '''Generate the fixture of sizes and synthesize the stack from it in a separate process'''
+    fixture = os.path.join(workdir, 'discovery.json')
+    started = time.perf_counter()
+    synthetic.generate_fixture(fixture, sizes)
+    generated = time.perf_counter()
+    output = os.path.join(workdir, 'result.json')
+    subprocess.run(
+        [sys.executable, '-m', 'benchmarks.run', '--synth', fixture, '--workdir', workdir, '--output', output,
+            '--renderer', renderer] + (['--trace-memory'] if trace_memory else []),
+        check=True
+    )
+    with open(output) as f:
+        result = json.load(f)
+    if trace_memory:
+        result['discovery_memory'] = synthetic.measure_discovery(sizes)
+    return dict(
+        sizes=sizes,
+        fixture_seconds=round(generated - started, 3),
+        fixture_bytes=os.path.getsize(fixture),
+        **result
+    )
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='Scale benchmark of the synth of the dashboard stack')
+    parser.add_argument('--size', type=parse_size, action='append', default=[],
+        help='resource count of the synthetic account, e.g. instances=10000 (see synthetic.DEFAULT_SIZES)')
+    parser.add_argument('--scale', type=float, action='append', default=[],
+        help='run the benchmark with the sizes scaled by this factor, can be repeated to get a scaling curve')
+    parser.add_argument('--output', default='benchmarks/results.json', help='JSON file the results are written to')
+    parser.add_argument('--trace-memory', action='store_true',
+        help='report the peak of the Python allocations during the construction of the stack (slower)')
+    parser.add_argument('--renderer', choices=('constructs', 'python'), default='constructs',
+        help='renderer of the dashboard bodies (see rendering.renderer in config.yaml)')
+    parser.add_argument('--synth', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.synth:
+        # child process, synthesizing the stack from a single fixture
+        with open(args.output, 'w') as f:
+            json.dump(synth(args.synth, args.workdir, args.trace_memory, args.renderer), f)
+        return 0
+
+    sizes = dict(synthetic.DEFAULT_SIZES, **dict(args.size))
+    runs = []
+    for scale in args.scale or [1.0]:
+        run_sizes = scaled(sizes, scale)
+        with tempfile.TemporaryDirectory(prefix='benchmark') as workdir:
+            result = run(run_sizes, workdir, args.trace_memory, args.renderer)
+        result['scale'] = scale
+        result['renderer'] = args.renderer
+        runs.append(result)
+        print(f'scale {scale:g}: {result["wall_seconds"]}s, {result["api_calls_total"]} API calls, '
+            f'{result["widgets"]} widgets in {result["dashboards"]} dashboard(s), {result["template_bytes"]} template bytes, {result["peak_rss_mb"]} MB peak RSS'
+            + (f', {result["peak_traced_mb"]} MB peak traced' if args.trace_memory else ''))
+
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(dict(
+            version=1,
+            created=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            runs=runs
+        ), f, indent=1)
+    print(f'Results written to {args.output}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
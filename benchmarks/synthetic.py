@@ -0,0 +1,343 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+'''
+Synthetic AWS account used by the benchmarks.
+
+SyntheticAccount answers the discovery calls of the service modules with
+generated resources, honouring the filters, page sizes and pagination tokens
+of each request. generate_fixture() runs the discovery of all the service
+modules against it in record mode, producing a fixture that the stack can
+replay with `-c replay=<path>`. measure_discovery() reports the memory
+used by the discovery of each service module.
+
+The resources carry the fields of real responses (block device mappings,
+network interfaces, security groups...), most of them never read by the
+service modules, and each call returns new objects, as botocore does.
+'''
+
+import boto3
+import copy
+import datetime
+import tracemalloc
+from importlib import import_module
+from automated_cloudwatch_dashboard.clients import ClientFactory
+from automated_cloudwatch_dashboard.recording import Recorder, ReplayedResponse
+from automated_cloudwatch_dashboard.tagging import TagIndex
+
+ACCOUNT = '123456789012'
+REGION = 'eu-west-1'
+TAG_NAME = 'Dashboard'
+TAG_VALUE = 'benchmark'
+
+# number of resources of each kind in the synthetic account
+DEFAULT_SIZES = dict(
+    instances=10000,
+    # share of the instances running on non-Nitro instance types, which get per-volume widgets
+    non_nitro_ratio=0.2,
+    volumes_per_instance=2,
+    buckets=2000,
+    albs=500,
+    target_groups_per_alb=20,
+    as_groups=200,
+    outposts=0,
+)
+
+NITRO_TYPES = ['m5.large', 'c5.xlarge', 'r5.2xlarge', 't3.medium']
+NON_NITRO_TYPES = ['t2.micro', 'm4.large', 'c4.xlarge']
+OUTPOST_INSTANCE_TYPES = ['m5.large', 'c5.xlarge', 'r5.2xlarge']
+
+class SyntheticAccount():
+    '''Generated resources of an account, served through botocore before-call events'''
+
+    def __init__(self, sizes: dict = None):
+        self.sizes = dict(DEFAULT_SIZES, **(sizes or {}))
+        self.instances = self.generate_instances()
+        self.volumes = self.generate_volumes()
+        self.load_balancers = [
+            f'arn:aws:elasticloadbalancing:{REGION}:{ACCOUNT}:loadbalancer/app/alb-{i}/{i:016x}'
+            for i in range(self.sizes['albs'])
+        ]
+        self.target_groups = [
+            dict(
+                TargetGroupArn=f'arn:aws:elasticloadbalancing:{REGION}:{ACCOUNT}:targetgroup/tg-{i}-{j}/{i * 1000 + j:016x}',
+                TargetGroupName=f'tg-{i}-{j}',
+                LoadBalancerArns=[alb_arn]
+            )
+            for i, alb_arn in enumerate(self.load_balancers)
+            for j in range(self.sizes['target_groups_per_alb'])
+        ]
+        self.buckets = [f'arn:aws:s3:::benchmark-bucket-{i}' for i in range(self.sizes['buckets'])]
+        self.as_groups = [
+            dict(
+                AutoScalingGroupName=f'asg-{i}',
+                MinSize=1, MaxSize=4, DesiredCapacity=2, DefaultCooldown=300,
+                AvailabilityZones=[f'{REGION}a'], HealthCheckType='EC2', HealthCheckGracePeriod=300,
+                AutoScalingGroupARN=f'arn:aws:autoscaling:{REGION}:{ACCOUNT}:autoScalingGroup:{i:08x}:autoScalingGroupName/asg-{i}',
+                LaunchTemplate=dict(LaunchTemplateId=f'lt-{i:017x}', LaunchTemplateName=f'lt-{i}', Version='$Latest'),
+                Instances=[
+                    dict(InstanceId=f'i-{i * 16 + j:017x}', InstanceType='m5.large', AvailabilityZone=f'{REGION}a',
+                        LifecycleState='InService', HealthStatus='Healthy', ProtectedFromScaleIn=False,
+                        LaunchTemplate=dict(LaunchTemplateId=f'lt-{i:017x}', LaunchTemplateName=f'lt-{i}', Version='1'))
+                    for j in range(2)
+                ],
+                CreatedTime=datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc),
+                VPCZoneIdentifier='subnet-0123456789abcdef0', TerminationPolicies=['Default'],
+                NewInstancesProtectedFromScaleIn=False, ServiceLinkedRoleARN=f'arn:aws:iam::{ACCOUNT}:role/aws-service-role/autoscaling.amazonaws.com/AWSServiceRoleForAutoScaling',
+                CapacityRebalance=False, TrafficSources=[], SuspendedProcesses=[], EnabledMetrics=[],
+                LoadBalancerNames=[], TargetGroupARNs=[],
+                Tags=[dict(Key=TAG_NAME, Value=TAG_VALUE, ResourceId=f'asg-{i}', ResourceType='auto-scaling-group', PropagateAtLaunch=False)]
+            )
+            for i in range(self.sizes['as_groups'])
+        ]
+        self.outposts = [
+            dict(
+                OutpostId=f'op-{i:017x}',
+                OutpostArn=f'arn:aws:outposts:{REGION}:{ACCOUNT}:outpost/op-{i:017x}',
+                OwnerId=ACCOUNT,
+                Name=f'outpost-{i}',
+                LifeCycleStatus='ACTIVE',
+                Tags={TAG_NAME: TAG_VALUE}
+            )
+            for i in range(self.sizes['outposts'])
+        ]
+
+    def generate_instances(self):
+        count = self.sizes['instances']
+        non_nitro = int(count * self.sizes['non_nitro_ratio'])
+        instances = []
+        for i in range(count):
+            types = NON_NITRO_TYPES if i < non_nitro else NITRO_TYPES
+            instances.append(self.generate_instance(f'i-{i:017x}', types[i % len(types)],
+                [dict(Key=TAG_NAME, Value=TAG_VALUE), dict(Key='Name', Value=f'instance-{i}')]))
+        return instances
+
+    def generate_instance(self, instance_id: str, instance_type: str, tags: list):
+        '''Instance with the fields of a describe_instances response'''
+        number = int(instance_id[2:], 16)
+        ip = f'10.{number >> 16 & 255}.{number >> 8 & 255}.{number & 255}'
+        eni = f'eni-{number:017x}'
+        launched = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        return dict(
+            AmiLaunchIndex=0, ImageId='ami-0123456789abcdef0', InstanceId=instance_id, InstanceType=instance_type,
+            KeyName='benchmark', LaunchTime=launched, Monitoring=dict(State='disabled'),
+            Placement=dict(AvailabilityZone=f'{REGION}a', GroupName='', Tenancy='default'),
+            PrivateDnsName=f'ip-{ip.replace(".", "-")}.{REGION}.compute.internal', PrivateIpAddress=ip,
+            ProductCodes=[], PublicDnsName='', State=dict(Code=16, Name='running'), StateTransitionReason='',
+            SubnetId='subnet-0123456789abcdef0', VpcId='vpc-0123456789abcdef0', Architecture='x86_64',
+            BlockDeviceMappings=[
+                dict(DeviceName=f'/dev/xvd{chr(97 + j)}', Ebs=dict(AttachTime=launched, DeleteOnTermination=True,
+                    Status='attached', VolumeId=f'vol-{number * 8 + j:017x}'))
+                for j in range(self.sizes['volumes_per_instance'])
+            ],
+            ClientToken='', EbsOptimized=False, EnaSupport=True, Hypervisor='xen',
+            IamInstanceProfile=dict(Arn=f'arn:aws:iam::{ACCOUNT}:instance-profile/benchmark', Id='AIPA0123456789ABCDEF0'),
+            NetworkInterfaces=[dict(
+                Attachment=dict(AttachTime=launched, AttachmentId=f'eni-attach-{number:017x}', DeleteOnTermination=True,
+                    DeviceIndex=0, Status='attached', NetworkCardIndex=0),
+                Description='', Groups=[dict(GroupName='benchmark', GroupId='sg-0123456789abcdef0')], Ipv6Addresses=[],
+                MacAddress='02:00:00:00:00:00', NetworkInterfaceId=eni, OwnerId=ACCOUNT,
+                PrivateDnsName=f'ip-{ip.replace(".", "-")}.{REGION}.compute.internal', PrivateIpAddress=ip,
+                PrivateIpAddresses=[dict(Primary=True, PrivateIpAddress=ip)], SourceDestCheck=True, Status='in-use',
+                SubnetId='subnet-0123456789abcdef0', VpcId='vpc-0123456789abcdef0', InterfaceType='interface'
+            )],
+            RootDeviceName='/dev/xvda', RootDeviceType='ebs',
+            SecurityGroups=[dict(GroupName='benchmark', GroupId='sg-0123456789abcdef0')], SourceDestCheck=True,
+            Tags=tags, VirtualizationType='hvm', CpuOptions=dict(CoreCount=1, ThreadsPerCore=2),
+            CapacityReservationSpecification=dict(CapacityReservationPreference='open'),
+            HibernationOptions=dict(Configured=False),
+            MetadataOptions=dict(State='applied', HttpTokens='required', HttpPutResponseHopLimit=2, HttpEndpoint='enabled'),
+            EnclaveOptions=dict(Enabled=False), PlatformDetails='Linux/UNIX', UsageOperation='RunInstances',
+            UsageOperationUpdateTime=launched,
+            PrivateDnsNameOptions=dict(HostnameType='ip-name', EnableResourceNameDnsARecord=False, EnableResourceNameDnsAAAARecord=False),
+            MaintenanceOptions=dict(AutoRecovery='default'), CurrentInstanceBootMode='legacy-bios'
+        )
+
+    def generate_volumes(self):
+        volumes = []
+        for instance in self.instances:
+            for j in range(self.sizes['volumes_per_instance']):
+                # the volume of the block device mapping j of the instance
+                volume_id = f'vol-{int(instance["InstanceId"][2:], 16) * 8 + j:017x}'
+                volumes.append(dict(
+                    VolumeId=volume_id,
+                    Size=8, VolumeType='gp3', State='in-use',
+                    Attachments=[dict(InstanceId=instance['InstanceId'], VolumeId=volume_id,
+                        Device=f'/dev/xvd{chr(97 + j)}', State='attached')]
+                ))
+        return volumes
+
+    @staticmethod
+    def paginate(items: list, params: dict, key: str, token: str = 'NextToken', size: str = 'MaxResults', default_size: int = 1000):
+        '''Get a page of items, tokens being offsets in items'''
+        start = int(params.get(token) or 0)
+        end = start + params.get(size, default_size)
+        response = {key: items[start:end]}
+        if end < len(items):
+            response[token] = str(end)
+        return response
+
+    @staticmethod
+    def filter_values(params: dict, name: str):
+        for f in params.get('Filters', []):
+            if f['Name'] == name:
+                return f['Values']
+        return None
+
+    def respond(self, service: str, operation: str, params: dict):
+        '''Get the response of a call'''
+        handler = getattr(self, f'{service}_{operation}', None)
+        if handler is None:
+            raise NotImplementedError(f'{service}.{operation} is not implemented by the synthetic account')
+        return handler(params)
+
+    def ec2_DescribeInstances(self, params):
+        values = self.filter_values(params, f'tag:{TAG_NAME}')
+        instances = self.instances if values is None or TAG_VALUE in values else []
+        response = self.paginate(instances, params, 'Reservations')
+        response['Reservations'] = [dict(ReservationId=f'r-{instance["InstanceId"][2:]}', OwnerId=ACCOUNT, Instances=[instance])
+            for instance in response['Reservations']]
+        return response
+
+    def ec2_DescribeInstanceTypes(self, params):
+        return dict(InstanceTypes=[
+            dict(InstanceType=instance_type, Hypervisor='nitro' if instance_type in NITRO_TYPES else 'xen')
+            for instance_type in params.get('InstanceTypes', [])
+        ])
+
+    def ec2_DescribeVolumes(self, params):
+        instance_ids = set(self.filter_values(params, 'attachment.instance-id') or [])
+        volumes = [volume for volume in self.volumes
+            if any(attachment['InstanceId'] in instance_ids for attachment in volume['Attachments'])]
+        return self.paginate(volumes, params, 'Volumes')
+
+    def tagging_GetResources(self, params):
+        resource_types = params.get('ResourceTypeFilters', [])
+        arns = []
+        if 's3:bucket' in resource_types or 's3' in resource_types:
+            arns.extend(self.buckets)
+        if 'elasticloadbalancing:loadbalancer' in resource_types or 'elasticloadbalancing' in resource_types:
+            arns.extend(self.load_balancers)
+        mappings = [dict(ResourceARN=arn, Tags=[dict(Key=TAG_NAME, Value=TAG_VALUE)]) for arn in arns]
+        response = self.paginate(mappings, params, 'ResourceTagMappingList', 'PaginationToken', 'ResourcesPerPage', 50)
+        response.setdefault('PaginationToken', '')
+        return response
+
+    def elbv2_DescribeTargetGroups(self, params):
+        target_groups = self.target_groups
+        if 'LoadBalancerArn' in params:
+            target_groups = [tg for tg in target_groups if params['LoadBalancerArn'] in tg['LoadBalancerArns']]
+        response = self.paginate(target_groups, params, 'TargetGroups', 'Marker', 'PageSize', 400)
+        if 'Marker' in response:
+            response['NextMarker'] = response.pop('Marker')
+        return response
+
+    def autoscaling_DescribeAutoScalingGroups(self, params):
+        if 'AutoScalingGroupNames' in params:
+            names = set(params['AutoScalingGroupNames'])
+            return dict(AutoScalingGroups=[group for group in self.as_groups if group['AutoScalingGroupName'] in names])
+        values = self.filter_values(params, f'tag:{TAG_NAME}')
+        as_groups = self.as_groups if values is None or TAG_VALUE in values else []
+        return self.paginate(as_groups, params, 'AutoScalingGroups', size='MaxRecords', default_size=50)
+
+    def outposts_ListOutposts(self, params):
+        return self.paginate(self.outposts, params, 'Outposts')
+
+    def outposts_GetOutpostInstanceTypes(self, params):
+        instance_types = [dict(InstanceType=instance_type) for instance_type in OUTPOST_INSTANCE_TYPES]
+        return self.paginate(instance_types, params, 'InstanceTypes')
+
+    def attach(self, client):
+        '''ClientFactory hook answering all the calls of client'''
+        service = client.meta.service_model.service_name
+        # the model name of the Resource Groups Tagging API is tagging
+        service = 'tagging' if service == 'resourcegroupstaggingapi' else service
+
+        def before_parameter_build(params, context, **kwargs):
+            context['synthetic_params'] = dict(params)
+
+        def before_call(model, context, **kwargs):
+            # a copy, as botocore parses a new response for each call
+            return ReplayedResponse(200), copy.deepcopy(self.respond(service, model.name, context['synthetic_params']))
+
+        client.meta.events.register('before-parameter-build', before_parameter_build)
+        client.meta.events.register('before-call', before_call)
+
+SERVICES = ['EC2', 'S3', 'ELB', 'AutoScaling', 'Outposts']
+
+def synthetic_clients():
+    # the calls never reach AWS, the credentials are only needed to build the clients
+    session = boto3.session.Session(aws_access_key_id='benchmark', aws_secret_access_key='benchmark', region_name=REGION)
+    clients = ClientFactory(session=session)
+    # keeps the Nitro catalog off disk
+    clients.hermetic = True
+    return clients
+
+def service_classes(services: list = None):
+    classes = []
+    for name in services or SERVICES:
+        module = import_module(f'automated_cloudwatch_dashboard.services.{name}')
+        classes.append(getattr(module, name))
+    return classes
+
+def generate_fixture(path: str, sizes: dict = None, services: list = None):
+    '''
+    Record the discovery of the service modules against a synthetic account
+    in a fixture. Returns the recorded calls, by service and operation.
+    '''
+    account = SyntheticAccount(sizes)
+    clients = synthetic_clients()
+    recorder = Recorder(path).install(clients)
+    clients.add_hook(account.attach)
+
+    classes = service_classes(services)
+    tag_index = TagIndex(REGION, TAG_NAME, [TAG_VALUE],
+        [resource_type for klass in classes for resource_type in getattr(klass, 'TAGGING_RESOURCE_TYPES', [])],
+        clients
+    )
+    for klass in classes:
+        klass(REGION, TAG_NAME, [TAG_VALUE], clients=clients, tag_index=tag_index)
+    recorder.save()
+
+    calls = {}
+    for call in recorder.calls:
+        key = f'{call["service"]}.{call["operation"]}'
+        calls[key] = calls.get(key, 0) + 1
+    return dict(sorted(calls.items()))
+
+def measure_discovery(sizes: dict = None, services: list = None):
+    '''
+    Run the discovery of each service module against a synthetic account,
+    returning by service the peak of the Python allocations during the
+    discovery and the memory still held by the service module afterwards, in MB
+    '''
+    account = SyntheticAccount(sizes)
+    clients = synthetic_clients()
+    clients.add_hook(account.attach)
+    # the clients are created beforehand, so that only the discovery is measured
+    for service in ('ec2', 'elbv2', 'autoscaling', 'outposts', 'resourcegroupstaggingapi'):
+        clients.client(service, REGION)
+    results = {}
+    for klass in service_classes(services):
+        # each module sweeps the tagged resources it needs on its own
+        tag_index = TagIndex(REGION, TAG_NAME, [TAG_VALUE], getattr(klass, 'TAGGING_RESOURCE_TYPES', []), clients)
+        tracemalloc.start()
+        service = klass(REGION, TAG_NAME, [TAG_VALUE], clients=clients, tag_index=tag_index)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[klass.__name__] = dict(peak_mb=round(peak / (1024 * 1024), 1), retained_mb=round(retained / (1024 * 1024), 1))
+        del service
+    return results
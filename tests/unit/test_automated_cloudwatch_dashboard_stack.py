@@ -14,18 +14,102 @@
 # Amazon EC2 instances or using Amazon S3 storage.
 # ----------------------------------------------------------------------------
 
+import json
 import aws_cdk as core
 import aws_cdk.assertions as assertions
 
+from omegaconf import OmegaConf
+
 from automated_cloudwatch_dashboard.automated_cloudwatch_dashboard_stack import AutomatedCloudWatchDashboardStack
 
-# example tests. To run these tests, uncomment this file along with the example
-# resource in automated_cloudwatch_dashboard/automated_cloudwatch_dashboard_stack.py
-def test_sqs_queue_created():
-    app = core.App()
-    stack = AutomatedCloudWatchDashboardStack(app, "automated-cloudwatch-dashboard")
+# the discovery calls are replayed from tests/fixtures/discovery.json, recorded
+# with `cdk synth -c config=tests/fixtures/config.yaml -c record=tests/fixtures/discovery.json`
+def test_dashboard_created_from_replay():
+    app = core.App(context={
+        "config": "tests/fixtures/config.yaml",
+        "replay": "tests/fixtures/discovery.json",
+    })
+    stack = AutomatedCloudWatchDashboardStack(app, "automated-cloudwatch-dashboard",
+        env=core.Environment(account="123456789012", region="eu-west-1"))
+    template = assertions.Template.from_stack(stack)
+
+    template.resource_count_is("AWS::CloudWatch::Dashboard", 1)
+    template.has_resource_properties("AWS::CloudWatch::Dashboard", {
+        "DashboardName": "Automated-CloudWatch-Dashboard-Test"
+    })
+
+# the resources of us-east-1 are those of the fixture, replayed in both regions
+def test_dashboard_merges_regions(tmp_path):
+    with open("tests/fixtures/discovery.json") as f:
+        fixture = json.load(f)
+    fixture["calls"] += [dict(call, region="us-east-1") for call in fixture["calls"]]
+    with open(tmp_path / "discovery.json", "w") as f:
+        json.dump(fixture, f)
+    conf = OmegaConf.load("tests/fixtures/config.yaml")
+    OmegaConf.update(conf, "regions", ["eu-west-1", "us-east-1"], force_add=True)
+    OmegaConf.save(conf, tmp_path / "config.yaml")
+
+    app = core.App(context={
+        "config": str(tmp_path / "config.yaml"),
+        "replay": str(tmp_path / "discovery.json"),
+    })
+    stack = AutomatedCloudWatchDashboardStack(app, "automated-cloudwatch-dashboard",
+        env=core.Environment(account="123456789012", region="eu-west-1"))
+    template = assertions.Template.from_stack(stack)
+
+    template.resource_count_is("AWS::CloudWatch::Dashboard", 1)
+    body = json.dumps(template.find_resources("AWS::CloudWatch::Dashboard"))
+    assert "## EC2 - eu-west-1" in body and "## EC2 - us-east-1" in body
+    # the metrics of us-east-1 carry their region, those of the stack region do not
+    assert '\\"region\\":\\"us-east-1\\"' in body
+    assert '\\"region\\":\\"eu-west-1\\"' not in body
+
+# the resources of the member account 210987654321 are those of the fixture,
+# the discovery of 333333333333 fails as it is not in the fixture
+def test_dashboard_merges_accounts(tmp_path):
+    with open("tests/fixtures/discovery.json") as f:
+        fixture = json.load(f)
+    fixture["calls"] += [dict(call, account="210987654321") for call in fixture["calls"]]
+    with open(tmp_path / "discovery.json", "w") as f:
+        json.dump(fixture, f)
+    conf = OmegaConf.load("tests/fixtures/config.yaml")
+    OmegaConf.update(conf, "accounts", dict(ids=["210987654321", "333333333333"], role_name="Discovery"), force_add=True)
+    OmegaConf.save(conf, tmp_path / "config.yaml")
+
+    app = core.App(context={
+        "config": str(tmp_path / "config.yaml"),
+        "replay": str(tmp_path / "discovery.json"),
+    })
+    stack = AutomatedCloudWatchDashboardStack(app, "automated-cloudwatch-dashboard",
+        env=core.Environment(account="123456789012", region="eu-west-1"))
+    template = assertions.Template.from_stack(stack)
+
+    body = json.dumps(template.find_resources("AWS::CloudWatch::Dashboard"))
+    assert "## EC2 - 123456789012" in body and "## EC2 - 210987654321" in body
+    assert "## EC2 - 333333333333" not in body
+    # the metrics of the member account carry their account
+    assert '\\"accountId\\":\\"210987654321\\"' in body
+    assert '\\"accountId\\":\\"123456789012\\"' not in body
+    warnings = assertions.Annotations.from_stack(stack).find_warning("*", assertions.Match.string_like_regexp("333333333333"))
+    assert len(warnings) == 5
+
+# outside of the fleet mode, the top-N widgets of the instances and target
+# groups come ahead of the widgets of each resource
+def test_dashboard_top_n_per_resource(tmp_path):
+    conf = OmegaConf.load("tests/fixtures/config.yaml")
+    OmegaConf.update(conf, "services", dict(EC2=dict(fleet_mode=False, top_n=5), ELB=dict(fleet_mode=False, top_n=5)),
+        force_add=True)
+    OmegaConf.save(conf, tmp_path / "config.yaml")
+    app = core.App(context={
+        "config": str(tmp_path / "config.yaml"),
+        "replay": "tests/fixtures/discovery.json",
+    })
+    stack = AutomatedCloudWatchDashboardStack(app, "automated-cloudwatch-dashboard",
+        env=core.Environment(account="123456789012", region="eu-west-1"))
     template = assertions.Template.from_stack(stack)
 
-#     template.has_resource_properties("AWS::SQS::Queue", {
-#         "VisibilityTimeout": 300
-#     })
+    body = json.dumps(template.find_resources("AWS::CloudWatch::Dashboard"))
+    assert "### EC2 Instances - top 5" in body and "SELECT MAX(CPUUtilization)" in body
+    assert "### Target Groups - top 5" in body and "SELECT AVG(TargetResponseTime)" in body
+    # the widgets of each instance are still there
+    assert "### Instance " in body
@@ -0,0 +1,46 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import datetime
+import boto3
+from botocore.stub import Stubber
+
+from automated_cloudwatch_dashboard.clients import ClientFactory, account_of
+
+def test_member_account_clients_assume_role_once():
+    clients = ClientFactory(boto3.session.Session(aws_access_key_id="AKIA", aws_secret_access_key="secret", region_name="eu-west-1"))
+    member = clients.for_account("210987654321", "Discovery", "eu-west-1", external_id="dashboard")
+    assert clients.for_account("210987654321", "Discovery", "eu-west-1") is member
+    assert member.role_arn == "arn:aws:iam::210987654321:role/Discovery"
+
+    member._sts = clients.session.client("sts", region_name="eu-west-1")
+    expiration = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+    with Stubber(member._sts) as sts:
+        sts.add_response("assume_role", {"Credentials": {
+            "AccessKeyId": "ASIAMEMBER0000000", "SecretAccessKey": "member-secret", "SessionToken": "token", "Expiration": expiration,
+        }}, {
+            "RoleArn": member.role_arn, "RoleSessionName": "automated-cloudwatch-dashboard",
+            "DurationSeconds": 3600, "ExternalId": "dashboard",
+        })
+        ec2 = member.client("ec2", "eu-west-1")
+        s3 = member.client("s3", "eu-west-1")
+        # the credentials are fetched once, on their first use, and shared by the clients
+        assert ec2._request_signer._credentials.get_frozen_credentials().access_key == "ASIAMEMBER0000000"
+        assert s3._request_signer._credentials.get_frozen_credentials().access_key == "ASIAMEMBER0000000"
+        sts.assert_no_pending_responses()
+
+    assert account_of(ec2) == "210987654321"
+    assert account_of(clients.client("ec2", "eu-west-1")) is None
@@ -0,0 +1,107 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import json
+
+from automated_cloudwatch_dashboard.debounce import Debouncer
+
+class MemoryQueue():
+    '''Stand-in for the SQS client, holding the messages of any number of queues'''
+
+    def __init__(self):
+        self.queues = {}
+        self.sequence = 0
+
+    def send(self, queue_url: str, body: str, sent_at: float):
+        self.sequence += 1
+        self.queues.setdefault(queue_url, []).append(dict(MessageId=str(self.sequence), ReceiptHandle=str(self.sequence),
+            Body=body, Attributes=dict(SentTimestamp=str(int(sent_at * 1000))), visible=True))
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages, VisibilityTimeout, **kwargs):
+        received = [message for message in self.queues.get(QueueUrl, []) if message['visible']][:MaxNumberOfMessages]
+        for message in received:
+            message['visible'] = False
+        return dict(Messages=[{key: value for key, value in message.items() if key != 'visible'} for message in received])
+
+    def change_message_visibility_batch(self, QueueUrl, Entries):
+        handles = {entry['ReceiptHandle'] for entry in Entries}
+        for message in self.queues[QueueUrl]:
+            if message['ReceiptHandle'] in handles:
+                message['visible'] = True
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        handles = {entry['ReceiptHandle'] for entry in Entries}
+        self.queues[QueueUrl] = [message for message in self.queues[QueueUrl] if message['ReceiptHandle'] not in handles]
+
+    def send_message_batch(self, QueueUrl, Entries):
+        for entry in Entries:
+            self.send(QueueUrl, entry['MessageBody'], 0)
+
+class Pipeline():
+    def __init__(self):
+        self.executions = []
+
+    def start_pipeline_execution(self, name):
+        self.executions.append(name)
+        return dict(pipelineExecutionId=f'execution-{len(self.executions)}')
+
+def event(arn: str, number: int):
+    return json.dumps({'id': f'event-{number}', 'resources': [arn], 'region': 'eu-west-1', 'detail': {}})
+
+# a burst of tag changes starts a single execution, once the queue is quiet,
+# and the coalesced events (one per resource) are forwarded to the synth step
+def test_burst_starts_a_single_execution():
+    sqs = MemoryQueue()
+    pipeline = Pipeline()
+    clock = [1000.0]
+    debouncer = Debouncer(sqs, 'events', pipeline, 'dashboard-pipeline', quiet_seconds=120, max_wait_seconds=900,
+        forward_queue_url='tag-changes', now=lambda: clock[0])
+
+    assert debouncer.run()['action'] == 'idle'
+    # 200 events of 150 instances, over a minute
+    for number in range(200):
+        sqs.send('events', event(f'arn:aws:ec2:eu-west-1:123456789012:instance/i-{number % 150}', number),
+            1000 + number * 0.3)
+    clock[0] = 1100.0
+    result = debouncer.run()
+    assert result['action'] == 'waiting' and result['messages'] == 200
+    assert pipeline.executions == []
+
+    clock[0] = 1200.0
+    result = debouncer.run()
+    assert result['action'] == 'started' and result['execution_id'] == 'execution-1'
+    assert len(result['arns']) == 150
+    assert pipeline.executions == ['dashboard-pipeline']
+    assert sqs.queues['events'] == []
+    forwarded = [json.loads(message['Body']) for message in sqs.queues['tag-changes']]
+    # the latest event of each instance
+    assert sorted(forwarded, key=lambda event: event['id']) == \
+        sorted((json.loads(event(f'arn:aws:ec2:eu-west-1:123456789012:instance/i-{number % 150}', number))
+            for number in range(50, 200)), key=lambda event: event['id'])
+    assert debouncer.run()['action'] == 'idle'
+
+# events that never stop start an execution after the maximum wait
+def test_continuous_events_start_after_max_wait():
+    sqs = MemoryQueue()
+    pipeline = Pipeline()
+    debouncer = Debouncer(sqs, 'events', pipeline, 'dashboard-pipeline', quiet_seconds=120, max_wait_seconds=900,
+        now=lambda: 2000.0)
+    for number in range(20):
+        sqs.send('events', event(f'arn:aws:s3:::bucket-{number}', number), 1000 + number * 50)
+
+    result = debouncer.run()
+    assert result['action'] == 'started' and len(result['arns']) == 20
+    assert pipeline.executions == ['dashboard-pipeline']
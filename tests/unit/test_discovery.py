@@ -0,0 +1,102 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import threading
+import time
+
+from omegaconf import OmegaConf
+
+from automated_cloudwatch_dashboard import discovery
+
+class Clients():
+    '''Stand-in for the ClientFactory, the discovery of the stub services makes no call'''
+
+    def for_account(self, account, role_name, region, **kwargs):
+        return self
+
+class Service():
+    '''Stub service module, recording the accounts discovered at the same time'''
+
+    lock = threading.Lock()
+    active = {}
+    peak = 0
+
+    def __init__(self, region, tag_name, tag_values, options=None, clients=None, tag_index=None, inventory=None,
+            metric_region=None, metric_account=None):
+        cls = Service
+        with cls.lock:
+            cls.active[metric_account] = cls.active.get(metric_account, 0) + 1
+            cls.peak = max(cls.peak, len(cls.active))
+        time.sleep(0.02)
+        with cls.lock:
+            cls.active[metric_account] -= 1
+            if not cls.active[metric_account]:
+                del cls.active[metric_account]
+
+# 5 accounts (that of the dashboards and 4 members) in 2 regions, discovered
+# 2 accounts at a time, the results in the order of the services, accounts and regions
+def test_accounts_max_workers(monkeypatch):
+    monkeypatch.setattr(discovery, 'import_class_from_string', lambda path: Service)
+    conf = OmegaConf.create(dict(tag_name='Dashboard', tag_values=['test'], regions=['eu-west-1', 'us-east-1'],
+        discovery=dict(max_workers=5), accounts=dict(ids=['111111111111', '222222222222', '333333333333', '444444444444'],
+        max_workers=2)))
+
+    results = discovery.discover_inventory(conf, 'eu-west-1', '123456789012', Clients())
+    assert Service.peak == 2
+    assert [result.name for result in results] == [f'{service}-{account}-{region}'
+        for service in discovery.SUPPORTED_SERVICES
+        for account in ['123456789012', '111111111111', '222222222222', '333333333333', '444444444444']
+        for region in ['eu-west-1', 'us-east-1']]
+    assert [result.account for result in results[:10:2]] == [None, '111111111111', '222222222222', '333333333333', '444444444444']
+
+def factory(name: str, delay: float = 0.0, error: Exception = None):
+    def build():
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return name
+    return name, build
+
+# the results follow the order of the factories (that of SUPPORTED_SERVICES),
+# whatever the order in which the discoveries complete
+def test_results_in_the_order_of_the_factories():
+    factories = [factory(name, delay=0.05 * (len(discovery.SUPPORTED_SERVICES) - i))
+        for i, name in enumerate(discovery.SUPPORTED_SERVICES)]
+    results = discovery.discover_services(factories, max_workers=len(factories))
+    assert [result.name for result in results] == discovery.SUPPORTED_SERVICES
+    assert [result.service for result in results] == discovery.SUPPORTED_SERVICES
+    assert all(result.ok and result.elapsed > 0 for result in results)
+
+# the error of a failing discovery is captured in its result, the others complete
+def test_failing_factory_captured():
+    error = RuntimeError('AccessDenied')
+    results = discovery.discover_services([factory('EC2'), factory('S3', error=error), factory('ELB')], max_workers=2)
+    assert [result.ok for result in results] == [True, False, True]
+    assert results[1].error is error and results[1].service is None
+    assert 'S3' in str(discovery.DiscoveryError([results[1]]))
+
+def test_fatal_failures_with_allow_partial():
+    results = discovery.discover_services([factory('EC2', error=RuntimeError()), factory('S3', error=RuntimeError()),
+        factory('ELB')])
+    results[1].account = '210987654321'
+    conf = lambda **options: OmegaConf.create(options)
+
+    # the failures of the account of the dashboards fail the synth, those of
+    # the member accounts unless accounts.allow_partial is false
+    assert discovery.fatal_failures(conf(), results) == [results[0]]
+    assert discovery.fatal_failures(conf(accounts=dict(allow_partial=False)), results) == results[:2]
+    # none with discovery.allow_partial
+    assert discovery.fatal_failures(conf(discovery=dict(allow_partial=True), accounts=dict(allow_partial=False)), results) == []
@@ -0,0 +1,46 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import aws_cdk.aws_cloudwatch as cloudwatch
+import boto3
+from botocore.stub import Stubber
+
+from automated_cloudwatch_dashboard.clients import ClientFactory
+from automated_cloudwatch_dashboard.nitro_catalog import NitroCatalog
+from automated_cloudwatch_dashboard.services.EC2 import EC2
+
+def instance(instance_id: str):
+    return {"InstanceId": instance_id, "InstanceType": "m5.large", "Tags": [{"Key": "Name", "Value": instance_id}]}
+
+# the instances launched together share a reservation, each one gets its widgets
+def test_every_instance_of_a_reservation(tmp_path, monkeypatch):
+    # the hypervisor is looked up, not read from the memo of the other tests
+    monkeypatch.setattr(NitroCatalog, "_memo", {})
+    session = boto3.session.Session(aws_access_key_id="AKIAEC2RESERVATION", aws_secret_access_key="secret", region_name="eu-west-1")
+    clients = ClientFactory(session)
+    with Stubber(clients.client("ec2", "eu-west-1")) as stubber:
+        stubber.add_response("describe_instances", {"Reservations": [
+            {"ReservationId": "r-1", "Instances": [instance("i-1"), instance("i-2")]},
+            {"ReservationId": "r-2", "Instances": [instance("i-3")]},
+        ]})
+        stubber.add_response("describe_instance_types", {"InstanceTypes": [{"InstanceType": "m5.large", "Hypervisor": "nitro"}]})
+        ec2 = EC2("eu-west-1", "Dashboard", ["test"], options=dict(nitro_catalog=dict(path=str(tmp_path / "nitro_catalog.json"))),
+            clients=clients)
+        stubber.assert_no_pending_responses()
+
+    assert [instance.instance_id for instance in ec2.instances] == ["i-1", "i-2", "i-3"]
+    headers = [widget for widget in ec2.get_widgets() if isinstance(widget, cloudwatch.TextWidget)]
+    assert len(headers) == 3
@@ -0,0 +1,77 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import boto3
+from botocore.stub import Stubber
+
+from automated_cloudwatch_dashboard.clients import ClientFactory
+from automated_cloudwatch_dashboard.services.ELB import ELB
+
+PREFIX = "arn:aws:elasticloadbalancing:eu-west-1:123456789012"
+ALBS = [f"{PREFIX}:loadbalancer/app/alb-{i}/{i:016x}" for i in range(3)]
+NLB = f"{PREFIX}:loadbalancer/net/nlb/{9:016x}"
+UNTAGGED = f"{PREFIX}:loadbalancer/app/untagged/{8:016x}"
+
+def target_group(name: str, *load_balancers):
+    return {"TargetGroupArn": f"{PREFIX}:targetgroup/{name}/{len(name):016x}", "LoadBalancerArns": list(load_balancers)}
+
+# all the target groups of the region, on two pages
+TARGET_GROUPS = [
+    target_group("tg-a", ALBS[0]),
+    target_group("tg-b", ALBS[0], ALBS[1]),
+    target_group("tg-nlb", NLB),
+    target_group("tg-untagged", UNTAGGED),
+    target_group("tg-c", ALBS[2]),
+    target_group("tg-idle"),
+]
+
+class Tags():
+    '''Stand-in for the TagIndex, with the tagged load balancers'''
+
+    def get(self, resource_type: str):
+        return [dict(ResourceARN=arn, Tags=[dict(Key="Dashboard", Value="test")]) for arn in ALBS + [NLB]]
+
+def discover(threshold: int, stub):
+    '''Get the target groups discovered by ELB with bulk_target_groups_threshold, the calls stubbed by stub'''
+    session = boto3.session.Session(aws_access_key_id="AKIAELBTARGETGROUP", aws_secret_access_key="secret", region_name="eu-west-1")
+    clients = ClientFactory(session)
+    with Stubber(clients.client("elbv2", "eu-west-1")) as stubber:
+        stub(stubber)
+        elb = ELB("eu-west-1", "Dashboard", ["test"], options=dict(bulk_target_groups_threshold=threshold),
+            clients=clients, tag_index=Tags())
+        stubber.assert_no_pending_responses()
+    return elb.target_groups
+
+def per_load_balancer(stubber):
+    for alb in ALBS:
+        stubber.add_response("describe_target_groups",
+            {"TargetGroups": [tg for tg in TARGET_GROUPS if alb in tg["LoadBalancerArns"]]},
+            {"LoadBalancerArn": alb, "PageSize": 400})
+
+def bulk(stubber):
+    stubber.add_response("describe_target_groups", {"TargetGroups": TARGET_GROUPS[:3], "NextMarker": "page-2"}, {"PageSize": 400})
+    stubber.add_response("describe_target_groups", {"TargetGroups": TARGET_GROUPS[3:]}, {"PageSize": 400, "Marker": "page-2"})
+
+# the bulk scan of the region gives the mapping of the calls per ALB, and is
+# used from bulk_target_groups_threshold ALBs (the NLB not counting)
+def test_bulk_target_groups_match_the_calls_per_alb():
+    below = discover(4, per_load_balancer)
+    at = discover(3, bulk)
+    assert below == at == {
+        ALBS[0]: ["targetgroup/tg-a/0000000000000004", "targetgroup/tg-b/0000000000000004"],
+        ALBS[1]: ["targetgroup/tg-b/0000000000000004"],
+        ALBS[2]: ["targetgroup/tg-c/0000000000000004"],
+    }
@@ -0,0 +1,117 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+from omegaconf import OmegaConf
+
+from automated_cloudwatch_dashboard.automated_cloudwatch_dashboard_stack import AutomatedCloudWatchDashboardStack
+from automated_cloudwatch_dashboard.clients import ClientFactory
+from automated_cloudwatch_dashboard.discovery import discover_inventory
+from automated_cloudwatch_dashboard.fingerprint import fingerprint, main as fingerprint_main
+from automated_cloudwatch_dashboard.inventory import InventoryStore
+from automated_cloudwatch_dashboard.recording import Replayer
+
+def check(conf):
+    '''Fingerprint of the discovery the pipeline runs before the synth'''
+    clients = ClientFactory()
+    Replayer("tests/fixtures/discovery.json").install(clients)
+    inventory = InventoryStore()
+    assert all(result.ok for result in discover_inventory(conf, "eu-west-1", "123456789012", clients, inventory))
+    return fingerprint(conf, inventory, "eu-west-1", "123456789012"), inventory
+
+# the fingerprint deployed with the dashboards is the one the check computes
+# from the same inventory, and changes with the inventory
+def test_fingerprint_deployed_with_the_dashboards(tmp_path):
+    conf = OmegaConf.load("tests/fixtures/config.yaml")
+    OmegaConf.update(conf, "fingerprint", dict(enabled=True), force_add=True)
+    OmegaConf.save(conf, tmp_path / "config.yaml")
+    app = core.App(context={
+        "config": str(tmp_path / "config.yaml"),
+        "replay": "tests/fixtures/discovery.json",
+    })
+    stack = AutomatedCloudWatchDashboardStack(app, "automated-cloudwatch-dashboard",
+        env=core.Environment(account="123456789012", region="eu-west-1"))
+    template = assertions.Template.from_stack(stack)
+
+    current, inventory = check(conf)
+    assert check(conf)[0] == current
+    template.has_resource_properties("AWS::SSM::Parameter", {
+        "Name": "/automated-cloudwatch-dashboard/Automated-CloudWatch-Dashboard-Test/fingerprint",
+        "Value": current
+    })
+
+    key, resources = inventory.discovered()[0]
+    inventory.record(key, resources[1:] if isinstance(resources, list) else {})
+    assert fingerprint(conf, inventory, "eu-west-1", "123456789012") != current
+
+class Parameters():
+    '''Stand-in for the SSM client, holding the deployed fingerprint'''
+
+    def __init__(self, value: str):
+        self.value = value
+
+    def get_parameter(self, Name):
+        return dict(Parameter=dict(Name=Name, Value=self.value))
+
+class Pipeline():
+    '''Stand-in for the CodePipeline client, a newer execution in its Source stage while the Build stage runs'''
+
+    def __init__(self):
+        self.stopped = []
+
+    def get_pipeline_state(self, name):
+        return dict(stageStates=[
+            dict(stageName="Source", latestExecution=dict(pipelineExecutionId="execution-2", status="InProgress")),
+            dict(stageName="Build", latestExecution=dict(pipelineExecutionId="execution-1", status="InProgress")),
+        ])
+
+    def stop_pipeline_execution(self, pipelineName, pipelineExecutionId, abandon, reason):
+        self.stopped.append((pipelineName, pipelineExecutionId))
+
+class Clients(ClientFactory):
+    '''Replayed discovery calls, with stand-ins for SSM and CodePipeline'''
+
+    def __init__(self, ssm, codepipeline):
+        super().__init__()
+        self.standins = dict(ssm=ssm, codepipeline=codepipeline)
+        Replayer("tests/fixtures/discovery.json").install(self)
+
+    def client(self, service: str, region: str):
+        return self.standins.get(service) or super().client(service, region)
+
+# the check run by the synth step stops its own pipeline execution when the
+# deployed fingerprint matches, not the newer one in the Source stage, and
+# lets the synth run otherwise
+def test_pipeline_stopped_when_the_fingerprint_matches(tmp_path, monkeypatch):
+    conf = OmegaConf.load("tests/fixtures/config.yaml")
+    OmegaConf.update(conf, "fingerprint", dict(enabled=True), force_add=True)
+    OmegaConf.save(conf, tmp_path / "config.yaml")
+    current, _ = check(conf)
+    monkeypatch.setenv("CODEBUILD_INITIATOR", "codepipeline/dashboard-pipeline")
+    argv = ["--config", str(tmp_path / "config.yaml"), "--region", "eu-west-1", "--account", "123456789012"]
+    def run(deployed: str, *args):
+        pipeline = Pipeline()
+        monkeypatch.setattr(ClientFactory, "from_options", classmethod(lambda cls, options: Clients(Parameters(deployed), pipeline)))
+        return fingerprint_main(argv + list(args)), pipeline.stopped
+
+    assert run(current, "--stop-execution", "execution-1") == (0, [("dashboard-pipeline", "execution-1")])
+    assert run("0" * 64, "--stop-execution", "execution-1") == (1, [])
+    # the execution of the build is no longer in progress, the synth must run
+    assert run(current, "--stop-execution", "execution-0") == (1, [])
+    assert run(current, "--stop-execution", "") == (1, [])
+    # outside of the pipeline, the check alone
+    assert run(current) == (0, [])
@@ -0,0 +1,88 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import json
+import aws_cdk as core
+import aws_cdk.aws_cloudwatch as cloudwatch
+
+from automated_cloudwatch_dashboard.fleet import MAX_EXPRESSION_LENGTH, MAX_SEARCH_EXPRESSIONS_PER_WIDGET, \
+    fleet_widgets, search_expressions, use_fleet_mode
+from automated_cloudwatch_dashboard.budget import graph_widgets, metrics_per_widget
+from automated_cloudwatch_dashboard.insights import MAX_QUERY_LENGTH, top_n_query
+
+def test_search_expressions_cover_all_ids_within_length():
+    ids = [f"i-{i:017x}" for i in range(200)]
+    expressions = search_expressions("AWS/EC2", ["InstanceId"], "InstanceId", ids, "CPUUtilization",
+        "Maximum", core.Duration.minutes(5))
+
+    assert len(expressions) > 1
+    assert all(len(expression) <= MAX_EXPRESSION_LENGTH for expression in expressions)
+    assert sum(expression.count('InstanceId="') for expression in expressions) == len(ids)
+    assert expressions[0].startswith("SEARCH('{AWS/EC2,InstanceId} MetricName=\"CPUUtilization\" (")
+    assert expressions[0].endswith(")', 'Maximum', 300)")
+
+# 10,000 instances would take 385 SEARCH expressions per metric: each metric
+# is searched across the region instead, the widgets are those of 100 instances
+def test_fleet_widgets_independent_of_the_fleet_size():
+    metrics = [("CPUUtilization", "Maximum", "MAX"), ("CPUUtilization", "Average", "MAX")]
+    stack = core.Stack()
+    def searches(count: int):
+        ids = [f"i-{i:017x}" for i in range(count)]
+        widgets = fleet_widgets("CPU Utilization", "AWS/EC2", ["InstanceId"], "InstanceId", ids, metrics, core.Duration.minutes(5))
+        return [json.dumps(stack.resolve(widget.to_json())) for widget in widgets]
+
+    fleet = searches(10000)
+    assert len(search_expressions("AWS/EC2", ["InstanceId"], "InstanceId", [f"i-{i:017x}" for i in range(10000)],
+        "CPUUtilization", "Maximum", core.Duration.minutes(5))) == 385
+    assert len(fleet) == len(searches(100)) == 1
+    assert fleet[0].count("SEARCH(") == 2 and "InstanceId=" not in fleet[0]
+    assert "SEARCH('{AWS/EC2,InstanceId} MetricName=\\\"CPUUtilization\\\"', 'Maximum', 300)" in fleet[0]
+    assert "CPUUtilization (max of maximum) in the region" in fleet[0]
+    # up to MAX_SEARCH_EXPRESSIONS_PER_WIDGET expressions, the metrics are scoped to the ids
+    scoped = searches(2000)
+    assert all(widget.count("SEARCH(") <= MAX_SEARCH_EXPRESSIONS_PER_WIDGET for widget in scoped)
+    assert "in the region" not in "".join(scoped) and len(scoped) == 2
+
+def test_fleet_mode_switches_on_threshold():
+    assert not use_fleet_mode({}, 1000, 50)
+    assert not use_fleet_mode({"fleet_mode": "auto"}, 49, 50)
+    assert use_fleet_mode({"fleet_mode": "auto"}, 50, 50)
+    assert use_fleet_mode({"fleet_mode": "auto", "fleet_threshold": 10}, 10, 50)
+    assert use_fleet_mode({"fleet_mode": True}, 1, 50)
+    assert not use_fleet_mode({"fleet_mode": False}, 1000, 50)
+
+def test_top_n_query_scoped_to_ids_until_too_long():
+    query, scoped = top_n_query("AWS/S3", ["BucketName", "StorageType"], "BucketName", ["a", "b"],
+        "BucketSizeBytes", "AVG", 10, filters={"StorageType": "StandardStorage"})
+    assert scoped
+    assert query == ("SELECT AVG(BucketSizeBytes) FROM SCHEMA(\"AWS/S3\", BucketName, StorageType) "
+        "WHERE StorageType = 'StandardStorage' AND (BucketName = 'a' OR BucketName = 'b') "
+        "GROUP BY BucketName ORDER BY AVG() DESC LIMIT 10")
+
+    query, scoped = top_n_query("AWS/S3", ["BucketName", "StorageType"], "BucketName",
+        [f"bucket-{i}" for i in range(1000)], "BucketSizeBytes", "AVG", 10, filters={"StorageType": "StandardStorage"})
+    assert not scoped
+    assert len(query) <= MAX_QUERY_LENGTH
+    assert "WHERE StorageType = 'StandardStorage' GROUP BY BucketName" in query
+
+def test_graph_widgets_split_within_budget():
+    metrics = [cloudwatch.Metric(namespace="AWS/S3", metric_name="NumberOfObjects", dimensions_map={"BucketName": f"bucket-{i}"})
+        for i in range(250)]
+    widgets = graph_widgets("NumberOfObjects: Average", metrics, metrics_per_widget({}))
+
+    assert [widget.to_json()[0]["properties"]["title"] for widget in widgets] == [
+        "NumberOfObjects: Average (1/3)", "NumberOfObjects: Average (2/3)", "NumberOfObjects: Average (3/3)"]
+    assert len(graph_widgets("NumberOfObjects: Average", metrics, 500)) == 1
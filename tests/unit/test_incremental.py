@@ -0,0 +1,96 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import json
+
+from automated_cloudwatch_dashboard.incremental import IncrementalUpdater
+from automated_cloudwatch_dashboard.inventory import InventoryStore
+from automated_cloudwatch_dashboard.services.S3 import S3
+
+def tag_change(arn: str, tags: dict, account: str = None):
+    return {'account': account, 'resources': [arn], 'region': 'eu-west-1',
+        'detail': {'tags': tags, 'changed-tag-keys': ['Dashboard']}}
+
+class Queue():
+    '''Stand-in for the SQS client of drain()'''
+
+    def __init__(self, bodies: list):
+        self.messages = [dict(MessageId=str(i), ReceiptHandle=str(i), Body=body) for i, body in enumerate(bodies)]
+
+    def client(self, service: str, region: str):
+        return self
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages, WaitTimeSeconds):
+        return dict(Messages=self.messages[:MaxNumberOfMessages])
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        self.messages = [message for message in self.messages if message['ReceiptHandle'] != ReceiptHandle]
+
+def store(tmp_path):
+    inventory = InventoryStore(str(tmp_path / "inventory.sqlite"))
+    inventory.save(inventory.snapshot_key("S3", "eu-west-1", "Dashboard", ["test"], "buckets"), ["logs"])
+    return inventory
+
+def buckets(inventory, account: str = None):
+    location = "eu-west-1" if account is None else f"{account}/eu-west-1"
+    return inventory.load(inventory.snapshot_key("S3", location, "Dashboard", ["test"], "buckets"))
+
+# a bucket whose name contains dots is added to the stored inventory in place
+def test_apply_updates_the_stored_buckets(tmp_path):
+    inventory = store(tmp_path)
+    updater = IncrementalUpdater(inventory, "Dashboard", ["test"])
+
+    assert updater.apply(tag_change("arn:aws:s3:::www.example.com", {"Dashboard": "test"})) == "updated"
+    assert buckets(inventory) == ["logs", "www.example.com"]
+    assert updater.apply(tag_change("arn:aws:s3:::logs", {})) == "updated"
+    assert buckets(inventory) == ["www.example.com"]
+    inventory.close()
+
+# an event that cannot be applied expires the stored inventory of its service,
+# and a message which is not an event is dropped: neither blocks the queue
+def test_drain_deletes_the_events_it_cannot_apply(tmp_path, monkeypatch):
+    def fail(inventory, clients, change):
+        raise RuntimeError("throttled")
+    monkeypatch.setattr(S3, "apply_tag_change", staticmethod(fail))
+    inventory = store(tmp_path)
+    queue = Queue([
+        json.dumps(tag_change("arn:aws:s3:::www.example.com", {"Dashboard": "test"})),
+        json.dumps(tag_change("arn:aws:sns:eu-west-1:123456789012:topic", {"Dashboard": "test"})),
+        "not an event",
+    ])
+    updater = IncrementalUpdater(inventory, "Dashboard", ["test"], queue)
+
+    assert updater.drain("https://sqs.eu-west-1.amazonaws.com/123456789012/TagChangeQueue") == \
+        ["invalidated", "ignored", "ignored"]
+    assert queue.messages == []
+    assert buckets(inventory) is None
+    inventory.close()
+
+# the event of a member account updates the stored inventory of that account,
+# the one of the account of the stack is left as is
+def test_apply_updates_the_scope_of_the_member_account(tmp_path):
+    inventory = store(tmp_path)
+    inventory.save(inventory.snapshot_key("S3", "210987654321/eu-west-1", "Dashboard", ["test"], "buckets"), ["data"])
+    updater = IncrementalUpdater(inventory, "Dashboard", ["test"], account="123456789012",
+        members={"ids": ["210987654321"]})
+
+    assert updater.apply(tag_change("arn:aws:s3:::archive", {"Dashboard": "test"}, "210987654321")) == "updated"
+    assert buckets(inventory, "210987654321") == ["data", "archive"]
+    assert buckets(inventory) == ["logs"]
+    assert updater.apply(tag_change("arn:aws:s3:::www.example.com", {"Dashboard": "test"}, "123456789012")) == "updated"
+    assert buckets(inventory) == ["logs", "www.example.com"]
+    assert buckets(inventory, "210987654321") == ["data", "archive"]
+    inventory.close()
@@ -0,0 +1,71 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import json
+import boto3
+from botocore.awsrequest import AWSResponse, HeadersDict
+
+from automated_cloudwatch_dashboard.clients import ClientFactory
+from automated_cloudwatch_dashboard.instrumentation import Instrumentation, OperationStats, percentile
+
+class Body():
+    def __init__(self, body: dict):
+        self.body = json.dumps(body).encode()
+
+    def stream(self, **kwargs):
+        yield self.body
+
+def respond(responses: list):
+    '''Handler of before-send answering each attempt with the next (status, body) of responses'''
+    def before_send(request, **kwargs):
+        status, body = responses.pop(0)
+        return AWSResponse(request.url, status, HeadersDict({'x-amzn-requestid': 'request'}), Body(body))
+    return before_send
+
+# the retries and throttles of each call are counted, the calls which fail
+# after the retries too, by operation
+def test_calls_retries_and_throttles_counted():
+    session = boto3.session.Session(aws_access_key_id="AKIAINSTRUMENTATION", aws_secret_access_key="secret",
+        region_name="eu-west-1")
+    clients = ClientFactory(session, max_attempts=3, retry_mode="standard")
+    instrumentation = Instrumentation().install(clients)
+    tagging = clients.client("resourcegroupstaggingapi", "eu-west-1")
+    throttled = (400, {"__type": "ThrottlingException", "message": "Rate exceeded"})
+    ok = (200, {"ResourceTagMappingList": []})
+    responses = [throttled, throttled, ok, ok, (400, {"__type": "AccessDeniedException", "message": "denied"})]
+    tagging.meta.events.register("before-send", respond(responses))
+
+    tagging.get_resources()
+    tagging.get_resources()
+    try:
+        tagging.get_resources()
+    except tagging.exceptions.ClientError:
+        pass
+
+    assert responses == []
+    report = instrumentation.report()
+    assert report["totals"] == dict(calls=3, errors=1, retries=2, throttles=2)
+    [operation] = report["operations"]
+    assert (operation["service"], operation["operation"]) == ("resourcegroupstaggingapi", "GetResources")
+    assert "GetResources" in instrumentation.table(report)
+
+def test_latency_percentiles():
+    assert percentile([], 50) == 0.0
+    assert percentile([0.2], 99) == 0.2
+    stats = OperationStats()
+    stats.latencies = [i / 1000 for i in range(100, 0, -1)]
+    latency = stats.report()["latency_ms"]
+    assert latency == dict(p50=50.0, p90=90.0, p99=99.0, max=100.0, total=5050.0)
@@ -0,0 +1,34 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+from automated_cloudwatch_dashboard.inventory import InventoryStore
+from automated_cloudwatch_dashboard.models import Instance, Volume
+
+def test_records_round_trip_and_raw_payloads_are_a_miss(tmp_path):
+    store = InventoryStore(str(tmp_path / "inventory.sqlite"))
+    scope = store.scope("EC2", "eu-west-1", "Dashboard", ["test"])
+    # a snapshot of raw responses, stored before the records
+    store.save(store.snapshot_key("EC2", "eu-west-1", "Dashboard", ["test"], "instances"),
+        [{"Instances": [{"InstanceId": "i-1"}]}])
+
+    instances = [Instance("i-2", "m5.large", "web")]
+    assert scope.fetch("instances", lambda: instances, Instance) == instances
+    scope.fetch("volumes", lambda: {"i-2": [Volume("vol-1")]}, Volume)
+
+    scope = store.scope("EC2", "eu-west-1", "Dashboard", ["test"])
+    assert scope.fetch("instances", lambda: [], Instance) == instances
+    assert scope.fetch("volumes", lambda: {}, Volume) == {"i-2": [Volume("vol-1")]}
+    store.close()
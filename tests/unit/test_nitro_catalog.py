@@ -0,0 +1,99 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import json
+import threading
+import time
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from automated_cloudwatch_dashboard.nitro_catalog import NitroCatalog
+
+DAY = 24 * 3600
+
+def catalog(tmp_path, entries: dict, **kwargs):
+    '''Catalog of tmp_path holding entries (instance type -> (hypervisor, age in days)), with its own memo'''
+    path = tmp_path / "nitro_catalog.json"
+    now = time.time()
+    path.write_text(json.dumps(dict(version=NitroCatalog.VERSION, instance_types={
+        instance_type: dict(hypervisor=hypervisor, updated=now - age * DAY) for instance_type, (hypervisor, age) in entries.items()
+    })))
+    nitro_catalog = NitroCatalog(str(path), **kwargs)
+    nitro_catalog._memo = {}
+    return nitro_catalog
+
+def ec2():
+    session = boto3.session.Session(aws_access_key_id="AKIANITROCATALOG0", aws_secret_access_key="secret", region_name="eu-west-1")
+    return session.client("ec2")
+
+# the entries younger than the TTL are used as they are, the expired ones
+# are described again and written back to the catalog
+def test_expired_entries_described_again(tmp_path):
+    nitro_catalog = catalog(tmp_path, {"m5.large": ("nitro", 1), "t2.micro": ("xen", 31)}, ttl_days=30)
+    client = ec2()
+    with Stubber(client) as stubber:
+        stubber.add_response("describe_instance_types", {"InstanceTypes": [{"InstanceType": "t2.micro", "Hypervisor": "xen"}]},
+            {"InstanceTypes": ["t2.micro"]})
+        assert nitro_catalog.lookup(client, ["m5.large", "t2.micro"]) == {"m5.large": True, "t2.micro": False}
+        stubber.assert_no_pending_responses()
+    entry = json.loads((tmp_path / "nitro_catalog.json").read_text())["instance_types"]["t2.micro"]
+    assert time.time() - entry["updated"] < DAY
+
+# without network access, the expired entries are used, and the instance
+# types missing from the catalog fail the lookup
+def test_expired_entries_used_when_the_calls_fail(tmp_path):
+    nitro_catalog = catalog(tmp_path, {"t2.micro": ("xen", 31)}, ttl_days=30)
+    client = ec2()
+    with Stubber(client) as stubber:
+        stubber.add_client_error("describe_instance_types", "UnauthorizedOperation")
+        assert nitro_catalog.lookup(client, ["t2.micro"]) == {"t2.micro": False}
+        stubber.add_client_error("describe_instance_types", "UnauthorizedOperation")
+        with pytest.raises(client.exceptions.ClientError):
+            nitro_catalog.lookup(client, ["c5.large"])
+    assert json.loads((tmp_path / "nitro_catalog.json").read_text())["instance_types"]["t2.micro"]["updated"] < time.time() - 30 * DAY
+
+# offline, the catalog is used whatever the age of its entries, without any call
+def test_offline_catalog_makes_no_call(tmp_path):
+    nitro_catalog = catalog(tmp_path, {"m5.large": ("nitro", 365)}, offline=True)
+    client = ec2()
+    with Stubber(client):
+        assert nitro_catalog.lookup(client, ["m5.large"]) == {"m5.large": True}
+        with pytest.raises(KeyError):
+            nitro_catalog.lookup(client, ["c5.large"])
+
+# the lookups of the memoized instance types do not wait for the calls of another discovery
+def test_lookup_does_not_wait_for_the_calls(tmp_path):
+    nitro_catalog = catalog(tmp_path, {"m5.large": ("nitro", 1)})
+    called, release = threading.Event(), threading.Event()
+    def describe(botoclient, instance_types):
+        called.set()
+        release.wait(5)
+        return {instance_type: "nitro" for instance_type in instance_types}
+    nitro_catalog.describe = describe
+
+    thread = threading.Thread(target=nitro_catalog.lookup, args=(None, ["c5.large"]))
+    thread.start()
+    assert called.wait(5)
+    try:
+        started = time.perf_counter()
+        assert nitro_catalog.lookup(None, ["m5.large"]) == {"m5.large": True}
+        assert time.perf_counter() - started < 1
+    finally:
+        release.set()
+        thread.join()
+    assert nitro_catalog.lookup(None, ["c5.large"]) == {"c5.large": True}
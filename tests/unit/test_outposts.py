@@ -0,0 +1,62 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import boto3
+from botocore.stub import Stubber
+
+from automated_cloudwatch_dashboard.clients import ClientFactory
+from automated_cloudwatch_dashboard.services.Outposts import Outposts
+
+def outpost(outpost_id: str, tags: dict):
+    return {"OutpostId": outpost_id, "OwnerId": "123456789012", "Name": outpost_id, "LifeCycleStatus": "ACTIVE",
+        "Tags": tags}
+
+def instance_types(*names):
+    return [{"InstanceType": name} for name in names]
+
+# the tagged outposts only, with all the pages of their instance types, and
+# the same color for an instance type in every outpost
+def test_instance_types_of_the_tagged_outposts():
+    session = boto3.session.Session(aws_access_key_id="AKIAOUTPOSTSTYPES", aws_secret_access_key="secret", region_name="eu-west-1")
+    clients = ClientFactory(session)
+    with Stubber(clients.client("outposts", "eu-west-1")) as stubber:
+        stubber.add_response("list_outposts", {"Outposts": [
+            outpost("op-1", {"Dashboard": "test"}),
+            outpost("op-2", {}),
+        ], "NextToken": "outposts-2"}, {"MaxResults": 1000})
+        stubber.add_response("list_outposts", {"Outposts": [
+            outpost("op-3", {"Dashboard": "other"}),
+            outpost("op-4", {"Dashboard": "test", "Team": "a"}),
+        ]}, {"MaxResults": 1000, "NextToken": "outposts-2"})
+        stubber.add_response("get_outpost_instance_types", {"InstanceTypes": instance_types("m5.large", "m5.xlarge"),
+            "NextToken": "types-2"}, {"OutpostId": "op-1", "MaxResults": 1000})
+        stubber.add_response("get_outpost_instance_types", {"InstanceTypes": instance_types("c5.large")},
+            {"OutpostId": "op-1", "MaxResults": 1000, "NextToken": "types-2"})
+        stubber.add_response("get_outpost_instance_types", {"InstanceTypes": instance_types("c5.large", "m5.large")},
+            {"OutpostId": "op-4", "MaxResults": 1000})
+        outposts = Outposts("eu-west-1", "Dashboard", ["test"], options=dict(max_workers=1), clients=clients)
+        stubber.assert_no_pending_responses()
+
+    assert [outpost["OutpostId"] for outpost in outposts.outposts] == ["op-1", "op-4"]
+    assert outposts.instance_types == {
+        "op-1": instance_types("m5.large", "m5.xlarge", "c5.large"),
+        "op-4": instance_types("c5.large", "m5.large"),
+    }
+    colors = outposts.get_colors(outposts.outposts[0])
+    assert outposts.get_colors(outposts.outposts[1]) == {name: colors[name] for name in ("c5.large", "m5.large")}
+    assert colors == {name: Outposts.get_color(name) for name in ("m5.large", "m5.xlarge", "c5.large")}
+    assert len(set(colors.values())) == 3
+    assert len(list(outposts.get_widgets())) == 6
@@ -0,0 +1,53 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+import pytest
+from omegaconf import OmegaConf
+
+from automated_cloudwatch_dashboard.automated_cloudwatch_dashboard_stack import AutomatedCloudWatchDashboardStack
+
+def synth(tmp_path, renderer: str, fleet_mode: bool, max_widgets: int):
+    conf = OmegaConf.load("tests/fixtures/config.yaml")
+    for service in ("EC2", "ELB", "S3", "AutoScaling"):
+        OmegaConf.update(conf, f"services.{service}", dict(fleet_mode=fleet_mode, top_n=5), force_add=True)
+    OmegaConf.update(conf, "sharding", dict(enabled=True, max_widgets=max_widgets), force_add=True)
+    OmegaConf.update(conf, "rendering", dict(renderer=renderer, preview_dir=str(tmp_path / "preview")), force_add=True)
+    OmegaConf.save(conf, tmp_path / f"{renderer}.yaml")
+    app = core.App(context={
+        "config": str(tmp_path / f"{renderer}.yaml"),
+        "replay": "tests/fixtures/discovery.json",
+    })
+    stack = AutomatedCloudWatchDashboardStack(app, "automated-cloudwatch-dashboard",
+        env=core.Environment(account="123456789012", region="eu-west-1"))
+    return assertions.Template.from_stack(stack).to_json()
+
+# the python renderer must synthesize the same template as the constructs,
+# in a single dashboard and sharded in several ones
+@pytest.mark.parametrize("fleet_mode", [False, True])
+@pytest.mark.parametrize("max_widgets", [100, 8])
+def test_python_renderer_matches_constructs(tmp_path, fleet_mode, max_widgets):
+    constructs = synth(tmp_path, "constructs", fleet_mode, max_widgets)
+    python = synth(tmp_path, "python", fleet_mode, max_widgets)
+
+    assert python == constructs
+    # a preview of each dashboard, in the region of the stack
+    names = [resource["Properties"]["DashboardName"] for resource in python["Resources"].values()
+        if resource["Type"] == "AWS::CloudWatch::Dashboard"]
+    previews = {path.stem: path.read_text() for path in (tmp_path / "preview").iterdir()}
+    assert sorted(previews) == sorted(names)
+    assert not any("Token[" in body or "AWS::Region" in body for body in previews.values())
@@ -0,0 +1,84 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import aws_cdk as core
+import aws_cdk.assertions as assertions
+import aws_cdk.aws_cloudwatch as cloudwatch
+
+from automated_cloudwatch_dashboard.sharding import DashboardSharder
+from automated_cloudwatch_dashboard.widgets import with_header
+
+def blocks(count: int, namespace: str):
+    widgets = []
+    for i in range(count):
+        metric = cloudwatch.Metric(namespace=namespace, metric_name="Metric", dimensions_map={"Id": str(i)})
+        widgets.append(cloudwatch.TextWidget(markdown=f"### Resource {i}", width=24, height=1))
+        widgets.append(cloudwatch.Row(cloudwatch.GraphWidget(left=[metric]), cloudwatch.GraphWidget(right=[metric])))
+    return widgets
+
+def test_widgets_within_budget_stay_in_one_dashboard():
+    stack = core.Stack(core.App(), "sharding")
+    sharder = DashboardSharder(stack, "Dashboard", max_widgets=100)
+    sharder.build([("EC2", blocks(10, "AWS/EC2")), ("S3", blocks(2, "AWS/S3"))])
+    template = assertions.Template.from_stack(stack)
+
+    template.resource_count_is("AWS::CloudWatch::Dashboard", 1)
+    template.has_resource_properties("AWS::CloudWatch::Dashboard", {"DashboardName": "Dashboard"})
+
+def test_widgets_over_budget_are_sharded_by_service():
+    stack = core.Stack(core.App(), "sharding")
+    sharder = DashboardSharder(stack, "Dashboard", max_widgets=20)
+    # 3 widgets by resource: 6 resources by shard
+    shards = sharder.plan([("EC2", blocks(20, "AWS/EC2")), ("S3", blocks(2, "AWS/S3"))])
+
+    assert [shard.name for shard in shards] == [
+        "Dashboard-EC2-1", "Dashboard-EC2-2", "Dashboard-EC2-3", "Dashboard-EC2-4", "Dashboard-S3"
+    ]
+    assert all(shard.widget_count <= 20 for shard in shards)
+    assert "(#dashboards:name=Dashboard-EC2-4)" in sharder.index_markdown(shards)
+
+    sharder.build([("EC2", blocks(20, "AWS/EC2")), ("S3", blocks(2, "AWS/S3"))])
+    template = assertions.Template.from_stack(stack)
+    # the shards and the index
+    template.resource_count_is("AWS::CloudWatch::Dashboard", 6)
+
+def test_shards_are_created_while_the_widgets_are_yielded():
+    stack = core.Stack(core.App(), "sharding")
+    sharder = DashboardSharder(stack, "Dashboard", max_widgets=20)
+    dashboards_created = []
+
+    def widgets():
+        for widget in blocks(20, "AWS/EC2"):
+            dashboards_created.append(len(stack.node.children))
+            yield widget
+
+    dashboards = sharder.build([("EC2", widgets())])
+    assert len(dashboards) == 5
+    # the first shards were created before the last widget was yielded
+    assert dashboards_created[0] == 0 and dashboards_created[-1] == 3
+
+# the account and region header of a service is kept with its first
+# resource, it is not a block, hence possibly a shard, of its own
+def test_section_header_stays_with_the_first_resource():
+    stack = core.Stack(core.App(), "sharding")
+    # a single resource by shard
+    sharder = DashboardSharder(stack, "Dashboard", max_widgets=3)
+    widgets = list(with_header("## EC2 - 123456789012 - eu-west-1", blocks(4, "AWS/EC2")))
+
+    assert [len(block) for block in sharder.split_blocks(widgets)] == [3, 2, 2, 2]
+    shards = sharder.plan([("EC2", iter(widgets))])
+    assert [shard.widget_count for shard in shards] == [4, 3, 3, 3]
+    assert shards[0].widgets[0] is widgets[0] and shards[0].widgets[1] is widgets[1]
@@ -0,0 +1,125 @@
+# ----------------------------------------------------------------------------
+# LEGAL DISCALIMER
+# ----------------------------------------------------------------------------
+# The sample code; software libraries; command line tools; proofs of concept;
+# templates; or other related technology (including any of the foregoing that
+# are provided by our personnel) is provided to you as AWS Content under the
+# AWS Customer Agreement, or the relevant written agreement between you and
+# AWS (whichever applies).You should not use this AWS Content in your 
+# production accounts, or on production or other critical data. You are 
+# responsible for testing, securing, and optimizing the AWS Content, such as
+# sample code, as appropriate for production grade use based on your specific
+# quality control practices and standards. Deploying AWS Content may incur AWS
+# charges for creating or using AWS chargeable resources, such as running 
+# Amazon EC2 instances or using Amazon S3 storage.
+# ----------------------------------------------------------------------------
+
+import json
+import subprocess
+import sys
+
+import aws_cdk as core
+from omegaconf import OmegaConf
+
+from automated_cloudwatch_dashboard.automated_cloudwatch_dashboard_stack import AutomatedCloudWatchDashboardStack
+from automated_cloudwatch_dashboard.clients import ClientFactory
+from automated_cloudwatch_dashboard.recording import Replayer
+from automated_cloudwatch_dashboard.updater import update
+
+# the updater function is packaged without aws_cdk: the dashboards are put
+# to a stand-in for CloudWatch, from the replayed discovery calls
+UPDATE = '''
+import json
+import sys
+sys.modules["aws_cdk"] = sys.modules["constructs"] = None
+from omegaconf import OmegaConf
+from automated_cloudwatch_dashboard.clients import ClientFactory
+from automated_cloudwatch_dashboard.recording import Replayer
+from automated_cloudwatch_dashboard.updater import put_dashboards, render_dashboards
+
+class CloudWatch():
+    def __init__(self):
+        self.dashboards = {}
+
+    def put_dashboard(self, DashboardName, DashboardBody):
+        self.dashboards[DashboardName] = DashboardBody
+        return dict(DashboardValidationMessages=[])
+
+clients = ClientFactory()
+Replayer("tests/fixtures/discovery.json").install(clients)
+cloudwatch = CloudWatch()
+put_dashboards(cloudwatch, render_dashboards(OmegaConf.load(sys.argv[1]), "eu-west-1", "123456789012", clients))
+print(json.dumps(cloudwatch.dashboards))
+'''
+
+# the updater puts the dashboards the stack deploys, sharded in several ones
+def test_updater_puts_the_dashboards_of_the_stack(tmp_path):
+    conf = OmegaConf.load("tests/fixtures/config.yaml")
+    OmegaConf.update(conf, "sharding", dict(enabled=True, max_widgets=8), force_add=True)
+    OmegaConf.update(conf, "rendering", dict(renderer="python", preview_dir=str(tmp_path / "preview")), force_add=True)
+    OmegaConf.save(conf, tmp_path / "config.yaml")
+    app = core.App(context={
+        "config": str(tmp_path / "config.yaml"),
+        "replay": "tests/fixtures/discovery.json",
+    })
+    AutomatedCloudWatchDashboardStack(app, "automated-cloudwatch-dashboard",
+        env=core.Environment(account="123456789012", region="eu-west-1"))
+    previews = {path.stem: path.read_text() for path in (tmp_path / "preview").iterdir()}
+
+    output = subprocess.run([sys.executable, "-c", UPDATE, str(tmp_path / "config.yaml")],
+        capture_output=True, text=True, check=True).stdout
+    dashboards = json.loads(output)
+    assert len(dashboards) > 1
+    assert dashboards == previews
+
+class CloudWatch():
+    '''Stand-in for the CloudWatch client, holding the dashboards of the account'''
+
+    def __init__(self, names: list):
+        self.dashboards = {name: "{}" for name in names}
+
+    def put_dashboard(self, DashboardName, DashboardBody):
+        self.dashboards[DashboardName] = DashboardBody
+        return dict(DashboardValidationMessages=[])
+
+    def get_paginator(self, operation):
+        return self
+
+    def paginate(self, DashboardNamePrefix):
+        yield dict(DashboardEntries=[dict(DashboardName=name) for name in sorted(self.dashboards)
+            if name.startswith(DashboardNamePrefix)])
+
+    def delete_dashboards(self, DashboardNames):
+        for name in DashboardNames:
+            del self.dashboards[name]
+
+class Clients(ClientFactory):
+    '''Replayed discovery calls, with the CloudWatch stand-in'''
+
+    def __init__(self, cloudwatch: CloudWatch):
+        super().__init__()
+        self.cloudwatch = cloudwatch
+        Replayer("tests/fixtures/discovery.json").install(self)
+
+    def client(self, service: str, region: str):
+        return self.cloudwatch if service == "cloudwatch" else super().client(service, region)
+
+# the shards of the previous layout are deleted once the new one is put,
+# the other dashboards sharing the prefix are left alone
+def test_updater_deletes_the_shards_of_the_previous_layout():
+    name = "Automated-CloudWatch-Dashboard-Test"
+    others = [f"{name}-Custom", f"{name}2-EC2"]
+    cloudwatch = CloudWatch([name, f"{name}-EC2-1", f"{name}-EC2-2", f"{name}-EC2-3"] + others)
+    conf = OmegaConf.load("tests/fixtures/config.yaml")
+
+    names, deleted = update(conf, "eu-west-1", "123456789012", Clients(cloudwatch))
+    assert names == [name]
+    assert deleted == [f"{name}-EC2-1", f"{name}-EC2-2", f"{name}-EC2-3"]
+    assert sorted(cloudwatch.dashboards) == sorted([name] + others)
+    assert cloudwatch.dashboards[name] != "{}"
+
+    # and back to shards, the index put first
+    OmegaConf.update(conf, "sharding", dict(enabled=True, max_widgets=8), force_add=True)
+    names, deleted = update(conf, "eu-west-1", "123456789012", Clients(cloudwatch))
+    assert len(names) > 1 and deleted == []
+    assert sorted(cloudwatch.dashboards) == sorted(names + others)